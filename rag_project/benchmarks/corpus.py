@@ -0,0 +1,52 @@
+import json
+import os
+import random
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "qu", "dra", "fen", "gor", "hal", "jin")
+ATTRIBUTES = ("budget", "owner", "deadline", "location", "error code", "version", "supplier", "priority")
+FACTS_FILE = "facts.jsonl"
+
+def _word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+def generate_corpus(data_dir, num_docs=200, words_per_doc=1500, facts_per_doc=3, seed=0):
+    """Write a deterministic synthetic corpus of .txt files and return the facts planted in it.
+
+    Each document is filler text from a fixed pseudo-word vocabulary with a few unique facts
+    ("The budget of project ka-lo-17 is 4211.") mixed in. Every fact comes with a question
+    and the data-dir relative path of the document that answers it, for measuring recall.
+    """
+    rng = random.Random(seed)
+    vocabulary = [_word(rng) for _ in range(5000)]
+    facts = []
+
+    for doc_index in range(num_docs):
+        rel_path = os.path.join("corpus", f"group-{doc_index % 10:02d}", f"doc-{doc_index:05d}.txt")
+        path = os.path.join(data_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        sentences = []
+        while sum(len(sentence.split()) for sentence in sentences) < words_per_doc:
+            words = rng.choices(vocabulary, k=rng.randint(8, 20))
+            sentences.append(" ".join(words).capitalize() + ".")
+
+        for fact_index in range(facts_per_doc):
+            entity = f"project {_word(rng)}-{_word(rng)}-{doc_index}-{fact_index}"
+            attribute = rng.choice(ATTRIBUTES)
+            value = f"{rng.randint(1000, 9999)}"
+            sentences.insert(rng.randrange(len(sentences) + 1), f"The {attribute} of {entity} is {value}.")
+            facts.append({
+                "question": f"What is the {attribute} of {entity}?",
+                "answer": value,
+                "source": rel_path
+            })
+
+        # Paragraphs of about five sentences, so the splitter has natural boundaries
+        paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+
+    with open(os.path.join(data_dir, FACTS_FILE), "w", encoding="utf-8") as f:
+        for fact in facts:
+            f.write(json.dumps(fact) + "\n")
+    return facts
@@ -0,0 +1,131 @@
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic stand-in for OpenAIEmbeddings.
+
+    Texts are embedded as normalized signed hashed bags of words, so texts that share words
+    are close and retrieval quality is meaningful. Every request sleeps for latency plus the
+    time the texts would take at tokens_per_second, like a remote API would.
+    """
+
+    def __init__(self, model=None, dim=384, latency=0.05, tokens_per_second=200000.0, **kwargs):
+        self.model = model
+        self.dim = dim
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _delay(self, texts):
+        tokens = sum(len(text) // 4 for text in texts)
+        return self.latency + tokens / self.tokens_per_second
+
+    def embed_documents(self, texts):
+        self.requests += 1
+        time.sleep(self._delay(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.requests += 1
+        await asyncio.sleep(self._delay(texts))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenAI.
+
+    The answer is answer_tokens words drawn from the prompt with a seed derived from it. The
+    first token arrives after latency seconds and the rest at tokens_per_second, both for
+    plain and streaming calls.
+    """
+
+    model_name: str = "fake-chat"
+    temperature: float = 0.0
+    latency: float = 0.3
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 64
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _tokens(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        words = WORD_PATTERN.findall(prompt.lower()) or ["empty"]
+        rng = random.Random(hashlib.sha1(prompt.encode("utf-8")).hexdigest())
+        return [rng.choice(words) + " " for _ in range(self.answer_tokens)]
+
+    def _result(self, tokens):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens).strip()))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        time.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return self._result(tokens)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return self._result(tokens)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in self._tokens(messages):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(messages):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+def install_fake_backends(embed_latency=0.05, embed_tokens_per_second=200000.0, embed_dim=384,
+                          llm_latency=0.3, llm_tokens_per_second=50.0, answer_tokens=64):
+    """Make the pipeline create the fake embedder and LLM instead of the OpenAI/HuggingFace clients.
+
+    Patches the names the pipeline modules construct their clients from, and clears the
+    environment variables that would select HuggingFace or sync stores to Cloud Storage.
+    """
+    import src.embedding.embedder as embedder_module
+    import src.generation.rag_generator as generator_module
+
+    for name in ("HUGGINGFACE_API_TOKEN", "STORAGE_BUCKET"):
+        os.environ.pop(name, None)
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    def make_embeddings(model=None, **kwargs):
+        return FakeEmbeddings(model=model, dim=embed_dim, latency=embed_latency,
+                              tokens_per_second=embed_tokens_per_second)
+
+    def make_chat_model(model_name="fake-chat", temperature=0.0, **kwargs):
+        return FakeChatModel(model_name=model_name, temperature=temperature, latency=llm_latency,
+                             tokens_per_second=llm_tokens_per_second, answer_tokens=answer_tokens)
+
+    embedder_module.OpenAIEmbeddings = make_embeddings
+    generator_module.ChatOpenAI = make_chat_model
@@ -0,0 +1,333 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+# Add the project root to sys.path so the src and benchmarks packages can be imported
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, project_root)
+
+from benchmarks.corpus import FACTS_FILE, generate_corpus
+from benchmarks.fakes import install_fake_backends
+
+SUITES = ("ingestion", "retrieval", "query")
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def latency_summary(seconds):
+    """Percentiles of a list of latencies, in milliseconds"""
+    if not seconds:
+        return {"count": 0}
+    latencies = np.array(seconds) * 1000
+    return {
+        "count": int(len(latencies)),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "max_ms": round(float(latencies.max()), 3)
+    }
+
+def stage_summary():
+    """Stage percentiles recorded by the pipeline's own instrumentation, in milliseconds"""
+    from src.utils.metrics import metrics
+    stages = {}
+    for stage, summary in metrics.get_metrics()["stages"].items():
+        stages[stage] = {key: round(value * 1000, 3) if key != "count" else value for key, value in summary.items()}
+    return stages
+
+def read_facts(workdir):
+    with open(os.path.join(workdir, "data", FACTS_FILE), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def install_fakes(options):
+    install_fake_backends(
+        embed_latency=options.embed_latency,
+        embed_tokens_per_second=options.embed_tokens_per_second,
+        embed_dim=options.embed_dim,
+        llm_latency=options.llm_latency,
+        llm_tokens_per_second=options.llm_tokens_per_second,
+        answer_tokens=options.answer_tokens
+    )
+
+def create_embedder(workdir, options, use_cache=True):
+    from src.embedding.embedder import EmbeddingProcessor
+    return EmbeddingProcessor(
+        use_cache=use_cache,
+        cache_path=os.path.join(workdir, "embedding_cache.sqlite"),
+        max_concurrency=options.embed_concurrency,
+        index_type=options.index_type
+    )
+
+def bench_ingestion(workdir, options):
+    """Split the corpus and embed it into a vector store, once with a cold and once with a warm embedding cache"""
+    from src.document_processing.loader import DocumentProcessor
+
+    processor = DocumentProcessor(data_dir=os.path.join(workdir, "data"), max_workers=options.workers)
+    file_paths = processor.list_files()
+    start = time.perf_counter()
+    chunks = processor.process_files(file_paths)
+    split_seconds = time.perf_counter() - start
+
+    cache_path = os.path.join(workdir, "embedding_cache.sqlite")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+
+    results = {
+        "files": len(file_paths),
+        "chunks": len(chunks),
+        "split_seconds": round(split_seconds, 3),
+        "files_per_second": round(len(file_paths) / max(split_seconds, 1e-9), 2)
+    }
+    for run in ("cold", "warm"):
+        embedder = create_embedder(workdir, options)
+        start = time.perf_counter()
+        embedder.create_vector_store(chunks, os.path.join(workdir, f"ingest_store_{run}"))
+        seconds = time.perf_counter() - start
+        results[f"embed_{run}_seconds"] = round(seconds, 3)
+        results[f"embed_{run}_chunks_per_second"] = round(len(chunks) / max(seconds, 1e-9), 2)
+        results[f"embed_{run}_requests"] = embedder.get_client_stats()["requests"]
+    return results
+
+def bench_retrieval(workdir, options):
+    """Time single and batched retrieval of the planted facts and measure recall@k of their documents"""
+    from src.document_processing.loader import DocumentProcessor, chunk_id_source
+    from src.retrieval.reranker import create_reranker
+    from src.retrieval.retriever import EnhancedRetriever
+
+    store_path = os.path.join(workdir, "retrieval_store")
+    embedder = create_embedder(workdir, options)
+    if not os.path.exists(os.path.join(store_path, "index.faiss")):
+        processor = DocumentProcessor(data_dir=os.path.join(workdir, "data"), max_workers=options.workers)
+        embedder.create_vector_store(processor.process_files(processor.list_files()), store_path)
+    vector_store = embedder.load_vector_store(store_path)
+
+    facts = read_facts(workdir)[:options.queries]
+    questions = [fact["question"] for fact in facts]
+
+    def make_retriever():
+        reranker = create_reranker(options.reranker, embeddings=vector_store.embedding_function)
+        return EnhancedRetriever(vector_store, reranker=reranker)
+
+    def recall(docs_per_query):
+        hits = sum(
+            any(chunk_id_source(doc.metadata.get("chunk_id", "")) == fact["source"] for doc in docs)
+            for fact, docs in zip(facts, docs_per_query)
+        )
+        return round(hits / max(len(facts), 1), 4)
+
+    retriever = make_retriever()
+    latencies, docs_per_query = [], []
+    start = time.perf_counter()
+    for question in questions:
+        query_start = time.perf_counter()
+        docs_per_query.append(retriever.retrieve(question, top_k=options.top_k))
+        latencies.append(time.perf_counter() - query_start)
+    sequential_seconds = time.perf_counter() - start
+
+    retriever = make_retriever()
+    start = time.perf_counter()
+    batch_docs = retriever.retrieve_batch(questions, top_k=options.top_k)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "queries": len(questions),
+        "top_k": options.top_k,
+        "reranker": options.reranker,
+        "vectors": int(vector_store.index.ntotal),
+        f"recall_at_{options.top_k}": recall(docs_per_query),
+        f"batch_recall_at_{options.top_k}": recall(batch_docs),
+        "sequential_queries_per_second": round(len(questions) / max(sequential_seconds, 1e-9), 2),
+        "batch_queries_per_second": round(len(questions) / max(batch_seconds, 1e-9), 2),
+        "latency": latency_summary(latencies),
+        "stages": stage_summary()
+    }
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _post_query(url, question, timeout):
+    request = urllib.request.Request(url, data=json.dumps({"query": question}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return time.perf_counter() - start, status
+
+def bench_query(workdir, options):
+    """Serve the API over HTTP with the fake backends and load /query at increasing concurrency"""
+    import uvicorn
+
+    # The API works relative to the current directory: ./data holds the corpus and its stores
+    os.chdir(workdir)
+    import src.api.main as api
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    # Components load in the background after the server starts; wait until the index is ready
+    while api.startup_state["status"] == "starting":
+        time.sleep(0.05)
+    if api.index_manager.current is None:
+        server.should_exit = True
+        thread.join(10)
+        raise RuntimeError(f"API failed to start: {api.startup_state['error']}")
+
+    url = f"http://127.0.0.1:{port}/query"
+    questions = [fact["question"] for fact in read_facts(workdir)]
+    levels = []
+    offset = 0
+    try:
+        for concurrency in options.concurrency:
+            # Distinct questions per level, so the retrieval caches do not flatter later levels
+            batch = [questions[(offset + i) % len(questions)] for i in range(options.requests)]
+            offset += options.requests
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(lambda question: _post_query(url, question, options.timeout), batch))
+            seconds = time.perf_counter() - start
+            ok = [latency for latency, status in results if status == 200]
+            levels.append({
+                "concurrency": concurrency,
+                "requests": len(batch),
+                "errors": len(batch) - len(ok),
+                "requests_per_second": round(len(ok) / max(seconds, 1e-9), 2),
+                "latency": latency_summary(ok)
+            })
+    finally:
+        server.should_exit = True
+        thread.join(10)
+
+    return {"startup": api.startup_state["phases"], "levels": levels, "stages": stage_summary()}
+
+SUITE_FUNCTIONS = {"ingestion": bench_ingestion, "retrieval": bench_retrieval, "query": bench_query}
+
+def run_suite(name, workdir, options):
+    """Run one suite in this (fresh) process so its peak RSS is its own"""
+    install_fakes(options)
+    start = time.perf_counter()
+    result = SUITE_FUNCTIONS[name](workdir, options)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(results, prefix=""):
+    """Flatten nested results into {"suite.metric": number} for comparisons"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "concurrency" in item:
+                    flat.update(flatten(item, f"{name}.c{item['concurrency']}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(report, baseline):
+    """Print the relative change of every metric present in both reports"""
+    current, previous = flatten(report["results"]), flatten(baseline["results"])
+    print(f"Compared with {baseline.get('commit')} ({baseline.get('timestamp')}):", file=sys.stderr)
+    for name in sorted(current.keys() & previous.keys()):
+        if previous[name]:
+            change = (current[name] - previous[name]) / abs(previous[name]) * 100
+            print(f"  {name:<60} {previous[name]:>12g} -> {current[name]:>12g}  ({change:+.1f}%)", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and /query with local fake embedder and LLM")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--workdir", help="Directory for the corpus and stores (default: a new temporary directory)")
+    parser.add_argument("--docs", type=int, default=200, help="Synthetic documents to generate")
+    parser.add_argument("--words_per_doc", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to split documents")
+    parser.add_argument("--index_type", choices=["flat", "ivf_flat", "ivf_pq", "hnsw"], default="flat")
+    parser.add_argument("--reranker", default="lexical")
+    parser.add_argument("--queries", type=int, default=200, help="Queries of the retrieval suite")
+    parser.add_argument("--top_k", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=100, help="/query requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--embed_latency", type=float, default=0.05, help="Seconds per fake embedding request")
+    parser.add_argument("--embed_tokens_per_second", type=float, default=200000.0)
+    parser.add_argument("--embed_dim", type=int, default=384)
+    parser.add_argument("--embed_concurrency", type=int, default=4)
+    parser.add_argument("--llm_latency", type=float, default=0.3, help="Seconds until the fake LLM's first token")
+    parser.add_argument("--llm_tokens_per_second", type=float, default=50.0)
+    parser.add_argument("--answer_tokens", type=int, default=64)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare the results with")
+    options = parser.parse_args()
+
+    workdir = os.path.abspath(options.workdir or tempfile.mkdtemp(prefix="rag-bench-"))
+    if not os.path.exists(os.path.join(workdir, "data", FACTS_FILE)):
+        generate_corpus(os.path.join(workdir, "data"), num_docs=options.docs,
+                        words_per_doc=options.words_per_doc, seed=options.seed)
+
+    results = {}
+    for name in options.suites:
+        print(f"Running {name} benchmark...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results[name] = executor.submit(run_suite, name, workdir, options).result()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workdir": workdir,
+        "config": {key: value for key, value in vars(options).items() if key not in ("output", "baseline")},
+        "results": results
+    }
+
+    if options.baseline:
+        with open(options.baseline, "r") as f:
+            compare(report, json.load(f))
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+logger = logging.getLogger("rag-system")
+
+class IndexHandle:
+    """Reference-counted bundle of one vector store generation and the components serving it.
+
+    Requests hold a reference for their whole lifetime. A handle that has been swapped out is
+    retired and freed by whichever release drops the last reference, so in-flight requests
+    always finish on the generation they started with.
+    """
+
+    def __init__(self, generation, store_path, vector_store, retriever, generator, on_free=None):
+        self.generation = generation
+        self.store_path = store_path
+        self.vector_store = vector_store
+        self.retriever = retriever
+        self.generator = generator
+        self.created_at = time.time()
+        self._on_free = on_free
+        self._lock = threading.Lock()
+        self._refcount = 0
+        self._retired = False
+        self._freed = False
+
+    @property
+    def refcount(self):
+        return self._refcount
+
+    def acquire(self):
+        with self._lock:
+            self._refcount += 1
+
+    def release(self):
+        with self._lock:
+            self._refcount -= 1
+            free = self._retired and self._refcount == 0
+        if free:
+            self._free()
+
+    def retire(self):
+        """Mark the handle as replaced and free it now if no request is using it"""
+        with self._lock:
+            self._retired = True
+            free = self._refcount == 0
+        if free:
+            self._free()
+
+    def _free(self):
+        with self._lock:
+            if self._freed:
+                return
+            self._freed = True
+        logger.info(f"Freeing vector store generation {self.generation}")
+        if self._on_free is not None:
+            try:
+                self._on_free(self)
+            except Exception as e:
+                logger.error(f"Error freeing generation {self.generation}: {str(e)}")
+        self.vector_store = self.retriever = self.generator = None
+
+class IndexManager:
+    """Holds the serving IndexHandle and swaps it atomically"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = None
+        self._draining = set()
+
+    @property
+    def current(self):
+        """The serving handle, without taking a reference (for metrics and maintenance only)"""
+        return self._current
+
+    @contextmanager
+    def acquire(self):
+        """Yield the serving handle (or None) with a reference held until the block exits"""
+        with self._lock:
+            handle = self._current
+            if handle is not None:
+                handle.acquire()
+        try:
+            yield handle
+        finally:
+            if handle is not None:
+                handle.release()
+
+    def swap(self, handle):
+        """Serve new requests from handle; the old handle drains and is freed after its last request"""
+        with self._lock:
+            old = self._current
+            self._current = handle
+            if old is not None:
+                self._draining.add(old)
+        if old is not None:
+            logger.info(f"Swapped vector store generation {old.generation} -> {handle.generation} "
+                        f"({old.refcount} requests draining)")
+            old.retire()
+        return old
+
+    def get_status(self):
+        """Describe the serving generation and the generations still draining"""
+        with self._lock:
+            self._draining = {handle for handle in self._draining if handle.refcount > 0}
+            current, draining = self._current, list(self._draining)
+        return {
+            "current_generation": current.generation if current else None,
+            "current_refcount": current.refcount if current else 0,
+            "draining": [{"generation": handle.generation, "refcount": handle.refcount} for handle in draining]
+        }
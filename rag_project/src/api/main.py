@@ -2,6 +2,11 @@ import os
 import sys
 import time
 import json
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
 
 # Add the project root to sys.path
@@ -9,225 +14,533 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.abspath(os.path.join(current_dir, '../..'))
 sys.path.insert(0, project_root)
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
-import uvicorn
+from typing import List, Optional
 
-from src.embedding.embedder import EmbeddingProcessor
-from src.retrieval.retriever import EnhancedRetriever
-from src.generation.rag_generator import RAGGenerator
-from src.document_processing.loader import DocumentProcessor
-from src.utils.logging_utils import setup_logger, MetricsTracker
+# Modules that pull in langchain, FAISS and the model clients are imported by the functions that
+# need them, after startup, so the server accepts health probes before they have loaded
+from src.embedding.generations import BUILD_STATUS_FILE, BuildProgress, GenerationStore
+from src.api.index_manager import IndexHandle, IndexManager
+from src.document_processing.registry import DocumentRegistry
+from src.document_processing.watcher import DocumentWatcher
+from src.utils.logging_utils import setup_logger
+from src.utils.metrics import current_request_timings, format_server_timing, metrics, request_timings, span
 from src.utils.config import get_settings
 
 # Get settings and initialize logger and metrics
 settings = get_settings()
 logger = setup_logger()
-metrics = MetricsTracker()
+if settings.OTEL_TRACING and not metrics.enable_tracing():
+    logger.warning("OTEL_TRACING is set but opentelemetry is not installed; stage spans are not exported")
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start loading the RAG components in the background, so the server is live right away"""
+    app.state.startup_task = asyncio.create_task(asyncio.to_thread(run_startup))
+    yield
+    if watcher is not None:
+        watcher.stop()
 
 # Initialize FastAPI app
-app = FastAPI(title="RAG API", description="Retrieval-Augmented Generation API")
+app = FastAPI(title="RAG API", description="Retrieval-Augmented Generation API", lifespan=lifespan)
 
 # Define global variables
 embedder = None
-vector_store = None
-retriever = None
-generator = None
+watcher = None
 data_dir = "./data"
-registry_path = os.path.join(data_dir, "document_registry.json")
+# Transactional document registry; a document_registry.json from earlier versions is imported once
+registry = DocumentRegistry(os.path.join(data_dir, "document_registry.sqlite"), data_dir,
+                            legacy_json_path=os.path.join(data_dir, "document_registry.json"))
+vector_store_root = os.path.join(data_dir, "vector_store")
+
+# Versioned store generations and the reference-counted handle of the one being served
+generations = GenerationStore(vector_store_root)
+index_manager = IndexManager()
+build_progress = BuildProgress(os.path.join(vector_store_root, BUILD_STATUS_FILE))
+# Reentrant so an incremental refresh can fall back to a full rebuild
+refresh_lock = threading.RLock()
+# Held from the moment /refresh accepts a refresh until its background task holds refresh_lock
+refresh_pending = threading.Lock()
+
+# Progress of the background startup, reported by /ready
+startup_state = {"status": "starting", "phases": {}, "error": None, "started_at": None, "ready_at": None}
+
+# Bound the number of in-flight embedding/LLM calls across all concurrent queries
+upstream_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_UPSTREAM_CALLS)
+DISCONNECT_POLL_INTERVAL = 0.5
+# Responses whose body is produced after the headers are sent; their timings go in the final record
+STREAMED_MEDIA_TYPES = ("text/event-stream", "application/x-ndjson")
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Count requests per route and status and report the stage durations in a Server-Timing header.
+    
+    Streamed responses get no header: it is sent before the stages of the body have run.
+    """
+    with request_timings() as stages:
+        start = time.perf_counter()
+        response = await call_next(request)
+        stages["total"] = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.inc("rag_http_requests_total", route=route.path if route is not None else "unmatched",
+                status=response.status_code)
+    if not response.headers.get("content-type", "").startswith(STREAMED_MEDIA_TYPES):
+        response.headers["Server-Timing"] = format_server_timing(stages)
+    return response
 
 # Mount static files
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
-def load_document_registry():
-    """Load the document registry from file or create a new one"""
-    if os.path.exists(registry_path):
-        try:
-            with open(registry_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading document registry: {str(e)}")
-    
-    # Create default registry
-    registry = {
-        "files": {},
-        "last_update": datetime.now().isoformat(),
-        "vector_store_status": "unknown"
+def processor_options():
+    """Keyword arguments of the document processor configured by the settings"""
+    return {"data_dir": data_dir, "max_workers": settings.INGEST_WORKERS}
+
+def create_document_processor():
+    """Create the document processor configured by the settings"""
+    from src.document_processing.loader import DocumentProcessor
+    
+    return DocumentProcessor(**processor_options())
+
+def embedder_options():
+    """Keyword arguments of the embedding processor configured by the settings"""
+    return {
+        "use_cache": settings.EMBEDDING_CACHE_ENABLED,
+        "cache_path": settings.EMBEDDING_CACHE_PATH,
+        "cache_max_entries": settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        "batch_max_tokens": settings.EMBEDDING_BATCH_MAX_TOKENS,
+        "max_concurrency": settings.EMBEDDING_CONCURRENCY,
+        "max_retries": settings.EMBEDDING_MAX_RETRIES,
+        "storage_format": settings.VECTOR_STORE_FORMAT,
+        "use_mmap": settings.VECTOR_STORE_MMAP,
+        "index_type": settings.VECTOR_INDEX_TYPE,
+        "index_options": {"nlist": settings.IVF_NLIST, "pq_m": settings.PQ_M, "hnsw_m": settings.HNSW_M},
+        "quantization": settings.VECTOR_QUANTIZATION,
+        "rescore_factor": settings.QUANTIZATION_RESCORE_FACTOR or None,
+        "build_sparse_index": settings.HYBRID_SEARCH
     }
-    return registry
 
-def save_document_registry(registry):
-    """Save the document registry to file"""
-    os.makedirs(os.path.dirname(registry_path), exist_ok=True)
+def create_embedder():
+    """Create the embedding processor configured by the settings"""
+    from src.embedding.embedder import EmbeddingProcessor
+    
+    return EmbeddingProcessor(**embedder_options())
+
+def get_embedder():
+    """Return the shared embedding processor, creating it on first use"""
+    global embedder
+    if embedder is None:
+        embedder = create_embedder()
+    return embedder
+
+def load_sparse_index(store, store_path):
+    """Load the BM25 index of a vector store when hybrid search is enabled"""
+    if not settings.HYBRID_SEARCH:
+        return None
+    return get_embedder().load_sparse_index(store, store_path)
+
+def create_retriever(store, store_path, reranker=None):
+    """Create the retriever configured by the settings, reusing a reranker if one is given"""
+    from src.retrieval.reranker import create_reranker
+    from src.retrieval.retriever import EnhancedRetriever
+    
+    if reranker is None:
+        reranker = create_reranker("llm" if settings.USE_COMPRESSION else settings.RERANKER,
+                                   embeddings=store.embedding_function)
+    return EnhancedRetriever(
+        store,
+        reranker=reranker,
+        rerank_fetch_k=settings.RERANK_FETCH_K,
+        context_token_budget=settings.CONTEXT_TOKEN_BUDGET,
+        cache_size=settings.QUERY_CACHE_SIZE,
+        cache_ttl=settings.QUERY_CACHE_TTL_SECONDS,
+        nprobe=settings.SEARCH_NPROBE,
+        ef_search=settings.SEARCH_EF,
+        sparse_index=load_sparse_index(store, store_path),
+        dense_weight=settings.HYBRID_DENSE_WEIGHT,
+        sparse_weight=settings.HYBRID_SPARSE_WEIGHT,
+        rrf_k=settings.HYBRID_RRF_K,
+        hybrid_fetch_k=settings.HYBRID_FETCH_K
+    )
+
+def create_generator(rag_retriever, answer_cache=None):
+    """Create the answer generator, with a semantic answer cache when enabled in the settings"""
+    from src.generation.answer_cache import SemanticAnswerCache
+    from src.generation.context_packing import ContextPacker
+    from src.generation.rag_generator import RAGGenerator
+    
+    if answer_cache is None and settings.ANSWER_CACHE_ENABLED:
+        answer_cache = SemanticAnswerCache(
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl=settings.ANSWER_CACHE_TTL_SECONDS
+        )
+    context_packer = None
+    if settings.CONTEXT_PACKING:
+        context_packer = ContextPacker(
+            max_tokens=settings.CONTEXT_WINDOW_TOKENS - settings.MAX_TOKENS,
+            model_name=settings.MODEL_NAME,
+            duplicate_threshold=settings.CONTEXT_DUPLICATE_THRESHOLD,
+            mmr_lambda=settings.CONTEXT_MMR_LAMBDA
+        )
+    return RAGGenerator(rag_retriever, model_name=settings.MODEL_NAME, answer_cache=answer_cache,
+                        context_packer=context_packer, max_tokens=settings.MAX_TOKENS)
+
+def apply_search_filters(rag_retriever):
+    """Apply the deleted flags and tags of the registry to searches, without touching the index"""
+    rag_retriever.set_source_filters(registry.paths(deleted=True), registry.tags_by_path())
+
+def sync_search_filters():
+    """Apply the registry to the serving generation"""
+    handle = index_manager.current
+    if handle is not None and handle.retriever is not None:
+        apply_search_filters(handle.retriever)
+
+def free_generation(handle):
+    """Release a drained generation and delete its directory"""
+    if handle.retriever is not None:
+        handle.retriever.close()
+    generations.remove(handle.store_path)
+
+def create_handle(store, store_path, previous=None, answer_cache=None):
+    """Build the serving components of a store generation.
+    
+    The reranker of the previous generation is reused, since loading it can be expensive.
+    """
+    reranker = previous.retriever.reranker if previous is not None and previous.retriever is not None else None
+    rag_retriever = create_retriever(store, store_path, reranker)
+    apply_search_filters(rag_retriever)
+    rag_generator = create_generator(rag_retriever, answer_cache)
+    generation = os.path.basename(os.path.normpath(store_path)) if generations.current_generation() else "legacy"
+    return IndexHandle(generation, store_path, store, rag_retriever, rag_generator, on_free=free_generation)
+
+def build_vector_store(active_files, store_path):
+    """Ingest the given registry paths into a new vector store at store_path.
+    
+    With REBUILD_IN_SUBPROCESS the build runs in a separate process, so it does not compete
+    with query serving for this process, and the finished store is opened from disk.
+    Returns the vector store (None when nothing could be ingested), the chunk IDs of
+    each file and the set of files that failed to ingest.
+    """
+    from src.embedding.generations import build_generation, build_store
+    
+    file_paths = [os.path.join(data_dir, path) for path in active_files]
+    
+    if settings.REBUILD_IN_SUBPROCESS:
+        # Spawn instead of forking this multi-threaded process, whose locks and SQLite connections
+        # could be held by another thread at fork time and would then never be released in the child
+        # The child starts with a fresh embedder, so hand it the rescore factor of the served store
+        options = embedder_options()
+        options["rescore_factor"] = options["rescore_factor"] or get_embedder().recorded_rescore_factor
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            built, chunk_ids_by_file, failed_files = executor.submit(
+                build_generation, store_path, file_paths, options, processor_options(),
+                settings.STREAMING_INGEST, settings.INGEST_BATCH_SIZE, build_progress.path, dict(build_progress.state)
+            ).result()
+        # Carry the counters the child wrote (files, chunks) over into this process's progress
+        build_progress.update(**BuildProgress.read(build_progress.path))
+        new_vector_store = get_embedder().load_vector_store(store_path) if built else None
+        return new_vector_store, chunk_ids_by_file, failed_files
+    
+    return build_store(get_embedder(), create_document_processor(), file_paths, store_path,
+                       streaming=settings.STREAMING_INGEST, batch_size=settings.INGEST_BATCH_SIZE,
+                       progress=build_progress)
+
+@contextmanager
+def startup_phase(name):
+    """Record how long one phase of startup took"""
+    start = time.perf_counter()
     try:
-        with open(registry_path, 'w') as f:
-            json.dump(registry, f, indent=2)
-    except Exception as e:
-        logger.error(f"Error saving document registry: {str(e)}")
-
-def scan_document_directory():
-    """Scan the document directory and update the registry"""
-    registry = load_document_registry()
-    registry_files = registry.get("files", {})
-    
-    # Track current files
-    current_files = set()
-    
-    # Scan directory for PDF and TXT files
-    for root, _, files in os.walk(data_dir):
-        for file in files:
-            if file.lower().endswith(('.pdf', '.txt')):
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, data_dir)
-                current_files.add(rel_path)
-                
-                # Get file stats
-                last_modified = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
-                file_size = os.path.getsize(file_path)
-                
-                # Check if file is new or modified
-                if rel_path not in registry_files:
-                    registry_files[rel_path] = {
-                        "last_modified": last_modified,
-                        "file_size": file_size,
-                        "status": "new",
-                        "chunks": 0,
-                        "last_processed": None,
-                        "deleted": False
-                    }
-                elif (registry_files[rel_path]["last_modified"] != last_modified or 
-                      registry_files[rel_path]["file_size"] != file_size):
-                    registry_files[rel_path]["last_modified"] = last_modified
-                    registry_files[rel_path]["file_size"] = file_size
-                    registry_files[rel_path]["status"] = "modified"
-    
-    # Mark missing files as deleted
-    for file_path in list(registry_files.keys()):
-        if file_path not in current_files:
-            registry_files[file_path]["deleted"] = True
-    
-    # Update registry
-    registry["files"] = registry_files
-    registry["last_update"] = datetime.now().isoformat()
-    save_document_registry(registry)
-    
-    return registry
+        yield
+    finally:
+        startup_state["phases"][name] = round(time.perf_counter() - start, 3)
+
+def import_components():
+    """Import the modules that pull in langchain, FAISS and the model clients"""
+    import src.document_processing.loader
+    import src.embedding.embedder
+    import src.generation.rag_generator
+    import src.retrieval.retriever
 
 def initialize_rag_components():
     """Initialize the RAG components"""
-    global embedder, vector_store, retriever, generator
-    
     try:
         # Scan document directory and update registry
-        registry = scan_document_directory()
-        
-        # Initialize embedder
-        if embedder is None:
-            embedder = EmbeddingProcessor()
+        with startup_phase("registry_scan"):
+            registry.scan()
         
-        # Try to load existing vector store
-        vector_store = embedder.load_vector_store(allow_dangerous_deserialization=True)
+        # Try to load the published vector store generation
+        store_path = generations.current_path()
+        with startup_phase("load_index"):
+            vector_store = get_embedder().load_vector_store(store_path, allow_dangerous_deserialization=True)
         
         # If no vector store exists, create one
         if not vector_store:
             logger.info("No vector store found. Creating one from documents...")
-            doc_processor = DocumentProcessor()
-            chunks = doc_processor.process()
-            
-            if chunks and len(chunks) > 0:
-                vector_store = embedder.create_vector_store(chunks)
-                
-                # Update registry with processed files
-                for file_path, file_info in registry["files"].items():
-                    if not file_info["deleted"]:
-                        file_info["status"] = "processed"
-                        file_info["last_processed"] = datetime.now().isoformat()
-                
-                registry["vector_store_status"] = "up_to_date"
-                save_document_registry(registry)
-                
-                logger.info(f"Vector store created successfully with {len(chunks)} chunks")
+            with startup_phase("build_index"):
+                result = rebuild_vector_store()
+            if result["status"] != "success":
+                startup_state["error"] = result["message"]
+            return result["status"] == "success"
         
-        # Initialize retriever and generator if we have a vector store
-        if vector_store:
-            # Check if we need to filter deleted documents
-            deleted_docs = [path for path, info in registry.get("files", {}).items() 
-                           if info.get("deleted", False)]
-            
-            # Create retriever with metadata filter to exclude deleted documents
-            retriever = EnhancedRetriever(vector_store, use_compression=settings.USE_COMPRESSION)
-            generator = RAGGenerator(retriever, model_name=settings.MODEL_NAME)
-            logger.info("RAG components initialized successfully")
-            return True
-        return False
+        # The retriever excludes the chunks of deleted documents at search time
+        with startup_phase("create_components"):
+            index_manager.swap(create_handle(vector_store, store_path))
+        logger.info("RAG components initialized successfully")
+        return True
 
     except Exception as e:
         logger.error(f"Error during initialization: {str(e)}")
+        startup_state["error"] = str(e)
         return False
 
 def rebuild_vector_store():
-    """Rebuild the vector store from non-deleted documents"""
-    global embedder, vector_store, retriever, generator
+    """Rebuild the vector store from non-deleted documents into a new generation and swap it in"""
+    if not refresh_lock.acquire(blocking=False):
+        logger.info("A refresh is already running")
+        return {"status": "error", "message": "A refresh is already running"}
     
+    store_path = None
     try:
-        registry = load_document_registry()
+        start = time.time()
+        
+        # Process only non-deleted documents, building next to the generation that keeps serving
+        active_files = registry.active_paths()
+        # What the registry knew about each file before the build read it, see mark_processed
+        content_hashes = registry.content_hashes(active_files)
+        store_path = generations.new_generation_path(resume=settings.STREAMING_INGEST)
+        build_progress.update(force=True, state="building", mode="full", generation=os.path.basename(store_path),
+                              started_at=datetime.now().isoformat(), finished_at=None, error=None)
         
-        # Process only non-deleted documents
-        doc_processor = DocumentProcessor()
-        chunks = doc_processor.process()
+        new_vector_store, chunk_ids_by_file, failed_files = build_vector_store(active_files, store_path)
+        active_files = [path for path in active_files if path not in failed_files]
         
-        if not chunks or len(chunks) == 0:
+        if new_vector_store is None:
             logger.warning("No documents found to process")
+            generations.remove(store_path)
+            build_progress.update(state="failed", phase="done", error="No documents found to process",
+                                  finished_at=datetime.now().isoformat())
             return {"status": "error", "message": "No documents found to process"}
         
-        # Create a new embedder if needed
-        if embedder is None:
-            embedder = EmbeddingProcessor()
-        
-        # Create vector store
-        vector_store = embedder.create_vector_store(chunks)
-        
-        # Reinitialize retriever and generator
-        retriever = EnhancedRetriever(vector_store, use_compression=settings.USE_COMPRESSION)
-        generator = RAGGenerator(retriever, model_name=settings.MODEL_NAME)
+        chunk_count = sum(len(chunk_ids) for chunk_ids in chunk_ids_by_file.values())
         
         # Update registry
-        for file_path, file_info in registry["files"].items():
-            if not file_info["deleted"]:
-                file_info["status"] = "processed"
-                file_info["last_processed"] = datetime.now().isoformat()
+        registry.mark_processed(active_files, chunk_ids_by_file, content_hashes)
+        registry.clear_deleted_chunks()
         
-        registry["vector_store_status"] = "up_to_date"
-        registry["last_update"] = datetime.now().isoformat()
-        save_document_registry(registry)
+        # Publish the generation, then swap it in; the old one is freed once its last query finishes
+        build_progress.update(phase="swapping")
+        generations.publish(store_path)
+        index_manager.swap(create_handle(new_vector_store, store_path))
+        # Documents marked deleted during the build were only applied to the old generation
+        sync_search_filters()
+        registry.set_vector_store_status("up_to_date")
         
-        logger.info(f"Vector store rebuilt successfully with {len(chunks)} chunks")
-        return {"status": "success", "message": f"Vector store rebuilt with {len(chunks)} chunks"}
+        build_progress.update(state="idle", phase="done", chunks=chunk_count, seconds=time.time() - start,
+                              finished_at=datetime.now().isoformat())
+        logger.info(f"Vector store rebuilt successfully with {chunk_count} chunks")
+        return {"status": "success", "message": f"Vector store rebuilt with {chunk_count} chunks"}
     
     except Exception as e:
         logger.error(f"Error rebuilding vector store: {str(e)}")
+        build_progress.update(state="failed", phase="done", error=str(e), finished_at=datetime.now().isoformat())
+        # Keep a streaming build's checkpointed generation so the next rebuild can resume it;
+        # one that failed before its first checkpoint could never be resumed
+        if store_path and not (settings.STREAMING_INGEST and generations.is_resumable(store_path)):
+            generations.remove(store_path)
         return {"status": "error", "message": f"Error rebuilding vector store: {str(e)}"}
+    finally:
+        refresh_lock.release()
 
-# Initialize RAG components on startup
-initialize_rag_components()
+def incremental_update_vector_store():
+    """Embed only new or modified documents and remove the chunks of modified or deleted ones.
+    
+    The update is applied to a copy of the serving generation, which is then swapped in.
+    """
+    if not refresh_lock.acquire(blocking=False):
+        return {"status": "error", "message": "A refresh is already running"}
+    
+    from src.embedding.generations import group_chunk_ids, report_ingestion
+    
+    store_path = None
+    try:
+        start = time.time()
+        registry.scan()
+        current = index_manager.current
+        
+        # Chunks of files processed before chunk IDs were tracked cannot be removed selectively
+        if current is None or registry.untracked_paths():
+            logger.info("Vector store is missing or has untracked chunks. Falling back to a full rebuild")
+            return rebuild_vector_store()
+        
+        # ANN indexes cannot drop vectors in place; rebuilding is cheap since unchanged chunks hit the embedding cache
+        if not get_embedder().supports_incremental_update(current.vector_store):
+            logger.info("Index type does not support in-place removal. Falling back to a full rebuild")
+            return rebuild_vector_store()
+        
+        changed_files = registry.changed_paths()
+        content_hashes = registry.content_hashes(changed_files)
+        removed_files = registry.removed_paths()
+        remove_ids = registry.get_chunk_ids(changed_files + removed_files)
+        
+        if not changed_files and not remove_ids:
+            logger.info("Vector store is already up to date")
+            return {"status": "success", "message": "Vector store is already up to date"}
+        
+        build_progress.update(force=True, state="building", mode="incremental", phase="loading",
+                              files_total=len(changed_files), files_done=0, chunks=0, error=None,
+                              started_at=datetime.now().isoformat(), finished_at=None)
+        
+        # Load and split only the files that changed
+        doc_processor = create_document_processor()
+        chunks = []
+        if changed_files:
+            chunks = doc_processor.process_files(
+                [os.path.join(data_dir, path) for path in changed_files],
+                progress_callback=lambda done, total: build_progress.update(files_done=done)
+            )
+            failed_files = report_ingestion(doc_processor)
+            changed_files = [path for path in changed_files if path not in failed_files]
+        
+        # Update a copy of the serving generation, so in-flight queries never see a half-updated index
+        build_progress.update(phase="embedding", chunks=len(chunks))
+        store_path = generations.copy_current()
+        build_progress.update(generation=os.path.basename(store_path))
+        new_vector_store = get_embedder().load_vector_store(store_path, writable=True)
+        new_vector_store = get_embedder().update_vector_store(new_vector_store, chunks, remove_ids=remove_ids,
+                                                              store_path=store_path)
+        
+        # Update registry
+        registry.mark_processed(changed_files, group_chunk_ids(chunks), content_hashes)
+        registry.clear_chunks(removed_files)
+        
+        # Keep the answers that do not depend on removed chunks
+        answer_cache = current.generator.answer_cache if current.generator is not None else None
+        if answer_cache is not None:
+            answer_cache.invalidate_chunks(remove_ids)
+        
+        build_progress.update(phase="swapping")
+        generations.publish(store_path)
+        index_manager.swap(create_handle(new_vector_store, store_path, previous=current, answer_cache=answer_cache))
+        sync_search_filters()
+        registry.set_vector_store_status("up_to_date")
+        
+        message = (f"Vector store updated: {len(changed_files)} files embedded ({len(chunks)} chunks), "
+                   f"{len(remove_ids)} stale chunks removed")
+        build_progress.update(state="idle", phase="done", seconds=time.time() - start,
+                              finished_at=datetime.now().isoformat())
+        logger.info(message)
+        return {"status": "success", "message": message}
+    
+    except Exception as e:
+        logger.error(f"Error updating vector store: {str(e)}")
+        build_progress.update(state="failed", phase="done", error=str(e), finished_at=datetime.now().isoformat())
+        if store_path:
+            generations.remove(store_path)
+        return {"status": "error", "message": f"Error updating vector store: {str(e)}"}
+    finally:
+        refresh_lock.release()
+
+def run_watch_job(paths):
+    """Ingest a batch of changes detected by the document watcher.
+    
+    The paths are only reported: the registry scan of incremental_update_vector_store finds the
+    same changes (and any the watcher missed). Indexes that cannot drop vectors in place (IVF,
+    HNSW) fall back to a full rebuild there, so with those every batch rebuilds the store; the
+    embedding cache keeps that to re-splitting and re-indexing, but WATCH_MAX_DELAY_SECONDS
+    should then be large enough to batch many changes into one rebuild.
+    """
+    # Leave the batch queued while a manual refresh is running instead of failing it
+    if not refresh_lock.acquire(blocking=False):
+        return {"status": "busy", "message": "A refresh is already running"}
+    try:
+        logger.info(f"Watcher detected {len(paths)} changed documents")
+        result = incremental_update_vector_store()
+        sync_search_filters()
+        return result
+    finally:
+        refresh_lock.release()
+
+def create_watcher():
+    return DocumentWatcher(
+        data_dir,
+        run_watch_job,
+        debounce_seconds=settings.WATCH_DEBOUNCE_SECONDS,
+        max_delay_seconds=settings.WATCH_MAX_DELAY_SECONDS,
+        poll_interval=settings.WATCH_POLL_INTERVAL_SECONDS,
+        queue_size=settings.WATCH_QUEUE_SIZE,
+        # The store is written below the data directory; its files are never documents
+        exclude_dirs=[vector_store_root]
+    )
+
+def run_startup():
+    """Import the heavy modules, load (or build) the index and start the watcher, timing each phase"""
+    global watcher
+    start = time.perf_counter()
+    startup_state["started_at"] = datetime.now().isoformat()
+    try:
+        with startup_phase("imports"):
+            import_components()
+        ready = initialize_rag_components()
+        
+        # Continuously ingest document changes instead of waiting for /scan and /refresh
+        if settings.WATCH_DOCUMENTS:
+            with startup_phase("watcher"):
+                current = index_manager.current
+                if current is not None and not get_embedder().supports_incremental_update(current.vector_store):
+                    logger.warning("The index type does not support incremental updates, "
+                                   "every batch of document changes will rebuild the vector store")
+                watcher = create_watcher()
+                watcher.start()
+    except Exception as e:
+        logger.error(f"Error during startup: {str(e)}")
+        startup_state["error"] = str(e)
+        ready = False
+    
+    startup_state["status"] = "ready" if ready else "failed"
+    startup_state["total_seconds"] = round(time.perf_counter() - start, 3)
+    if ready:
+        startup_state["ready_at"] = datetime.now().isoformat()
+    logger.info(f"Startup {startup_state['status']} in {startup_state['total_seconds']:.2f}s: {startup_state['phases']}")
 
 # Define API models
 class QueryRequest(BaseModel):
     query: str
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    dense_weight: Optional[float] = None
+    sparse_weight: Optional[float] = None
+    sources: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    dense_weight: Optional[float] = None
+    sparse_weight: Optional[float] = None
+    sources: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
 
 class QueryResponse(BaseModel):
     answer: str
     processing_time: float = None
+    cached: bool = False
 
 class DocumentStatus(BaseModel):
     path: str
     status: str = "active"
 
+class DocumentTags(BaseModel):
+    path: str
+    tags: List[str] = []
+
 # Define API endpoints
 @app.get("/")
 def read_root():
@@ -235,81 +548,329 @@ def read_root():
         return FileResponse(os.path.join(static_dir, "index.html"))
     return {"message": "Welcome to the RAG API"}
 
-@app.post("/query", response_model=QueryResponse)
-def query(request: QueryRequest):
-    global retriever, generator
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before its query has been answered"""
+
+async def run_until_disconnected(http_request, coroutine):
+    """Run a coroutine, cancelling it as soon as the client disconnects"""
+    task = asyncio.ensure_future(coroutine)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+def get_search_kwargs(request):
+    """Return the per-request ANN search parameters, hybrid fusion weights and source filters of a query"""
+    search_kwargs = {}
+    for name in ("nprobe", "ef_search", "dense_weight", "sparse_weight", "sources", "tags"):
+        value = getattr(request, name)
+        if value is not None:
+            search_kwargs[name] = value
+    return search_kwargs
+
+async def answer_query(query_text, rag_retriever, rag_generator, search_kwargs=None):
+    """Retrieve documents once and generate an answer from them without blocking the event loop"""
+    overall_start_time = time.time()
+    
+    # Time the retrieval phase
+    retrieval_start = time.time()
+    async with upstream_semaphore:
+        docs = await rag_retriever.aretrieve(query_text, top_k=settings.RETRIEVAL_TOP_K, search_kwargs=search_kwargs)
+    retrieval_time = time.time() - retrieval_start
+    metrics.observe("retrieval", retrieval_time)
+    logger.info(f"Retrieval took {retrieval_time:.2f} seconds, found {len(docs)} documents")
+    
+    # Time the generation phase, reusing the retrieved documents
+    generation_start = time.time()
+    answer = await rag_generator.aget_cached_answer(query_text, docs)
+    cached = answer is not None
+    if not cached:
+        async with upstream_semaphore:
+            answer = await rag_generator.agenerate_answer_from_docs(query_text, docs, check_cache=False)
+    generation_time = time.time() - generation_start
+    metrics.observe("generation", generation_time)
+    logger.info(f"Generation took {generation_time:.2f} seconds")
     
+    # Overall processing time
+    processing_time = time.time() - overall_start_time
+    overhead_time = processing_time - retrieval_time - generation_time
+    
+    # Log detailed timing information
+    logger.info(f"Total processing time: {processing_time:.2f} seconds")
+    logger.info(f"Retrieval: {retrieval_time:.2f}s ({(retrieval_time/processing_time)*100:.1f}% of total)")
+    logger.info(f"Generation: {generation_time:.2f}s ({(generation_time/processing_time)*100:.1f}% of total)")
+    logger.info(f"Overhead: {overhead_time:.2f}s ({(overhead_time/processing_time)*100:.1f}% of total)")
+    
+    # Track metrics
+    metrics.track_query(query_text, processing_time, len(docs), cached=cached)
+    
+    return QueryResponse(answer=answer, processing_time=processing_time, cached=cached)
+
+@app.post("/query", response_model=QueryResponse)
+async def query(request: QueryRequest, http_request: Request):
     if not request.query or len(request.query.strip()) == 0:
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
-    if retriever is None or generator is None:
-        raise HTTPException(status_code=503, detail="RAG system is not initialized. Check logs for details.")
-    
+    # Hold a reference to the serving generation so a concurrent refresh cannot free it mid-request
+    with index_manager.acquire() as handle:
+        if handle is None:
+            raise HTTPException(status_code=503, detail="RAG system is not initialized. Check logs for details.")
+        return await run_query(request, http_request, handle)
+
+async def run_query(request, http_request, handle):
+    """Answer a query on one generation, mapping timeouts, disconnects and failures to HTTP errors"""
     try:
         logger.info(f"Received query: {request.query}")
-        overall_start_time = time.time()
-        
-        # Time the retrieval phase
-        retrieval_start = time.time()
-        docs = retriever.retrieve(request.query, top_k=settings.RETRIEVAL_TOP_K)
-        retrieval_end = time.time()
-        retrieval_time = retrieval_end - retrieval_start
-        logger.info(f"Retrieval took {retrieval_time:.2f} seconds, found {len(docs)} documents")
-        
-        # Time the generation phase
-        generation_start = time.time()
-        answer = generator.generate_answer(request.query)
-        generation_end = time.time()
-        generation_time = generation_end - generation_start
-        logger.info(f"Generation took {generation_time:.2f} seconds")
-        
-        # Overall processing time
-        overall_end_time = time.time()
-        processing_time = overall_end_time - overall_start_time
-        
-        # Log detailed timing information
-        logger.info(f"Total processing time: {processing_time:.2f} seconds")
-        logger.info(f"Retrieval: {retrieval_time:.2f}s ({(retrieval_time/processing_time)*100:.1f}% of total)")
-        logger.info(f"Generation: {generation_time:.2f}s ({(generation_time/processing_time)*100:.1f}% of total)")
-        logger.info(f"Overhead: {(processing_time - retrieval_time - generation_time):.2f}s ({((processing_time - retrieval_time - generation_time)/processing_time)*100:.1f}% of total)")
-        
-        # Track metrics
-        metrics.track_query(request.query, processing_time, len(docs))
-        
-        return QueryResponse(answer=answer, processing_time=processing_time)
+        response = await asyncio.wait_for(
+            run_until_disconnected(http_request, answer_query(request.query, handle.retriever, handle.generator, get_search_kwargs(request))),
+            timeout=settings.QUERY_TIMEOUT_SECONDS
+        )
+        with span("serialization"):
+            return JSONResponse(jsonable_encoder(response))
+    except asyncio.TimeoutError:
+        metrics.inc("rag_query_errors_total", reason="timeout")
+        logger.error(f"Query timed out after {settings.QUERY_TIMEOUT_SECONDS} seconds")
+        raise HTTPException(status_code=504, detail=f"Query timed out after {settings.QUERY_TIMEOUT_SECONDS} seconds")
+    except ClientDisconnected:
+        metrics.inc("rag_query_errors_total", reason="disconnected")
+        logger.info("Client disconnected, query cancelled")
+        raise HTTPException(status_code=499, detail="Client closed request")
     except Exception as e:
+        metrics.inc("rag_query_errors_total", reason="error")
         logger.error(f"Error generating answer: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating answer: {str(e)}")
 
+def format_sse(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    with span("serialization"):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def describe_sources(docs):
+    """Return the metadata of retrieved documents that is sent to clients"""
+    return [{
+        "source": doc.metadata.get("source"),
+        "page": doc.metadata.get("page"),
+        "chunk_id": doc.metadata.get("chunk_id"),
+        "score": doc.metadata.get("score")
+    } for doc in docs]
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """Stream the answer as Server-Sent Events: sources first, then tokens, then timings"""
+    if not request.query or len(request.query.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    if index_manager.current is None:
+        raise HTTPException(status_code=503, detail="RAG system is not initialized. Check logs for details.")
+    
+    logger.info(f"Received streaming query: {request.query}")
+    
+    async def event_stream():
+        # Runs after the response headers are sent; its stages are reported in the "done" event
+        stages = current_request_timings()
+        # The generation is held until the stream ends, even if a refresh swaps in a new one meanwhile
+        with index_manager.acquire() as handle:
+            if handle is None:
+                yield format_sse("error", {"detail": "RAG system is not initialized. Check logs for details."})
+                return
+            rag_retriever, rag_generator = handle.retriever, handle.generator
+            overall_start_time = time.time()
+            try:
+                async with upstream_semaphore:
+                    docs = await rag_retriever.aretrieve(
+                        request.query, top_k=settings.RETRIEVAL_TOP_K, search_kwargs=get_search_kwargs(request)
+                    )
+                retrieval_time = time.time() - overall_start_time
+                yield format_sse("sources", {"sources": describe_sources(docs)})
+                
+                # The client disconnecting cancels this generator, which also cancels the LLM stream
+                time_to_first_token = None
+                answer = await rag_generator.aget_cached_answer(request.query, docs)
+                cached = answer is not None
+                if cached:
+                    time_to_first_token = time.time() - overall_start_time
+                    yield format_sse("token", {"text": answer})
+                else:
+                    async with upstream_semaphore:
+                        async for token in rag_generator.astream_answer(request.query, docs):
+                            if time_to_first_token is None:
+                                time_to_first_token = time.time() - overall_start_time
+                            yield format_sse("token", {"text": token})
+                
+                processing_time = time.time() - overall_start_time
+                logger.info(f"Streaming query finished in {processing_time:.2f}s "
+                            f"(retrieval {retrieval_time:.2f}s, first token {time_to_first_token or 0:.2f}s)")
+                metrics.track_query(request.query, processing_time, len(docs), cached=cached)
+                
+                yield format_sse("done", {
+                    "processing_time": processing_time,
+                    "retrieval_time": retrieval_time,
+                    "time_to_first_token": time_to_first_token,
+                    "cached": cached,
+                    "server_timing": format_server_timing(
+                        {stage: seconds for stage, seconds in (stages or {}).items() if stage != "total"}
+                    )
+                })
+            except Exception as e:
+                metrics.inc("rag_query_errors_total", reason="error")
+                logger.error(f"Error streaming answer: {str(e)}")
+                yield format_sse("error", {"detail": f"Error generating answer: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """Answer many queries, streaming one JSON line per query as its answer completes.
+    
+    All distinct queries are embedded in one batched call and searched with one multi-query
+    index search; repeated questions are answered once. Generations run with bounded concurrency,
+    and each line carries the index of its query in the request.
+    """
+    queries = [query.strip() for query in request.queries]
+    if not queries or not all(queries):
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    if len(queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch")
+    
+    if index_manager.current is None:
+        raise HTTPException(status_code=503, detail="RAG system is not initialized. Check logs for details.")
+    
+    from src.retrieval.retriever import distinct_queries, normalize_query
+    
+    logger.info(f"Received batch of {len(queries)} queries")
+    
+    async def result_stream():
+        with index_manager.acquire() as handle:
+            if handle is None:
+                yield json.dumps({"error": "RAG system is not initialized. Check logs for details."}) + "\n"
+                return
+            rag_retriever, rag_generator = handle.retriever, handle.generator
+            batch_start = time.time()
+            
+            unique = distinct_queries(queries)
+            indexes = {normalize_query(query): [] for query in unique}
+            for index, query in enumerate(queries):
+                indexes[normalize_query(query)].append(index)
+            
+            try:
+                async with upstream_semaphore:
+                    docs_per_query = await rag_retriever.aretrieve_batch(
+                        unique, top_k=settings.RETRIEVAL_TOP_K, search_kwargs=get_search_kwargs(request)
+                    )
+            except Exception as e:
+                logger.error(f"Error retrieving batch: {str(e)}")
+                yield json.dumps({"error": f"Error retrieving documents: {str(e)}"}) + "\n"
+                return
+            retrieval_time = time.time() - batch_start
+            
+            generation_slots = asyncio.Semaphore(settings.BATCH_GENERATION_CONCURRENCY)
+            
+            async def answer(query_text, docs):
+                async with generation_slots:
+                    try:
+                        answer_text = await rag_generator.aget_cached_answer(query_text, docs)
+                        cached = answer_text is not None
+                        if not cached:
+                            async with upstream_semaphore:
+                                answer_text = await asyncio.wait_for(
+                                    rag_generator.agenerate_answer_from_docs(query_text, docs, check_cache=False),
+                                    timeout=settings.QUERY_TIMEOUT_SECONDS
+                                )
+                        result = {"answer": answer_text, "cached": cached, "sources": describe_sources(docs)}
+                    except asyncio.TimeoutError:
+                        result = {"error": f"Query timed out after {settings.QUERY_TIMEOUT_SECONDS} seconds"}
+                    except Exception as e:
+                        logger.error(f"Error generating answer: {str(e)}")
+                        result = {"error": f"Error generating answer: {str(e)}"}
+                    processing_time = time.time() - batch_start
+                    if "error" in result:
+                        metrics.inc("rag_query_errors_total", reason="error")
+                    else:
+                        metrics.track_query(query_text, processing_time, len(docs), cached=result["cached"])
+                    return query_text, {**result, "processing_time": processing_time}
+            
+            tasks = [asyncio.ensure_future(answer(query, docs)) for query, docs in zip(unique, docs_per_query)]
+            try:
+                for completed in asyncio.as_completed(tasks):
+                    query_text, result = await completed
+                    for index in indexes[normalize_query(query_text)]:
+                        with span("serialization"):
+                            line = json.dumps({"index": index, "query": queries[index], **result}) + "\n"
+                        yield line
+            finally:
+                for task in tasks:
+                    task.cancel()
+            
+            logger.info(f"Answered {len(queries)} queries ({len(unique)} distinct) in {time.time() - batch_start:.2f}s "
+                        f"(retrieval {retrieval_time:.2f}s)")
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
 @app.post("/refresh")
-def manual_refresh(background_tasks: BackgroundTasks):
-    """Manually refresh the vector store"""
+def manual_refresh(background_tasks: BackgroundTasks, mode: str = "full"):
+    """Manually refresh the vector store, either fully or incrementally from the registry"""
+    if mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail="Refresh mode must be 'full' or 'incremental'")
+    
+    # Claim the refresh here rather than checking the build state, which two requests could both
+    # pass. refresh_lock belongs to the thread that acquires it, so it is only probed here and
+    # taken by the background task; refresh_pending covers the gap until then.
+    if not refresh_pending.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A refresh is already running, see /refresh/status")
+    if not refresh_lock.acquire(blocking=False):
+        refresh_pending.release()
+        raise HTTPException(status_code=409, detail="A refresh is already running, see /refresh/status")
+    refresh_lock.release()
+    
     try:
-        background_tasks.add_task(rebuild_vector_store)
-        return {"status": "initiated", "message": "Vector store refresh has been initiated in the background"}
+        refresh = incremental_update_vector_store if mode == "incremental" else rebuild_vector_store
+        background_tasks.add_task(run_accepted_refresh, refresh)
+        return {"status": "initiated", "mode": mode, "message": f"Vector store {mode} refresh has been initiated in the background"}
     except Exception as e:
+        refresh_pending.release()
         logger.error(f"Error initiating refresh: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error initiating refresh: {str(e)}")
 
+def run_accepted_refresh(refresh):
+    """Run a refresh accepted by /refresh, waiting for a watcher job that started in the meantime"""
+    with refresh_lock:
+        refresh_pending.release()
+        return refresh()
+
+@app.get("/refresh/status")
+def refresh_status():
+    """Report the serving generation, generations still draining and the progress of the current build"""
+    return {**index_manager.get_status(), "build": BuildProgress.read(build_progress.path) or build_progress.state}
+
 @app.post("/documents/status")
 def update_document_status(doc_status: DocumentStatus):
     """Mark a document as active or deleted"""
     try:
-        registry = load_document_registry()
-        
-        if doc_status.path not in registry["files"]:
+        # Update status
+        if not registry.set_deleted(doc_status.path, doc_status.status == "deleted"):
             raise HTTPException(status_code=404, detail=f"Document {doc_status.path} not found in registry")
         
-        # Update status
-        registry["files"][doc_status.path]["deleted"] = (doc_status.status == "deleted")
-        registry["files"][doc_status.path]["status"] = "modified"
-        registry["vector_store_status"] = "needs_rebuild"
-        save_document_registry(registry)
+        # Deleted documents stop being retrieved right away; a refresh only reclaims their space
+        sync_search_filters()
+        handle = index_manager.current
+        if doc_status.status == "deleted" and handle is not None and handle.generator is not None \
+                and handle.generator.answer_cache is not None:
+            handle.generator.answer_cache.invalidate_chunks(registry.get_chunk_ids([doc_status.path]))
         
         return {
             "status": "success", 
             "message": f"Document {doc_status.path} marked as {doc_status.status}",
-            "note": "You may need to refresh the vector store for changes to take effect"
+            "note": "Search results reflect the change immediately; refresh the vector store to reclaim index space"
         }
     except HTTPException as e:
         raise e
@@ -317,27 +878,50 @@ def update_document_status(doc_status: DocumentStatus):
         logger.error(f"Error updating document status: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error updating document status: {str(e)}")
 
+@app.post("/documents/tags")
+def update_document_tags(doc_tags: DocumentTags):
+    """Set the tags of a document, which queries can filter on"""
+    try:
+        tags = registry.set_tags(doc_tags.path, doc_tags.tags)
+        if tags is None:
+            raise HTTPException(status_code=404, detail=f"Document {doc_tags.path} not found in registry")
+        sync_search_filters()
+        
+        return {"status": "success", "path": doc_tags.path, "tags": tags}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error updating document tags: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error updating document tags: {str(e)}")
+
 @app.get("/documents")
-def list_documents():
-    """List all documents in the registry"""
+def list_documents(offset: int = 0, limit: int = 100, status: Optional[str] = None):
+    """List one page of the documents in the registry, optionally only "active" or "deleted" ones"""
+    if status not in (None, "active", "deleted"):
+        raise HTTPException(status_code=400, detail="status must be 'active' or 'deleted'")
+    if offset < 0 or not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 1000")
     try:
-        registry = load_document_registry()
+        deleted = None if status is None else status == "deleted"
         document_list = []
         
-        for path, info in registry["files"].items():
+        for info in registry.list_files(offset=offset, limit=limit, deleted=deleted):
             document_list.append({
-                "path": path,
-                "status": "deleted" if info.get("deleted", False) else "active",
-                "last_modified": info.get("last_modified"),
-                "last_processed": info.get("last_processed"),
-                "size": info.get("file_size")
+                "path": info["path"],
+                "status": "deleted" if info["deleted"] else "active",
+                "last_modified": info["last_modified"],
+                "last_processed": info["last_processed"],
+                "size": info["file_size"],
+                "tags": info["tags"]
             })
         
         return {
             "documents": document_list,
-            "count": len(document_list),
-            "active_count": sum(1 for doc in document_list if doc["status"] == "active"),
-            "last_update": registry.get("last_update")
+            "offset": offset,
+            "limit": limit,
+            "count": registry.count(deleted=deleted),
+            "active_count": registry.count(deleted=False),
+            "last_update": registry.get_meta("last_update")
         }
     except Exception as e:
         logger.error(f"Error listing documents: {str(e)}")
@@ -347,39 +931,104 @@ def list_documents():
 def scan_documents():
     """Scan for new or modified documents"""
     try:
-        registry = scan_document_directory()
-        new_files = [path for path, info in registry["files"].items() 
-                    if info["status"] == "new" and not info.get("deleted", False)]
-        modified_files = [path for path, info in registry["files"].items() 
-                         if info["status"] == "modified" and not info.get("deleted", False)]
-        deleted_files = [path for path, info in registry["files"].items() 
-                        if info.get("deleted", False)]
+        registry.scan()
+        sync_search_filters()
+        deleted_files = registry.paths(deleted=True)
         
         return {
             "status": "success",
-            "new_files": new_files,
-            "modified_files": modified_files,
+            "new_files": registry.paths(status="new", deleted=False),
+            "modified_files": registry.paths(status="modified", deleted=False),
             "deleted_files": deleted_files,
-            "total_files": len(registry["files"]),
-            "active_files": len(registry["files"]) - len(deleted_files)
+            "total_files": registry.count(),
+            "active_files": registry.count(deleted=False)
         }
     except Exception as e:
         logger.error(f"Error scanning documents: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error scanning documents: {str(e)}")
 
+@app.get("/watcher/status")
+def watcher_status():
+    """Report the document watcher's backend, queue, backpressure and recent ingest jobs"""
+    if watcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **watcher.get_stats()}
+
+def collect_component_stats():
+    """Return the stats of the embedding client and caches, the answer cache and the watcher"""
+    stats = {}
+    if embedder is not None:
+        stats["embedding_client"] = embedder.get_client_stats()
+        if embedder.get_cache_stats() is not None:
+            stats["embedding_cache"] = embedder.get_cache_stats()
+    handle = index_manager.current
+    if handle is not None and handle.retriever is not None:
+        stats["query_cache"] = handle.retriever.get_cache_stats()
+    if handle is not None and handle.generator is not None and handle.generator.answer_cache is not None:
+        stats["answer_cache"] = handle.generator.answer_cache.get_stats()
+    if watcher is not None:
+        watcher_stats = watcher.get_stats()
+        watcher_stats.pop("recent_jobs")
+        stats["watcher"] = watcher_stats
+    return stats
+
+def collect_gauges(stats):
+    """Turn component stats into Prometheus gauges"""
+    caches = {}
+    if "embedding_cache" in stats:
+        caches["embedding"] = stats["embedding_cache"]
+    if "query_cache" in stats:
+        caches["query_embedding"] = stats["query_cache"]["query_embedding"]
+        caches["retrieval_results"] = stats["query_cache"]["retrieval_results"]
+    if "answer_cache" in stats:
+        caches["answer"] = stats["answer_cache"]
+    
+    gauges = {}
+    for name in ("hit_ratio", "hits", "misses"):
+        gauges[f"rag_cache_{name}"] = [({"cache": cache}, cache_stats[name]) for cache, cache_stats in caches.items()]
+    for name, value in stats.get("embedding_client", {}).items():
+        if isinstance(value, (int, float)):
+            gauges[f"rag_embedding_client_{name}"] = [({}, value)]
+    for name in ("pending_files", "queued_jobs", "backpressure_waits", "jobs_succeeded", "jobs_failed"):
+        if "watcher" in stats:
+            gauges[f"rag_watcher_{name}"] = [({}, stats["watcher"][name])]
+    handle = index_manager.current
+    gauges["rag_generation_refcount"] = [({}, handle.refcount if handle is not None else 0)]
+    gauges["rag_documents"] = [({"status": "active"}, registry.count(deleted=False)),
+                               ({"status": "deleted"}, registry.count(deleted=True))]
+    return gauges
+
 @app.get("/metrics")
 def get_metrics():
-    """Return usage metrics"""
-    return metrics.get_metrics()
+    """Export stage latency histograms, counters and cache ratios in the Prometheus text format"""
+    return PlainTextResponse(metrics.render_prometheus(collect_gauges(collect_component_stats())),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/summary")
+def get_metrics_summary():
+    """Return usage metrics, stage latency percentiles and component stats as JSON"""
+    return {**metrics.get_metrics(), **collect_component_stats()}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 200 once an index is loaded and queries can be served, 503 before that"""
+    ready = index_manager.current is not None
+    status = "ready" if ready else startup_state["status"]
+    body = {"ready": ready, **startup_state, "status": status}
+    return JSONResponse(jsonable_encoder(body), status_code=200 if ready else 503)
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint for Docker"""
-    return {"status": "healthy", "components": {
-        "vector_store": vector_store is not None,
-        "retriever": retriever is not None,
-        "generator": generator is not None
+    """Liveness probe for Docker: the process is up, even while the index is still loading (see /ready)"""
+    handle = index_manager.current
+    return {"status": "healthy", "ready": handle is not None, "startup": startup_state["status"], "components": {
+        "vector_store": handle is not None and handle.vector_store is not None,
+        "retriever": handle is not None and handle.retriever is not None,
+        "generator": handle is not None and handle.generator is not None,
+        "generation": handle.generation if handle is not None else None
     }}
 
 if __name__ == "__main__":
+    import uvicorn
+    
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,16 +1,40 @@
 from langchain.document_loaders import PyPDFLoader #, DirectoryLoader
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 import os
+import time
+
+CHUNK_ID_SEPARATOR = "::"
+
+def make_chunk_id(rel_path, chunk_index):
+    """Build the stable ID of a chunk from its file path (relative to the data dir) and position"""
+    return f"{rel_path}{CHUNK_ID_SEPARATOR}{chunk_index}"
+
+def chunk_id_source(chunk_id):
+    """Return the relative file path a chunk ID belongs to"""
+    return chunk_id.rsplit(CHUNK_ID_SEPARATOR, 1)[0]
+
+def _process_file_worker(file_path, data_dir, chunk_size, chunk_overlap):
+    """Entry point of ingestion worker processes"""
+    processor = DocumentProcessor(data_dir=data_dir, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return processor.split_file_timed(file_path)
 
 class DocumentProcessor:
-    def __init__(self, data_dir="./data"):
+    def __init__(self, data_dir="./data", chunk_size=1000, chunk_overlap=200, max_workers=1):
         self.data_dir = data_dir
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
             length_function=len,
         )
+        
+        # Number of processes used to parse and split files (0 means one per CPU core)
+        self.max_workers = max_workers if max_workers > 0 else (os.cpu_count() or 1)
+        self.file_timings = []
     
     def load_documents(self):
         """Load documents from the data directory"""
@@ -35,14 +59,160 @@ class DocumentProcessor:
         print(f"Loaded {len(documents)} documents")
         return documents
     
+    def load_file(self, file_path):
+        """Load a single PDF or TXT file"""
+        if file_path.lower().endswith(".pdf"):
+            loader = PyPDFLoader(file_path)
+        else:
+            loader = TextLoader(file_path)
+        return loader.load()
+    
+    def list_files(self):
+        """Return the paths of all PDF and TXT files in the data directory"""
+        file_paths = []
+        for root, _, files in os.walk(self.data_dir):
+            for file in files:
+                if file.lower().endswith(('.pdf', '.txt')):
+                    file_paths.append(os.path.join(root, file))
+        return sorted(file_paths)
+    
+    def split_file(self, file_path):
+        """Load and split a single file without logging"""
+        chunks = self.text_splitter.split_documents(self.load_file(file_path))
+        self._assign_chunk_ids(chunks)
+        return chunks
+    
+    def iter_file_chunks(self, file_path):
+        """Lazily load a file page by page and yield its chunks, numbered like split_file"""
+        if file_path.lower().endswith(".pdf"):
+            loader = PyPDFLoader(file_path)
+        else:
+            loader = TextLoader(file_path)
+        
+        rel_path = os.path.relpath(file_path, self.data_dir)
+        index = 0
+        for page in loader.lazy_load():
+            for chunk in self.text_splitter.split_documents([page]):
+                chunk.metadata["chunk_id"] = make_chunk_id(rel_path, index)
+                index += 1
+                yield chunk
+    
+    def split_file_timed(self, file_path):
+        """Split a single file, reporting its timing and any failure instead of raising"""
+        start = time.time()
+        try:
+            chunks = self.split_file(file_path)
+            return {"path": file_path, "chunks": chunks, "seconds": time.time() - start, "error": None}
+        except Exception as e:
+            return {"path": file_path, "chunks": [], "seconds": time.time() - start, "error": str(e)}
+    
     def split_documents(self, documents):
-        """Split documents into chunks"""
+        """Split documents into chunks and tag each chunk with a stable chunk ID"""
         chunks = self.text_splitter.split_documents(documents)
+        self._assign_chunk_ids(chunks)
         print(f"Split into {len(chunks)} chunks")
         return chunks
     
+    def _assign_chunk_ids(self, chunks):
+        """Number chunks per source file so IDs stay stable across runs"""
+        counters = {}
+        for chunk in chunks:
+            rel_path = os.path.relpath(chunk.metadata.get("source", ""), self.data_dir)
+            index = counters.get(rel_path, 0)
+            counters[rel_path] = index + 1
+            chunk.metadata["chunk_id"] = make_chunk_id(rel_path, index)
+    
     def process(self):
         """Load and split documents"""
+        if self.max_workers > 1:
+            return self.process_files(self.list_files())
+        
         documents = self.load_documents()
         chunks = self.split_documents(documents)
-        return chunks
\ No newline at end of file
+        return chunks
+    
+    def _process_files_parallel(self, file_paths, progress_callback=None):
+        """Split files in worker processes, surviving workers that die (e.g. OOM or a crash in the PDF parser).
+        
+        A dead worker breaks the whole pool, so the files that were in flight at that moment are
+        retried once each in a pool of their own, which pins the failure on the file that crashes
+        again, and the files that had not started yet continue in a new pool.
+        """
+        results = {}
+        
+        def report(path, result):
+            results[path] = result
+            if progress_callback:
+                progress_callback(len(results), len(file_paths))
+        
+        pending = list(file_paths)
+        while pending:
+            in_flight = self._run_pool(pending, min(self.max_workers, len(pending)), report)
+            for path in in_flight:
+                if self._run_pool([path], 1, report):
+                    report(path, {"path": path, "chunks": [], "seconds": 0.0,
+                                  "error": "worker process crashed while processing this file"})
+            pending = [path for path in pending if path not in results]
+        return [results[path] for path in file_paths]
+    
+    def _run_pool(self, file_paths, workers, report):
+        """Split files in a new pool with at most `workers` files in flight.
+        
+        Returns the files that were in flight when a worker process died (empty if none did).
+        """
+        remaining = iter(file_paths)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = {}
+            
+            def submit_next():
+                path = next(remaining, None)
+                if path is not None:
+                    in_flight[executor.submit(_process_file_worker, path, self.data_dir, self.chunk_size,
+                                              self.chunk_overlap)] = path
+            
+            try:
+                for _ in range(workers):
+                    submit_next()
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            result = {"path": in_flight[future], "chunks": [], "seconds": 0.0, "error": str(e)}
+                        report(in_flight.pop(future), result)
+                        submit_next()
+            except BrokenProcessPool:
+                return list(in_flight.values())
+        return []
+    
+    def process_files(self, file_paths, progress_callback=None):
+        """Load and split only the given files, in parallel when max_workers > 1.
+        
+        Each file is processed in isolation: a file that fails to load is reported in
+        file_timings and skipped instead of aborting the run. progress_callback, if given,
+        is called with (files done, total files) after each file.
+        """
+        start = time.time()
+        if self.max_workers > 1 and len(file_paths) > 1:
+            results = self._process_files_parallel(file_paths, progress_callback)
+        else:
+            results = []
+            for path in file_paths:
+                results.append(self.split_file_timed(path))
+                if progress_callback:
+                    progress_callback(len(results), len(file_paths))
+        
+        chunks = []
+        for result in results:
+            chunks.extend(result.pop("chunks"))
+            if result["error"]:
+                print(f"Error loading {result['path']}: {result['error']}")
+        self.file_timings = results
+        
+        failed = sum(1 for result in results if result["error"])
+        print(f"Processed {len(file_paths)} files into {len(chunks)} chunks in {time.time() - start:.2f}s "
+              f"with {self.max_workers} workers ({failed} failed)")
+        return chunks
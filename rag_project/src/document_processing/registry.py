@@ -0,0 +1,328 @@
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger("rag-system")
+
+DOCUMENT_EXTENSIONS = (".pdf", ".txt")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS files ("
+    "path TEXT PRIMARY KEY, file_size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, last_modified TEXT NOT NULL, "
+    "content_hash TEXT, status TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0, chunks INTEGER NOT NULL DEFAULT 0, "
+    "chunk_ids TEXT, last_processed TEXT, tags TEXT NOT NULL DEFAULT '[]')",
+    "CREATE INDEX IF NOT EXISTS idx_files_status ON files (status, deleted)",
+    "CREATE INDEX IF NOT EXISTS idx_files_deleted ON files (deleted)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+)
+
+_COLUMNS = ("path", "file_size", "last_modified", "content_hash", "status", "deleted", "chunks",
+            "chunk_ids", "last_processed", "tags")
+
+def hash_file(path, block_size=1 << 20):
+    """Return the SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_documents(data_dir, extensions, exclude_dirs=()):
+    """Yield (relative path, stat result) for every document below data_dir with one os.scandir pass.
+
+    exclude_dirs are absolute directory paths whose subtrees are not scanned.
+    """
+    pending = [data_dir]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.abspath(entry.path) not in exclude_dirs:
+                            pending.append(entry.path)
+                    elif entry.name.lower().endswith(extensions):
+                        yield os.path.relpath(entry.path, data_dir), entry.stat()
+        except OSError as e:
+            logger.error(f"Cannot scan {directory}: {str(e)}")
+
+def _row_to_info(row):
+    info = dict(zip(_COLUMNS, row))
+    info["deleted"] = bool(info["deleted"])
+    info["tags"] = json.loads(info["tags"])
+    # NULL chunk IDs mark files processed before chunk IDs were tracked
+    if info["chunk_ids"] is None:
+        del info["chunk_ids"]
+    else:
+        info["chunk_ids"] = json.loads(info["chunk_ids"])
+    return info
+
+class DocumentRegistry:
+    """Document registry kept in SQLite, indexed by path and status.
+
+    Every update runs in a single transaction under a lock, so concurrent requests cannot
+    overwrite each other's changes, and listing is paginated instead of loading every file.
+    """
+
+    def __init__(self, path="./data/document_registry.sqlite", data_dir="./data", legacy_json_path=None):
+        self.path = path
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+        if legacy_json_path and os.path.exists(legacy_json_path) and self.count() == 0:
+            self._migrate_json(legacy_json_path)
+
+    def _migrate_json(self, json_path):
+        """Import a document_registry.json written by earlier versions, then set it aside"""
+        with open(json_path, "r") as f:
+            legacy = json.load(f)
+        rows = []
+        for path, info in legacy.get("files", {}).items():
+            last_modified = info.get("last_modified") or datetime.now().isoformat()
+            chunk_ids = info.get("chunk_ids")
+            rows.append((
+                path, info.get("file_size", 0), int(datetime.fromisoformat(last_modified).timestamp() * 1e9),
+                last_modified, None, info.get("status", "new"), int(info.get("deleted", False)),
+                info.get("chunks", 0), json.dumps(chunk_ids) if chunk_ids is not None else None,
+                info.get("last_processed"), json.dumps(info.get("tags", []))
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, file_size, mtime_ns, last_modified, content_hash, status, "
+                "deleted, chunks, chunk_ids, last_processed, tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            for key in ("last_update", "vector_store_status"):
+                if legacy.get(key):
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, legacy[key]))
+        os.replace(json_path, json_path + ".migrated")
+        logger.info(f"Migrated {len(rows)} documents from {json_path} to {self.path}")
+
+    def scan(self, extensions=DOCUMENT_EXTENSIONS):
+        """Sync the registry with the files in the data directory.
+
+        Files are listed with a single os.scandir pass and stat'ed once. Content is only hashed
+        for new files and for files whose size or mtime changed, so touching a file without
+        changing it does not mark it modified. Files that disappeared are marked deleted with the
+        status 'missing' and come back as new if they reappear; files marked deleted through
+        set_deleted stay deleted. Returns counts of new, modified, deleted and restored files.
+        """
+        with self._lock:
+            known = {
+                path: (file_size, mtime_ns, last_modified, content_hash, status, deleted)
+                for path, file_size, mtime_ns, last_modified, content_hash, status, deleted in self._conn.execute(
+                    "SELECT path, file_size, mtime_ns, last_modified, content_hash, status, deleted FROM files"
+                )
+            }
+
+        inserts, updates, restores, seen, modified = [], [], [], set(), 0
+        for rel_path, stat in iter_documents(self.data_dir, extensions):
+            seen.add(rel_path)
+            last_modified = datetime.fromtimestamp(stat.st_mtime).isoformat()
+            previous = known.get(rel_path)
+            if previous is None:
+                content_hash = self._hash(rel_path)
+                inserts.append((rel_path, stat.st_size, stat.st_mtime_ns, last_modified, content_hash, "new"))
+                continue
+
+            file_size, mtime_ns, previous_modified, content_hash, status, deleted = previous
+            if deleted and status == "missing":
+                restores.append((stat.st_size, stat.st_mtime_ns, last_modified, self._hash(rel_path), rel_path))
+                continue
+            if file_size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                continue
+            new_hash = self._hash(rel_path)
+            if content_hash is None:
+                # Entries migrated from the JSON registry have no hash yet; compare them the old way
+                unchanged = file_size == stat.st_size and previous_modified == last_modified
+            else:
+                unchanged = new_hash == content_hash
+            if not unchanged:
+                status = "modified"
+                modified += 1
+            updates.append((stat.st_size, stat.st_mtime_ns, last_modified, new_hash, status, rel_path))
+
+        # Mark missing files as deleted
+        missing = [(path,) for path, previous in known.items() if path not in seen and not previous[5]]
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO files (path, file_size, mtime_ns, last_modified, content_hash, status, chunk_ids) "
+                "VALUES (?, ?, ?, ?, ?, ?, '[]')", inserts
+            )
+            self._conn.executemany(
+                "UPDATE files SET file_size = ?, mtime_ns = ?, last_modified = ?, content_hash = ?, status = ? "
+                "WHERE path = ?", updates
+            )
+            self._conn.executemany(
+                "UPDATE files SET file_size = ?, mtime_ns = ?, last_modified = ?, content_hash = ?, status = 'new', "
+                "deleted = 0 WHERE path = ?", restores
+            )
+            self._conn.executemany("UPDATE files SET deleted = 1, status = 'missing' WHERE path = ?", missing)
+            self._set_meta("last_update", datetime.now().isoformat())
+
+        return {"new": len(inserts), "modified": modified, "deleted": len(missing), "restored": len(restores),
+                "scanned": len(seen)}
+
+    def _hash(self, rel_path):
+        try:
+            return hash_file(os.path.join(self.data_dir, rel_path))
+        except OSError:
+            return None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_vector_store_status(self, status):
+        """Record the vector store status and the time of the update"""
+        with self._lock, self._conn:
+            self._set_meta("vector_store_status", status)
+            self._set_meta("last_update", datetime.now().isoformat())
+
+    def get(self, path):
+        """Return the registry entry of one file, or None"""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM files WHERE path = ?", (path,)).fetchone()
+        return _row_to_info(row) if row else None
+
+    def _paths(self, where, params=()):
+        with self._lock:
+            return [path for (path,) in self._conn.execute(f"SELECT path FROM files WHERE {where} ORDER BY path", params)]
+
+    def paths(self, status=None, deleted=None):
+        """Paths of the files with the given status and deleted flag"""
+        return self._paths(*self._filters(status, deleted))
+
+    def active_paths(self):
+        """Paths of all files that are not marked as deleted"""
+        return self.paths(deleted=False)
+
+    def changed_paths(self):
+        """Active files that are new or were modified since they were last processed"""
+        return self._paths("deleted = 0 AND status IN ('new', 'modified')")
+
+    def removed_paths(self):
+        """Deleted files whose chunks are still in the vector store"""
+        return self._paths("deleted = 1 AND chunk_ids IS NOT NULL AND chunk_ids != '[]'")
+
+    def untracked_paths(self):
+        """Processed files whose chunk IDs were never recorded"""
+        return self._paths("last_processed IS NOT NULL AND chunk_ids IS NULL")
+
+    def get_chunk_ids(self, paths):
+        """Return the chunk IDs recorded for the given files"""
+        chunk_ids = []
+        with self._lock:
+            for path in paths:
+                row = self._conn.execute("SELECT chunk_ids FROM files WHERE path = ?", (path,)).fetchone()
+                if row and row[0]:
+                    chunk_ids.extend(json.loads(row[0]))
+        return chunk_ids
+
+    def tags_by_path(self):
+        """Tags of every file that has any"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, tags FROM files WHERE tags != '[]'").fetchall()
+        return {path: json.loads(tags) for path, tags in rows}
+
+    def count(self, status=None, deleted=None):
+        where, params = self._filters(status, deleted)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+
+    def list_files(self, offset=0, limit=100, status=None, deleted=None):
+        """Return one page of registry entries ordered by path"""
+        where, params = self._filters(status, deleted)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM files WHERE {where} ORDER BY path LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        return [_row_to_info(row) for row in rows]
+
+    @staticmethod
+    def _filters(status, deleted):
+        clauses, params = ["1 = 1"], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if deleted is not None:
+            clauses.append("deleted = ?")
+            params.append(int(deleted))
+        return " AND ".join(clauses), params
+
+    def content_hashes(self, paths):
+        """Return the recorded content hash of each of the given files, to pass to mark_processed later"""
+        hashes = {}
+        with self._lock:
+            for path in paths:
+                row = self._conn.execute("SELECT content_hash FROM files WHERE path = ?", (path,)).fetchone()
+                if row:
+                    hashes[path] = row[0]
+        return hashes
+
+    def mark_processed(self, paths, chunk_ids_by_file, content_hashes=None):
+        """Mark files as processed and store the IDs of the chunks created from each of them.
+
+        content_hashes, taken with content_hashes() before the files were read, makes this a
+        compare-and-set: a file a scan found modified in the meantime keeps its status, so it is
+        ingested again, while its chunk IDs are still recorded so those chunks can be replaced.
+        """
+        processed_at = datetime.now().isoformat()
+        rows = []
+        for path in paths:
+            chunk_ids = chunk_ids_by_file.get(path, [])
+            if content_hashes is None or path not in content_hashes:
+                rows.append((1, None, processed_at, len(chunk_ids), json.dumps(chunk_ids), path))
+            else:
+                rows.append((0, content_hashes[path], processed_at, len(chunk_ids), json.dumps(chunk_ids), path))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE files SET status = CASE WHEN status != 'missing' AND (? OR content_hash IS ?) "
+                "THEN 'processed' ELSE status END, "
+                "last_processed = ?, chunks = ?, chunk_ids = ? WHERE path = ?",
+                rows
+            )
+
+    def clear_chunks(self, paths):
+        """Record that the chunks of the given files are no longer in the vector store"""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE files SET chunks = 0, chunk_ids = '[]' WHERE path = ?",
+                                   [(path,) for path in paths])
+
+    def clear_deleted_chunks(self):
+        """Record that no deleted file has chunks left, e.g. after a full rebuild"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE files SET chunks = 0, chunk_ids = '[]' WHERE deleted = 1")
+
+    def set_deleted(self, path, deleted):
+        """Mark a file as deleted or active; returns False if the file is unknown"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE files SET deleted = ?, status = 'modified' WHERE path = ?", (int(deleted), path)
+            )
+            if cursor.rowcount:
+                self._set_meta("vector_store_status", "needs_rebuild")
+        return cursor.rowcount > 0
+
+    def set_tags(self, path, tags):
+        """Replace the tags of a file; returns the stored tags, or None if the file is unknown"""
+        tags = sorted(set(tags))
+        with self._lock, self._conn:
+            cursor = self._conn.execute("UPDATE files SET tags = ? WHERE path = ?", (json.dumps(tags), path))
+        return tags if cursor.rowcount else None
@@ -0,0 +1,276 @@
+from collections import deque
+from datetime import datetime
+import logging
+import os
+import queue
+import threading
+import time
+
+from src.document_processing.registry import DOCUMENT_EXTENSIONS, iter_documents
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = flags = None
+
+logger = logging.getLogger("rag-system")
+
+class DocumentWatcher:
+    """Watch the data directory and turn bursts of file changes into batched ingest jobs.
+
+    Changes are detected with inotify when the inotify_simple package is available (Linux)
+    and by periodically re-stat'ing the directory otherwise. Events are debounced: a batch is
+    queued once no change arrived for debounce_seconds, or max_delay_seconds after its first
+    change. The job queue is bounded; while it is full, new changes keep accumulating into the
+    pending batch instead of queueing more work, and jobs that find a refresh already running
+    are put back and retried.
+
+    run_job(paths) receives the changed data-dir relative paths and returns a status dict;
+    {"status": "busy"} means the job should be retried later. Directories in exclude_dirs,
+    such as the vector store below the data directory, are neither polled nor watched.
+    """
+
+    def __init__(self, data_dir, run_job, extensions=DOCUMENT_EXTENSIONS, debounce_seconds=2.0,
+                 max_delay_seconds=30.0, poll_interval=5.0, queue_size=2, retry_delay=5.0,
+                 use_inotify=True, history_size=50, exclude_dirs=()):
+        self.data_dir = data_dir
+        self.run_job = run_job
+        self.extensions = extensions
+        self.exclude_dirs = frozenset(os.path.abspath(path) for path in exclude_dirs)
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max(max_delay_seconds, debounce_seconds)
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.backend = "inotify" if use_inotify and INotify is not None else "polling"
+
+        self._jobs = queue.Queue(maxsize=max(1, queue_size))
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+        # Pending (not yet queued) batch
+        self._pending_paths = set()
+        self._pending_events = 0
+        self._first_event = None
+        self._last_event = None
+
+        self._history = deque(maxlen=history_size)
+        self._job_counter = 0
+        self._stats = {
+            "events": 0,
+            "batches_queued": 0,
+            "jobs_succeeded": 0,
+            "jobs_failed": 0,
+            "jobs_retried": 0,
+            "backpressure_waits": 0
+        }
+
+    def start(self):
+        """Start the watcher and worker threads"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        watch = self._watch_inotify if self.backend == "inotify" else self._watch_polling
+        self._threads = [
+            threading.Thread(target=watch, name="document-watcher", daemon=True),
+            threading.Thread(target=self._work, name="document-ingest", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Watching {self.data_dir} for document changes ({self.backend})")
+
+    def stop(self, timeout=10.0):
+        """Stop watching; a job that is already running is allowed to finish"""
+        self._stop_event.set()
+        try:
+            self._jobs.put_nowait(None)
+        except queue.Full:
+            pass
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _is_document(self, name):
+        return name.lower().endswith(self.extensions)
+
+    def _is_excluded(self, directory):
+        return os.path.abspath(directory) in self.exclude_dirs
+
+    def _notify(self, paths, events=1):
+        """Add changed paths to the pending batch"""
+        now = time.time()
+        with self._lock:
+            self._pending_paths.update(paths)
+            self._pending_events += events
+            self._stats["events"] += events
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+
+    def _seconds_until_due(self):
+        """Seconds until the pending batch should be queued, or None if nothing is pending"""
+        with self._lock:
+            if not self._pending_events:
+                return None
+            now = time.time()
+            return max(0.0, min(self._last_event + self.debounce_seconds,
+                                self._first_event + self.max_delay_seconds) - now)
+
+    def _flush(self):
+        """Queue the pending batch if it is due and the queue has room"""
+        due = self._seconds_until_due()
+        if due is None or due > 0:
+            return
+        with self._lock:
+            job = {
+                "paths": sorted(self._pending_paths),
+                "events": self._pending_events,
+                "first_event_at": self._first_event,
+                "queued_at": time.time()
+            }
+            try:
+                self._jobs.put_nowait(job)
+            except queue.Full:
+                # Backpressure: keep accumulating into the pending batch until the worker catches up
+                self._stats["backpressure_waits"] += 1
+                return
+            self._pending_paths = set()
+            self._pending_events = 0
+            self._first_event = self._last_event = None
+            self._stats["batches_queued"] += 1
+
+    def _wait_timeout(self, interval):
+        due = self._seconds_until_due()
+        return interval if due is None else min(interval, max(due, 0.05))
+
+    def _snapshot(self):
+        return {path: (stat.st_size, stat.st_mtime_ns)
+                for path, stat in iter_documents(self.data_dir, self.extensions, self.exclude_dirs)}
+
+    def _watch_polling(self):
+        previous = self._snapshot()
+        while not self._stop_event.wait(self._wait_timeout(self.poll_interval)):
+            current = self._snapshot()
+            changed = {path for path, state in current.items() if previous.get(path) != state}
+            changed.update(path for path in previous if path not in current)
+            if changed:
+                self._notify(changed, events=len(changed))
+            previous = current
+            self._flush()
+
+    def _watch_inotify(self):
+        inotify = INotify()
+        file_mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE
+        mask = file_mask | flags.CREATE
+        directories = {}
+
+        def add_tree(root):
+            if self._is_excluded(root):
+                return
+            for directory, subdirectories, _ in os.walk(root):
+                subdirectories[:] = [name for name in subdirectories
+                                     if not self._is_excluded(os.path.join(directory, name))]
+                try:
+                    directories[inotify.add_watch(directory, mask)] = directory
+                except OSError as e:
+                    logger.error(f"Cannot watch {directory}: {str(e)}")
+
+        add_tree(self.data_dir)
+        try:
+            while not self._stop_event.is_set():
+                timeout = self._wait_timeout(1.0)
+                changed, events = set(), 0
+                for event in inotify.read(timeout=int(timeout * 1000)):
+                    if event.mask & flags.Q_OVERFLOW:
+                        # Events were lost; the ingest job rescans the whole directory anyway
+                        events += 1
+                        continue
+                    directory = directories.get(event.wd)
+                    if directory is None:
+                        continue
+                    if event.mask & flags.IGNORED:
+                        directories.pop(event.wd, None)
+                        continue
+                    path = os.path.join(directory, event.name)
+                    if event.mask & flags.ISDIR:
+                        if event.mask & (flags.CREATE | flags.MOVED_TO) and not self._is_excluded(path):
+                            add_tree(path)
+                            changed.update(os.path.relpath(os.path.join(path, rel), self.data_dir)
+                                           for rel, _ in iter_documents(path, self.extensions, self.exclude_dirs))
+                        continue
+                    if event.mask & file_mask and self._is_document(event.name):
+                        changed.add(os.path.relpath(path, self.data_dir))
+                if changed or events:
+                    self._notify(changed, events=events + len(changed))
+                self._flush()
+        finally:
+            inotify.close()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None or self._stop_event.is_set():
+                return
+
+            with self._lock:
+                self._job_counter += 1
+                job_id = self._job_counter
+            started = time.time()
+            try:
+                result = self.run_job(job["paths"]) or {}
+            except Exception as e:
+                logger.error(f"Document ingest job {job_id} failed: {str(e)}")
+                result = {"status": "error", "message": str(e)}
+            finished = time.time()
+
+            record = {
+                "job_id": job_id,
+                "files": len(job["paths"]),
+                "events": job["events"],
+                "status": result.get("status"),
+                "message": result.get("message"),
+                "queue_wait_seconds": round(started - job["queued_at"], 3),
+                "run_seconds": round(finished - started, 3),
+                # Time from the first change of the batch until it was searchable
+                "freshness_seconds": round(finished - job["first_event_at"], 3),
+                "finished_at": datetime.fromtimestamp(finished).isoformat()
+            }
+            with self._lock:
+                self._history.append(record)
+                if record["status"] == "busy":
+                    self._stats["jobs_retried"] += 1
+                elif record["status"] == "success":
+                    self._stats["jobs_succeeded"] += 1
+                else:
+                    self._stats["jobs_failed"] += 1
+
+            if record["status"] == "busy":
+                # A refresh is running; merge the batch back and try again later
+                if self._stop_event.wait(self.retry_delay):
+                    return
+                self._notify(job["paths"], events=0)
+                with self._lock:
+                    self._first_event = min(self._first_event, job["first_event_at"])
+                    self._pending_events = max(self._pending_events, 1)
+            else:
+                logger.info(f"Document ingest job {job_id}: {len(job['paths'])} files, {record['status']} "
+                            f"in {record['run_seconds']:.2f}s (freshness {record['freshness_seconds']:.2f}s)")
+
+    def get_stats(self):
+        """Return watcher counters, the pending batch and the metrics of recent jobs"""
+        with self._lock:
+            recent = list(self._history)
+            stats = dict(self._stats)
+            pending = len(self._pending_paths)
+        freshness = sorted(record["freshness_seconds"] for record in recent if record["status"] == "success")
+        return {
+            "backend": self.backend,
+            "running": any(thread.is_alive() for thread in self._threads),
+            **stats,
+            "pending_files": pending,
+            "queued_jobs": self._jobs.qsize(),
+            "queue_size": self._jobs.maxsize,
+            "freshness_seconds_p50": freshness[len(freshness) // 2] if freshness else None,
+            "freshness_seconds_max": freshness[-1] if freshness else None,
+            "recent_jobs": recent[-10:]
+        }
@@ -0,0 +1,129 @@
+from langchain_core.embeddings import Embeddings
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import random
+import threading
+import time
+
+from src.utils.tokens import count_tokens
+
+logger = logging.getLogger("rag-system")
+
+RETRYABLE_ERROR_NAMES = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+def is_retryable_error(error):
+    """Return True for rate limits (429), server errors (5xx) and transient connection failures"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or 500 <= status_code < 600
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+class BatchEmbeddingExecutor(Embeddings):
+    """Embeddings wrapper that batches texts by token budget and embeds batches concurrently.
+
+    Retryable errors put every worker into a shared cooldown whose length doubles on each
+    rate limit and shrinks again after successful requests, so concurrent workers back off
+    together instead of hammering the API.
+    """
+
+    def __init__(self, embeddings, model_name="text-embedding-ada-002", max_tokens_per_batch=50000,
+                 max_batch_size=512, max_concurrency=4, max_retries=6, initial_backoff=1.0, max_backoff=60.0):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._backoff = 0.0
+        self._cooldown_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "chunks": 0, "tokens": 0, "seconds": 0.0}
+
+    def make_batches(self, texts):
+        """Group text indices into batches that respect the token budget and batch size"""
+        batches, batch, batch_tokens = [], [], 0
+        for index, text in enumerate(texts):
+            tokens = count_tokens(text, self.model_name)
+            if batch and (batch_tokens + tokens > self.max_tokens_per_batch or len(batch) >= self.max_batch_size):
+                batches.append((batch, batch_tokens))
+                batch, batch_tokens = [], 0
+            batch.append(index)
+            batch_tokens += tokens
+        if batch:
+            batches.append((batch, batch_tokens))
+        return batches
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+
+        start = time.time()
+        batches = self.make_batches(texts)
+        vectors = [None] * len(texts)
+
+        def run(batch):
+            indices, tokens = batch
+            batch_vectors = self._embed_with_retry([texts[index] for index in indices])
+            for index, vector in zip(indices, batch_vectors):
+                vectors[index] = vector
+            return tokens
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            total_tokens = sum(executor.map(run, batches))
+
+        elapsed = time.time() - start
+        with self._lock:
+            self.stats["chunks"] += len(texts)
+            self.stats["tokens"] += total_tokens
+            self.stats["seconds"] += elapsed
+        logger.info(f"Embedded {len(texts)} chunks ({total_tokens} tokens) in {len(batches)} batches "
+                    f"in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/s, "
+                    f"{total_tokens / max(elapsed, 1e-9):.0f} tokens/s)")
+        return vectors
+
+    def _embed_with_retry(self, batch_texts):
+        """Embed one batch, waiting out the shared cooldown and backing off on retryable errors"""
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                wait = self._cooldown_until - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                batch_vectors = self.embeddings.embed_documents(batch_texts)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                    self._backoff = min(self.max_backoff, max(self.initial_backoff, self._backoff * 2))
+                    delay = self._backoff * random.uniform(0.5, 1.0)
+                    self._cooldown_until = max(self._cooldown_until, time.time() + delay)
+                logger.warning(f"Embedding request failed ({str(e)}), retrying in {delay:.1f}s "
+                               f"(attempt {attempt + 1}/{self.max_retries})")
+                continue
+
+            with self._lock:
+                self.stats["requests"] += 1
+                self._backoff /= 2
+            return batch_vectors
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
+
+    def get_stats(self):
+        """Return request counters and the throughput achieved so far"""
+        with self._lock:
+            stats = dict(self.stats)
+        seconds = max(stats["seconds"], 1e-9)
+        stats["chunks_per_second"] = stats["chunks"] / seconds if stats["chunks"] else 0.0
+        stats["tokens_per_second"] = stats["tokens"] / seconds if stats["tokens"] else 0.0
+        return stats
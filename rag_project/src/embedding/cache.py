@@ -0,0 +1,162 @@
+from langchain_core.embeddings import Embeddings
+from array import array
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("rag-system")
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH_SIZE = 500
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model name, hash of the text) with LRU eviction"""
+
+    def __init__(self, path="./data/embedding_cache.sqlite", max_entries=500000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        # Running count of the entries, so eviction does not count the table on every put
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name, text):
+        """Content address of a text for a given embedding model"""
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name, texts):
+        """Return cached vectors for the texts, with None for every miss"""
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                batch = keys[start:start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            # Touch hits so eviction keeps recently used entries
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            vectors = [found.get(key) for key in keys]
+            hits = sum(1 for vector in vectors if vector is not None)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+
+        return vectors
+
+    def put_many(self, model_name, texts, vectors):
+        """Store vectors for the texts and evict the least recently used entries over the limit"""
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), model_name, array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            keys = list(dict.fromkeys(row[0] for row in rows))
+            existing = 0
+            for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                batch = keys[start:start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._entries += len(keys) - existing
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete the oldest entries once the cache holds more than max_entries"""
+        overflow = self._entries - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+            self._entries = self.max_entries
+
+    def get_stats(self):
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            # Resynchronise with entries written by other processes sharing the cache file
+            self._entries = entries
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts missing from the cache to the underlying model"""
+
+    def __init__(self, embeddings, cache, model_name):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model_name, texts)
+
+        # Embed each distinct missing text once
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing_texts:
+            logger.info(f"Embedding cache: {len(texts) - len(missing_texts)} hits, "
+                        f"{len(missing_texts)} texts sent to {self.model_name}")
+            new_vectors = self.embeddings.embed_documents(missing_texts)
+            self.cache.put_many(self.model_name, missing_texts, new_vectors)
+            computed = dict(zip(missing_texts, new_vectors))
+            vectors = [vector if vector is not None else computed[text] for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+    def embed_query(self, text):
+        # Queries are not worth persisting; they go straight to the model
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
+
+    def embed_queries(self, texts):
+        # Batched embed_query: several queries in one request, also kept out of the cache
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_queries(self, texts):
+        return await self.embeddings.aembed_documents(texts)
@@ -0,0 +1,160 @@
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+from collections.abc import MutableMapping
+import json
+import os
+import sqlite3
+import threading
+
+DOCSTORE_FILE = "docstore.sqlite"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS positions_doc_id ON positions (doc_id)",
+)
+
+class _SQLiteConnections:
+    """One SQLite connection per thread, opened read-only when requested"""
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                conn.commit()
+            self._local.conn = conn
+        return conn
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore that keeps chunk texts and metadata in SQLite and reads them only for search hits"""
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._connections = _SQLiteConnections(path, read_only=read_only)
+
+    def search(self, search):
+        row = self._connections.get().execute(
+            "SELECT text, metadata FROM documents WHERE doc_id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        conn = self._connections.get()
+        conn.executemany(
+            "INSERT OR REPLACE INTO documents (doc_id, text, metadata) VALUES (?, ?, ?)",
+            [(doc_id, doc.page_content, json.dumps(doc.metadata, default=str)) for doc_id, doc in texts.items()]
+        )
+        conn.commit()
+
+    def delete(self, ids):
+        conn = self._connections.get()
+        conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+        conn.commit()
+
+    def iter_documents(self):
+        """Yield (doc_id, Document) for every stored chunk"""
+        for doc_id, text, metadata in self._connections.get().execute(
+            "SELECT doc_id, text, metadata FROM documents"
+        ):
+            yield doc_id, Document(page_content=text, metadata=json.loads(metadata))
+
+class SQLiteIndexMapping(MutableMapping):
+    """FAISS position -> docstore ID mapping read from SQLite on demand instead of held in memory"""
+
+    def __init__(self, path, read_only=False):
+        self._connections = _SQLiteConnections(path, read_only=read_only)
+
+    def __getitem__(self, position):
+        row = self._connections.get().execute(
+            "SELECT doc_id FROM positions WHERE position = ?", (int(position),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __setitem__(self, position, doc_id):
+        self.update({position: doc_id})
+
+    def __delitem__(self, position):
+        conn = self._connections.get()
+        conn.execute("DELETE FROM positions WHERE position = ?", (int(position),))
+        conn.commit()
+
+    def __iter__(self):
+        for (position,) in self._connections.get().execute("SELECT position FROM positions ORDER BY position"):
+            yield position
+
+    def __len__(self):
+        return self._connections.get().execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def items(self):
+        return list(self._connections.get().execute("SELECT position, doc_id FROM positions ORDER BY position"))
+
+    def values(self):
+        return [doc_id for _, doc_id in self.items()]
+
+    def positions_of(self, doc_ids, batch_size=500):
+        """Return {doc_id: position} for the given IDs, looked up through the doc_id index"""
+        doc_ids = list(doc_ids)
+        positions = {}
+        conn = self._connections.get()
+        for start in range(0, len(doc_ids), batch_size):
+            batch = doc_ids[start:start + batch_size]
+            positions.update(conn.execute(
+                f"SELECT doc_id, position FROM positions WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+            ))
+        return positions
+
+    def positions_with_prefix(self, prefix):
+        """Return (doc_id, position) for every ID starting with prefix, as a range scan of the doc_id index"""
+        # Every ID with the prefix sorts below the prefix with its last character incremented
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self._connections.get().execute(
+            "SELECT doc_id, position FROM positions WHERE doc_id >= ? AND doc_id < ?", (prefix, upper)
+        ).fetchall()
+
+    def update(self, other=(), **kwargs):
+        pairs = dict(other, **kwargs)
+        conn = self._connections.get()
+        conn.executemany(
+            "INSERT OR REPLACE INTO positions (position, doc_id) VALUES (?, ?)",
+            [(int(position), doc_id) for position, doc_id in pairs.items()]
+        )
+        conn.commit()
+
+def write_sqlite_docstore(path, docstore, index_to_docstore_id):
+    """Write a complete docstore and position mapping into a new SQLite file, replacing it atomically"""
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        items = sorted(index_to_docstore_id.items())
+        conn.executemany("INSERT INTO positions (position, doc_id) VALUES (?, ?)", items)
+
+        rows = []
+        for _, doc_id in items:
+            doc = docstore.search(doc_id)
+            if isinstance(doc, Document):
+                rows.append((doc_id, doc.page_content, json.dumps(doc.metadata, default=str)))
+        conn.executemany("INSERT OR REPLACE INTO documents (doc_id, text, metadata) VALUES (?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
@@ -1,35 +1,254 @@
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+import faiss
 import os
+import pickle
 import subprocess
 import logging
 import time
 from dotenv import load_dotenv
 
+from src.embedding.cache import EmbeddingCache, CachedEmbeddings
+from src.embedding.batch_embedder import BatchEmbeddingExecutor
+from src.embedding.docstore import DOCSTORE_FILE, SQLiteDocstore, SQLiteIndexMapping, write_sqlite_docstore
+from src.embedding.index_factory import (build_index, describe_index, get_index_type, read_index_meta, read_index_mmap,
+                                         supports_removal, write_index_meta)
+from src.embedding.quantization import (FLOAT_VECTORS_FILE, RescoringIndex, read_float_vectors, read_quantized_index,
+                                        write_float_vectors, write_quantized_index)
+from src.retrieval.bm25 import BM25_FILE, BM25Index
+
 load_dotenv()
 
+# Candidates fetched from quantized codes per result, for stores that do not record their own factor
+DEFAULT_RESCORE_FACTOR = 4
+
 class EmbeddingProcessor:
-    def __init__(self, model_name="text-embedding-ada-002"):
-        self.embeddings = OpenAIEmbeddings(model=model_name)
+    def __init__(self, model_name="text-embedding-ada-002", use_cache=True,
+                 cache_path="./data/embedding_cache.sqlite", cache_max_entries=500000,
+                 batch_max_tokens=50000, max_concurrency=4, max_retries=6, base_embeddings=None,
+                 storage_format="langchain", use_mmap=True, index_type="flat", index_options=None,
+                 build_sparse_index=False, quantization="none", rescore_factor=None):
         self.logger = logging.getLogger("rag-system")
         
+        # Whether a BM25 index over the same chunks is written next to the FAISS index for hybrid search
+        self.build_sparse_index = build_sparse_index
+        
+        # FAISS index built for new vector stores: flat, ivf_flat, ivf_pq or hnsw
+        self.index_type = index_type
+        self.index_options = index_options or {}
+        
+        # "int8" or "binary" saves flat indexes as quantized codes for the first-pass search plus the
+        # float vectors in a memory-mapped file for re-scoring the top rescore_factor * k candidates.
+        # rescore_factor=None uses the factor recorded in the store (DEFAULT_RESCORE_FACTOR for new stores).
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        
+        # Factor recorded in the last quantized store loaded (e.g. calibrated by quantize_store),
+        # kept for stores rebuilt from scratch so they do not fall back to the default
+        self.recorded_rescore_factor = None
+        
+        # "langchain" keeps index.faiss + index.pkl; "sqlite" keeps index.faiss + docstore.sqlite,
+        # which is loaded with a memory-mapped index and reads chunk texts only for search hits
+        self.storage_format = storage_format
+        self.use_mmap = use_mmap
+        
+        # Batch by token budget, embed batches concurrently and back off on rate limits
+        self.client = BatchEmbeddingExecutor(
+            base_embeddings or OpenAIEmbeddings(model=model_name),
+            model_name=model_name,
+            max_tokens_per_batch=batch_max_tokens,
+            max_concurrency=max_concurrency,
+            max_retries=max_retries
+        )
+        self.embeddings = self.client
+        
+        # Reuse embeddings of unchanged chunks across rebuilds
+        self.cache = None
+        if use_cache:
+            self.cache = EmbeddingCache(cache_path, max_entries=cache_max_entries)
+            self.embeddings = CachedEmbeddings(self.embeddings, self.cache, model_name)
+        
+    def get_cache_stats(self):
+        """Return embedding cache counters, or None when caching is disabled"""
+        return self.cache.get_stats() if self.cache else None
+    
+    def get_client_stats(self):
+        """Return request counters and throughput of the embedding client"""
+        return self.client.get_stats()
+        
     def create_vector_store(self, documents, store_path="./data/vector_store"):
         """Create a FAISS vector store from documents"""
-        vector_store = FAISS.from_documents(documents, self.embeddings)
+        vector_store = FAISS.from_documents(documents, self.embeddings, ids=self._chunk_ids(documents))
+        vector_store = self.apply_index_type(vector_store)
         
         # Save the vector store locally
         os.makedirs(os.path.dirname(store_path), exist_ok=True)
-        vector_store.save_local(store_path)
+        self.save_vector_store(vector_store, store_path)
+            
+        self.logger.info(f"Vector store created and saved to {store_path}")
+        return self.reopen_vector_store(vector_store, store_path)
+
+    def apply_index_type(self, vector_store):
+        """Replace the flat index of a freshly built store with the configured index type.
+        
+        Vectors are re-added in their original order, so FAISS positions and the docstore mapping stay valid.
+        """
+        if self.index_type == "flat" or get_index_type(vector_store.index) == self.index_type:
+            return vector_store
+        
+        start = time.time()
+        vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+        vector_store.index = build_index(vectors, self.index_type, **self.index_options)
+        self.logger.info(f"Built {get_index_type(vector_store.index)} index over {vector_store.index.ntotal} vectors "
+                         f"in {time.time() - start:.2f}s")
+        return vector_store
+    
+    def supports_incremental_update(self, vector_store):
+        """Chunks can only be removed in place from flat indexes; other index types need a rebuild.
+        
+        Quantized stores are flat underneath: they are updated through a writable float copy.
+        """
+        return supports_removal(vector_store.index) or isinstance(vector_store.index, RescoringIndex)
+    
+    def update_vector_store(self, vector_store, documents, remove_ids=None, store_path="./data/vector_store"):
+        """Remove stale chunks from an existing vector store, embed only the given documents and save it.
+        
+        Returns the vector store to use from now on, which is a freshly opened one for stores
+        that were loaded read-only from the SQLite format.
+        """
+        if self.is_read_only(vector_store):
+            vector_store = self.load_vector_store(store_path, writable=True)
+        
+        # Drop the vectors of modified or deleted files, ignoring IDs the index never had
+        if remove_ids:
+            existing_ids = set(vector_store.index_to_docstore_id.values())
+            stale_ids = [doc_id for doc_id in remove_ids if doc_id in existing_ids]
+            if stale_ids:
+                vector_store.delete(stale_ids)
+                self.logger.info(f"Removed {len(stale_ids)} chunks from the vector store")
+        
+        if documents:
+            vector_store.add_documents(documents, ids=self._chunk_ids(documents))
+            self.logger.info(f"Added {len(documents)} chunks to the vector store")
+        
+        self.save_vector_store(vector_store, store_path)
+        
+        self.logger.info(f"Vector store updated and saved to {store_path}")
+        return self.reopen_vector_store(vector_store, store_path)
+    
+    def save_vector_store(self, vector_store, store_path="./data/vector_store", sync=True, write_sparse=True):
+        """Save a vector store in the configured storage format and sync it to Cloud Storage.
+        
+        write_sparse=False skips (re)building the BM25 index, e.g. for intermediate checkpoints.
+        """
+        os.makedirs(store_path, exist_ok=True)
+        index_path = os.path.join(store_path, "index.faiss")
+        quantized = self.quantize_index(vector_store.index, getattr(vector_store, "rescore_factor", None))
+        if quantized is not None:
+            write_float_vectors(quantized.vectors, store_path)
+        elif os.path.exists(os.path.join(store_path, FLOAT_VECTORS_FILE)):
+            os.remove(os.path.join(store_path, FLOAT_VECTORS_FILE))
+        
+        if self.storage_format == "sqlite":
+            # Write to temporary files and swap them in so readers never see a partial file
+            if quantized is not None:
+                write_quantized_index(quantized.quantized_index, index_path)
+            else:
+                faiss.write_index(vector_store.index, index_path + ".tmp")
+                os.replace(index_path + ".tmp", index_path)
+            write_sqlite_docstore(os.path.join(store_path, DOCSTORE_FILE),
+                                  vector_store.docstore, vector_store.index_to_docstore_id)
+            stale_file = os.path.join(store_path, "index.pkl")
+        elif quantized is not None:
+            # save_local can only write float indexes; write the index.pkl it would write next to the codes
+            write_quantized_index(quantized.quantized_index, index_path)
+            pickle_path = os.path.join(store_path, "index.pkl")
+            with open(pickle_path + ".tmp", "wb") as f:
+                pickle.dump((vector_store.docstore, vector_store.index_to_docstore_id), f)
+            os.replace(pickle_path + ".tmp", pickle_path)
+            stale_file = os.path.join(store_path, DOCSTORE_FILE)
+        else:
+            vector_store.save_local(store_path)
+            stale_file = os.path.join(store_path, DOCSTORE_FILE)
+        
+        meta = describe_index(vector_store.index)
+        if quantized is not None:
+            meta.update(quantization=quantized.quantization, rescore_factor=quantized.rescore_factor,
+                        quantized_bytes=quantized.memory_bytes())
+        write_index_meta(store_path, meta)
+        
+        sparse_path = os.path.join(store_path, BM25_FILE)
+        if self.build_sparse_index and write_sparse:
+            start = time.time()
+            sparse_index = BM25Index.from_vector_store(vector_store)
+            sparse_index.save(store_path)
+            self.logger.info(f"Built BM25 index over {len(sparse_index)} chunks in {time.time() - start:.2f}s")
+        elif not self.build_sparse_index and os.path.exists(sparse_path):
+            # A BM25 index that is no longer maintained would drift out of sync with the vectors
+            os.remove(sparse_path)
+        
+        # Remove the docstore of the other format so loading never picks up stale data
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
         
         # If running in Cloud Run, also sync to Cloud Storage
-        if os.environ.get("STORAGE_BUCKET"):
+        if sync and os.environ.get("STORAGE_BUCKET"):
             self._sync_to_cloud_storage(store_path)
-            
-        self.logger.info(f"Vector store created and saved to {store_path}")
+    
+    def quantize_index(self, index, rescore_factor=None):
+        """Return the quantized form of a flat float index when quantization is configured, else None.
+        
+        The rescore factor is the configured one, else rescore_factor (the one recorded in the store
+        the index was loaded from), else the one of the last quantized store loaded.
+        """
+        if self.quantization == "none":
+            return None
+        if get_index_type(index) != "flat":
+            self.logger.warning(f"Quantization only applies to flat indexes, saving the "
+                                f"{get_index_type(index)} index unquantized")
+            return None
+        
+        start = time.time()
+        rescore_factor = (self.rescore_factor or rescore_factor or self.recorded_rescore_factor
+                          or DEFAULT_RESCORE_FACTOR)
+        quantized = RescoringIndex.from_vectors(index.reconstruct_n(0, index.ntotal), self.quantization,
+                                                rescore_factor)
+        self.logger.info(f"Quantized {quantized.ntotal} vectors to {self.quantization} "
+                         f"({quantized.memory_bytes() / 1e6:.1f}MB) in {time.time() - start:.2f}s")
+        return quantized
+    
+    def load_sparse_index(self, vector_store, store_path="./data/vector_store"):
+        """Load the BM25 index saved next to a vector store, building it if it is missing or out of date"""
+        sparse_index = BM25Index.load(store_path)
+        if sparse_index is None or len(sparse_index) != vector_store.index.ntotal:
+            self.logger.info("BM25 index is missing or out of date, building it from the vector store")
+            sparse_index = BM25Index.from_vector_store(vector_store)
+            sparse_index.save(store_path)
+        return sparse_index
+    
+    def is_read_only(self, vector_store):
+        """Return True for vector stores opened from the SQLite format or with a quantized index, which must not be modified in place"""
+        return isinstance(vector_store.docstore, SQLiteDocstore) or isinstance(vector_store.index, RescoringIndex)
+    
+    def reopen_vector_store(self, vector_store, store_path):
+        """Serve a just-saved SQLite-format or quantized store from disk instead of from the in-memory copy"""
+        if self.storage_format == "sqlite" or self.quantization != "none":
+            return self.load_vector_store(store_path) or vector_store
         return vector_store
+    
+    def _chunk_ids(self, documents):
+        """Return the chunk IDs assigned by DocumentProcessor, if every document has one"""
+        ids = [doc.metadata.get("chunk_id") for doc in documents]
+        return ids if all(ids) else None
 
-    def load_vector_store(self, store_path="./data/vector_store", allow_dangerous_deserialization=True):
-        """Load a vector store from disk or cloud storage if available"""
+    def load_vector_store(self, store_path="./data/vector_store", allow_dangerous_deserialization=True, writable=False):
+        """Load a vector store from disk or cloud storage if available.
+        
+        Stores saved in the SQLite format are opened with a memory-mapped, read-only index and a
+        docstore that is only read for search hits, unless writable=True asks for an in-memory copy.
+        Quantized stores are opened for re-scored search, or as an exact flat index when writable.
+        """
         
         # If running in Cloud Run, check if we need to sync from Cloud Storage
         if os.environ.get("STORAGE_BUCKET") and not os.path.exists(os.path.join(store_path, "index.faiss")):
@@ -42,7 +261,20 @@ class EmbeddingProcessor:
             # Wait a moment to ensure files are fully written
             time.sleep(2)
         
-        if os.path.exists(os.path.join(store_path, "index.faiss")):
+        meta = read_index_meta(store_path)
+        if meta.get("quantization", "none") != "none":
+            try:
+                return self._load_quantized_vector_store(store_path, meta, writable, allow_dangerous_deserialization)
+            except Exception as e:
+                self.logger.error(f"Error loading vector store: {str(e)}")
+                return None
+        elif os.path.exists(os.path.join(store_path, DOCSTORE_FILE)):
+            try:
+                return self._load_sqlite_vector_store(store_path, writable)
+            except Exception as e:
+                self.logger.error(f"Error loading vector store: {str(e)}")
+                return None
+        elif os.path.exists(os.path.join(store_path, "index.faiss")):
             try:
                 self.logger.info(f"Loading vector store from {store_path}")
                 vector_store = FAISS.load_local(
@@ -59,6 +291,81 @@ class EmbeddingProcessor:
             self.logger.warning(f"No vector store found at {store_path}")
             return None
             
+    def _load_sqlite_vector_store(self, store_path, writable=False):
+        """Open a vector store saved in the SQLite format"""
+        start = time.time()
+        index_path = os.path.join(store_path, "index.faiss")
+        docstore_path = os.path.join(store_path, DOCSTORE_FILE)
+        
+        if writable:
+            index, mode = faiss.read_index(index_path), "writable"
+        else:
+            index, mode = self._read_index_mmap(index_path)
+        docstore, index_to_docstore_id = self._open_sqlite_docstore(docstore_path, writable)
+        
+        vector_store = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id
+        )
+        self.logger.info(f"Opened vector store from {store_path} ({index.ntotal} vectors, "
+                         f"{mode}) in {time.time() - start:.3f}s")
+        return vector_store
+    
+    def _open_sqlite_docstore(self, docstore_path, writable=False):
+        """Return the docstore and position mapping of a SQLite-format store, copied into memory when writable"""
+        if writable:
+            sqlite_docstore = SQLiteDocstore(docstore_path, read_only=True)
+            docstore = InMemoryDocstore(dict(sqlite_docstore.iter_documents()))
+            return docstore, dict(SQLiteIndexMapping(docstore_path, read_only=True).items())
+        return SQLiteDocstore(docstore_path, read_only=True), SQLiteIndexMapping(docstore_path, read_only=True)
+    
+    def _load_quantized_vector_store(self, store_path, meta, writable=False, allow_dangerous_deserialization=True):
+        """Open a vector store whose index was saved as quantized codes plus float vectors"""
+        start = time.time()
+        quantization = meta["quantization"]
+        if writable:
+            # Updates go to an exact flat index rebuilt from the float vectors, quantized again on save
+            vectors = read_float_vectors(store_path, mmap=False)
+            index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+        else:
+            index = RescoringIndex(
+                read_quantized_index(os.path.join(store_path, "index.faiss"), quantization, mmap=self.use_mmap),
+                read_float_vectors(store_path, mmap=self.use_mmap),
+                quantization,
+                self.rescore_factor or meta.get("rescore_factor", DEFAULT_RESCORE_FACTOR)
+            )
+        
+        docstore_path = os.path.join(store_path, DOCSTORE_FILE)
+        if os.path.exists(docstore_path):
+            docstore, index_to_docstore_id = self._open_sqlite_docstore(docstore_path, writable)
+        else:
+            if not allow_dangerous_deserialization:
+                raise ValueError("Loading index.pkl requires allow_dangerous_deserialization=True")
+            with open(os.path.join(store_path, "index.pkl"), "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+        
+        vector_store = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id
+        )
+        # Carried through writable copies so saving them keeps the calibrated factor
+        vector_store.rescore_factor = meta.get("rescore_factor")
+        self.recorded_rescore_factor = meta.get("rescore_factor") or self.recorded_rescore_factor
+        self.logger.info(f"Opened {quantization} vector store from {store_path} ({index.ntotal} vectors, "
+                         f"{'writable' if writable else 'rescored'}) in {time.time() - start:.3f}s")
+        return vector_store
+    
+    def _read_index_mmap(self, index_path):
+        """Open a FAISS index read-only, memory-mapped where faiss supports it; returns (index, mode)"""
+        if self.use_mmap:
+            return read_index_mmap(index_path)
+        return faiss.read_index(index_path), "read fully"
+    
     def _sync_to_cloud_storage(self, local_path):
         """Sync local vector store to Cloud Storage"""
         bucket = os.environ.get("STORAGE_BUCKET")
@@ -91,7 +398,7 @@ class EmbeddingProcessor:
             files = os.listdir(local_path)
             self.logger.info(f"Files in {local_path} after download: {files}")
             
-            return "index.faiss" in files and "index.pkl" in files
+            return "index.faiss" in files and ("index.pkl" in files or DOCSTORE_FILE in files)
         except subprocess.CalledProcessError as e:
             self.logger.error(f"Failed to sync from Cloud Storage: {str(e)}, {e.stderr}")
             return False
\ No newline at end of file
@@ -0,0 +1,216 @@
+from datetime import datetime
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+# langchain and FAISS are only imported by the functions that build stores, so the API can
+# import this module (and serve probes) before those libraries have loaded
+
+logger = logging.getLogger("rag-system")
+
+CURRENT_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+BUILD_STATUS_FILE = "build_status.json"
+
+class GenerationStore:
+    """Versioned vector store directories under one root.
+
+    Every rebuild writes a complete store into a new generations/<id> directory and only
+    then points the CURRENT file at it, so the serving store is never modified while it is
+    being read. Roots without a CURRENT file are served directly (the pre-generations layout).
+    """
+
+    def __init__(self, root="./data/vector_store"):
+        self.root = root
+        self.generations_dir = os.path.join(root, GENERATIONS_DIR)
+
+    def current_generation(self):
+        """Return the name of the published generation, or None for the legacy layout"""
+        current_file = os.path.join(self.root, CURRENT_FILE)
+        if not os.path.exists(current_file):
+            return None
+        with open(current_file, "r") as f:
+            name = f.read().strip()
+        return name if name and os.path.isdir(os.path.join(self.generations_dir, name)) else None
+
+    def current_path(self):
+        """Return the directory of the store that should be served"""
+        name = self.current_generation()
+        return os.path.join(self.generations_dir, name) if name else self.root
+
+    def new_generation_path(self, resume=True):
+        """Create the directory for a new generation.
+
+        With resume=True an unpublished generation left behind by an interrupted streaming
+        build is reused, so the ingestion checkpoint inside it can pick up where it stopped.
+        """
+        if resume:
+            resumable = self._resumable_generation()
+            if resumable:
+                logger.info(f"Resuming interrupted build of generation {resumable}")
+                return os.path.join(self.generations_dir, resumable)
+
+        name = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = os.path.join(self.generations_dir, name)
+        os.makedirs(path)
+        return path
+
+    def is_resumable(self, path):
+        """Return True if the generation at path holds an ingestion checkpoint a later build can resume"""
+        from src.embedding.pipeline import CHECKPOINT_FILE
+        
+        return os.path.exists(os.path.join(path, CHECKPOINT_FILE))
+
+    def _resumable_generation(self):
+        current = self.current_generation()
+        for name in sorted(self._generation_names(), reverse=True):
+            if name != current and self.is_resumable(os.path.join(self.generations_dir, name)):
+                return name
+        return None
+
+    def _generation_names(self):
+        if not os.path.isdir(self.generations_dir):
+            return []
+        return [name for name in os.listdir(self.generations_dir)
+                if os.path.isdir(os.path.join(self.generations_dir, name))]
+
+    def publish(self, path):
+        """Atomically make the generation at path the one that is served"""
+        current_file = os.path.join(self.root, CURRENT_FILE)
+        with open(current_file + ".tmp", "w") as f:
+            f.write(os.path.basename(os.path.normpath(path)))
+        os.replace(current_file + ".tmp", current_file)
+
+    def remove(self, path):
+        """Delete a generation directory that is no longer served (never the legacy root)"""
+        path = os.path.normpath(path)
+        if os.path.dirname(path) != os.path.normpath(self.generations_dir):
+            return
+        if os.path.basename(path) == self.current_generation():
+            return
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Removed vector store generation {os.path.basename(path)}")
+
+    def copy_current(self):
+        """Copy the served store into a new generation, e.g. as the base of an incremental update"""
+        path = self.new_generation_path(resume=False)
+        source = self.current_path()
+        for name in os.listdir(source):
+            source_path = os.path.join(source, name)
+            if os.path.isfile(source_path) and name not in (CURRENT_FILE, BUILD_STATUS_FILE):
+                shutil.copy2(source_path, os.path.join(path, name))
+        return path
+
+class BuildProgress:
+    """Progress of a vector store build, persisted as JSON so it can be read from another process"""
+
+    def __init__(self, path=None, min_interval=0.5, state=None):
+        self.path = path
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self.state = dict(state or {})
+
+    def update(self, force=False, **fields):
+        """Merge fields into the progress; writes are throttled unless the phase changes or force is set"""
+        with self._lock:
+            force = force or fields.get("phase", self.state.get("phase")) != self.state.get("phase")
+            self.state.update(fields)
+            self.state["updated_at"] = datetime.now().isoformat()
+            if self.path and (force or time.time() - self._last_write >= self.min_interval):
+                with open(self.path + ".tmp", "w") as f:
+                    json.dump(self.state, f)
+                os.replace(self.path + ".tmp", self.path)
+                self._last_write = time.time()
+
+    @staticmethod
+    def read(path):
+        """Read the last persisted progress, or an empty dict"""
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+def report_ingestion(doc_processor):
+    """Log per-file ingestion timings and return the data-dir relative paths of files that failed"""
+    timings = sorted(doc_processor.file_timings, key=lambda timing: timing["seconds"], reverse=True)
+    for timing in timings[:5]:
+        logger.info(f"  {timing['path']}: {timing['seconds']:.2f}s")
+
+    failed_files = set()
+    for timing in timings:
+        if timing["error"]:
+            logger.error(f"Failed to ingest {timing['path']}: {timing['error']}")
+            failed_files.add(os.path.relpath(timing["path"], doc_processor.data_dir))
+    return failed_files
+
+def group_chunk_ids(chunks):
+    """Return the chunk IDs of each data-dir relative path"""
+    from src.document_processing.loader import chunk_id_source
+
+    chunk_ids_by_file = {}
+    for chunk in chunks:
+        chunk_id = chunk.metadata.get("chunk_id")
+        if chunk_id:
+            chunk_ids_by_file.setdefault(chunk_id_source(chunk_id), []).append(chunk_id)
+    return chunk_ids_by_file
+
+def build_store(embedder, doc_processor, file_paths, store_path, streaming=False, batch_size=64, progress=None):
+    """Ingest files into a new vector store at store_path.
+
+    Returns the vector store (None when nothing could be ingested), the chunk IDs of each
+    file and the set of files that failed to ingest.
+    """
+    from src.embedding.pipeline import StreamingIngestionPipeline
+
+    progress = progress or BuildProgress()
+    progress.update(phase="loading", files_total=len(file_paths), files_done=0, chunks=0)
+
+    # Stream files through a bounded pipeline instead of holding the whole corpus in memory
+    if streaming:
+        pipeline = StreamingIngestionPipeline(doc_processor, embedder, store_path=store_path, batch_size=batch_size)
+        vector_store, chunk_ids_by_file, failed = pipeline.run(
+            file_paths,
+            progress_callback=lambda done, total, chunks: progress.update(
+                phase="ingesting", files_done=done, files_total=total, chunks=chunks
+            )
+        )
+        failed_files = {os.path.relpath(path, doc_processor.data_dir) for path in failed}
+        progress.update(phase="built", chunks=sum(len(ids) for ids in chunk_ids_by_file.values()))
+        return vector_store, chunk_ids_by_file, failed_files
+
+    chunks = doc_processor.process_files(
+        file_paths,
+        progress_callback=lambda done, total: progress.update(files_done=done, files_total=total)
+    )
+    failed_files = report_ingestion(doc_processor)
+    if not chunks:
+        return None, {}, failed_files
+
+    progress.update(phase="embedding", chunks=len(chunks))
+    vector_store = embedder.create_vector_store(chunks, store_path)
+    progress.update(phase="built")
+    return vector_store, group_chunk_ids(chunks), failed_files
+
+def build_generation(store_path, file_paths, embedder_options, processor_options, streaming=False,
+                     batch_size=64, progress_path=None, progress_state=None):
+    """Entry point for building a generation in a separate process.
+
+    The store is written to store_path; only the chunk IDs per file and the failed files are
+    returned, and the caller opens the store from disk. progress_state is the parent's build
+    progress, which the child keeps updating so the persisted status stays complete.
+    """
+    from src.document_processing.loader import DocumentProcessor
+    from src.embedding.embedder import EmbeddingProcessor
+
+    embedder = EmbeddingProcessor(**embedder_options)
+    doc_processor = DocumentProcessor(**processor_options)
+    progress = BuildProgress(progress_path, state=progress_state)
+    vector_store, chunk_ids_by_file, failed_files = build_store(
+        embedder, doc_processor, file_paths, store_path, streaming, batch_size, progress
+    )
+    return vector_store is not None, chunk_ids_by_file, failed_files
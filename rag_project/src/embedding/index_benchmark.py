@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# Add the project root to sys.path so the src package can be imported
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, project_root)
+
+from src.embedding.generations import GenerationStore
+from src.embedding.index_factory import build_index, get_index_type, make_search_parameters, read_index_meta
+from src.embedding.quantization import read_float_vectors
+
+NPROBE_SWEEP = (1, 4, 16, 64)
+EF_SEARCH_SWEEP = (16, 32, 64, 128)
+
+def load_vectors(store_path):
+    """Read every vector of a saved store back out of its index.faiss (or the float vectors of a quantized store)"""
+    if read_index_meta(store_path).get("quantization", "none") != "none":
+        return np.array(read_float_vectors(store_path, mmap=False))
+    index = faiss.read_index(os.path.join(store_path, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+def sample_queries(vectors, num_queries, noise=0.01, seed=0):
+    """Use perturbed copies of stored vectors as queries, so the sweep needs no embedding API calls"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, noise, size=(len(picks), vectors.shape[1])).astype(np.float32)
+    return np.ascontiguousarray(queries, dtype=np.float32)
+
+def recall_at_k(found, truth):
+    """Fraction of the exact top-k neighbours that the approximate search returned"""
+    hits = sum(len(set(row[row >= 0]) & set(true_row)) for row, true_row in zip(found, truth))
+    return hits / truth.size
+
+def measure(index, queries, truth, k, search_parameters=None):
+    """Search queries one at a time, as the API does, and report recall and latency percentiles"""
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        if search_parameters is None:
+            _, positions = index.search(query.reshape(1, -1), k)
+        else:
+            _, positions = index.search(query.reshape(1, -1), k, params=search_parameters)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(positions[0])
+
+    latencies = np.array(latencies)
+    return {
+        "recall_at_k": round(recall_at_k(np.array(found), truth), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+        "latency_ms_mean": round(float(latencies.mean()), 4)
+    }
+
+def run_benchmark(vectors, index_types, k=5, num_queries=200, index_options=None):
+    """Compare each index type (and its search-parameter sweep) against exact flat search"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = sample_queries(vectors, num_queries)
+    index_options = index_options or {}
+
+    flat = build_index(vectors, "flat")
+    _, truth = flat.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        start = time.time()
+        index = build_index(vectors, index_type, **index_options)
+        build_seconds = time.time() - start
+        built_type = get_index_type(index)
+
+        base = {
+            "requested_type": index_type,
+            "index_type": built_type,
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": int(faiss.serialize_index(index).size)
+        }
+        if built_type in ("ivf_flat", "ivf_pq"):
+            sweep = [("nprobe", value, make_search_parameters(index, nprobe=value)) for value in NPROBE_SWEEP]
+        elif built_type == "hnsw":
+            sweep = [("ef_search", value, make_search_parameters(index, ef_search=value)) for value in EF_SEARCH_SWEEP]
+        else:
+            sweep = [(None, None, None)]
+
+        for param_name, value, search_parameters in sweep:
+            row = dict(base)
+            if param_name:
+                row[param_name] = value
+            row.update(measure(index, queries, truth, k, search_parameters))
+            results.append(row)
+
+    return {
+        "num_vectors": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]),
+        "num_queries": int(len(queries)),
+        "k": k,
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall@k and latency of ANN index types against flat search")
+    parser.add_argument("--store_path", help="Vector store whose vectors are benchmarked (default: the published generation)")
+    parser.add_argument("--index_types", nargs="+", default=["flat", "ivf_flat", "ivf_pq", "hnsw"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--num_queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = about 4 * sqrt(n))")
+    parser.add_argument("--pq_m", type=int, default=16)
+    parser.add_argument("--hnsw_m", type=int, default=32)
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.store_path or GenerationStore().current_path())
+    report = run_benchmark(
+        vectors,
+        args.index_types,
+        k=args.k,
+        num_queries=args.num_queries,
+        index_options={"nlist": args.nlist, "pq_m": args.pq_m, "hnsw_m": args.hnsw_m}
+    )
+
+    for row in report["results"]:
+        param = f"nprobe={row['nprobe']}" if "nprobe" in row else f"ef_search={row['ef_search']}" if "ef_search" in row else "exact"
+        print(f"{row['index_type']:>8} {param:>14}  recall@{args.k}={row['recall_at_k']:.3f}  "
+              f"p50={row['latency_ms_p50']:.3f}ms  p95={row['latency_ms_p95']:.3f}ms  "
+              f"size={row['index_bytes'] / 1e6:.1f}MB", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
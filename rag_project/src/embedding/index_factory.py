@@ -0,0 +1,144 @@
+from datetime import datetime
+import json
+import logging
+import math
+import os
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger("rag-system")
+
+INDEX_META_FILE = "index_meta.json"
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# FAISS wants roughly this many training points per IVF list / PQ centroid
+MIN_POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256
+
+def default_nlist(num_vectors):
+    """Pick the number of IVF lists for a corpus size (about 4 * sqrt(n))"""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_CENTROID))
+
+def build_index(vectors, index_type="flat", nlist=0, pq_m=16, hnsw_m=32, ef_construction=200,
+                train_sample_size=50000, seed=0):
+    """Build and fill a FAISS index of the given type, training it on a random sample when needed.
+
+    Corpora too small to train an IVF or PQ quantizer fall back to the next simpler index type.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    nlist = nlist or default_nlist(num_vectors)
+    if index_type == "ivf_pq" and (dim % pq_m != 0 or num_vectors < PQ_CENTROIDS * MIN_POINTS_PER_CENTROID):
+        logger.warning(f"Cannot train IVF-PQ (m={pq_m}) on {num_vectors} vectors of dim {dim}, using IVF-Flat")
+        index_type = "ivf_flat"
+    if index_type == "ivf_flat" and num_vectors < nlist * MIN_POINTS_PER_CENTROID:
+        logger.warning(f"Too few vectors ({num_vectors}) to train {nlist} IVF lists, using a flat index")
+        index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8)
+
+        # Train on a random sample so training time does not grow with the corpus
+        sample = vectors
+        if num_vectors > train_sample_size:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(num_vectors, train_sample_size, replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    return index
+
+def get_index_type(index):
+    """Return the index type name of a FAISS index"""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def describe_index(index):
+    """Return the metadata persisted with an index: its type, size and build parameters"""
+    index_type = get_index_type(index)
+    meta = {
+        "index_type": index_type,
+        "dim": int(index.d),
+        "ntotal": int(index.ntotal),
+        "saved_at": datetime.now().isoformat()
+    }
+    if index_type in ("ivf_flat", "ivf_pq"):
+        meta["nlist"] = int(faiss.extract_index_ivf(index).nlist)
+    if index_type == "ivf_pq":
+        meta["pq_m"] = int(index.pq.M)
+    if index_type == "hnsw":
+        meta["hnsw_m"] = int(index.hnsw.nb_neighbors(1))
+        meta["ef_construction"] = int(index.hnsw.efConstruction)
+    return meta
+
+def supports_removal(index):
+    """Only flat indexes keep FAISS positions contiguous after remove_ids, as LangChain's FAISS.delete expects"""
+    return isinstance(index, faiss.IndexFlat)
+
+def read_index_mmap(path):
+    """Read a FAISS index read-only with as much of it memory-mapped as this faiss version allows.
+
+    IO_FLAG_MMAP alone only maps the inverted lists of IVF indexes; the codes of flat, HNSW and
+    scalar quantizer indexes are only mapped with IO_FLAG_MMAP_IFC, which faiss 1.10 added. Returns
+    (index, mode), where mode is "memory-mapped" or "read fully" depending on what actually happened.
+    """
+    mmap_ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | (mmap_ifc or 0)
+    try:
+        index = faiss.read_index(path, io_flags)
+    except RuntimeError as e:
+        logger.warning(f"Could not memory-map {path}, reading it fully: {str(e)}")
+        return faiss.read_index(path), "read fully"
+    if mmap_ifc is None and not isinstance(index, faiss.IndexIVF):
+        return index, "read fully"
+    return index, "memory-mapped"
+
+def make_search_parameters(index, nprobe=None, ef_search=None, selector=None):
+    """Build per-call FAISS search parameters, so tuning one query never changes the shared index.
+
+    selector is an optional faiss.IDSelector restricting the search to allowed positions.
+    """
+    params = {"sel": selector} if selector is not None else {}
+    index_type = get_index_type(index)
+    if index_type in ("ivf_flat", "ivf_pq") and nprobe:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe), **params)
+    if index_type == "hnsw" and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search), **params)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(**params) if params else None
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(**params) if params else None
+    return faiss.SearchParameters(**params) if params else None
+
+def write_index_meta(store_path, meta):
+    """Persist how the index was built next to index.faiss"""
+    meta_path = os.path.join(store_path, INDEX_META_FILE)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+
+def read_index_meta(store_path):
+    """Return the persisted index metadata, or an empty dict for stores built before it existed"""
+    meta_path = os.path.join(store_path, INDEX_META_FILE)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, "r") as f:
+        return json.load(f)
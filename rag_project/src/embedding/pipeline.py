@@ -0,0 +1,316 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from src.document_processing.loader import chunk_id_source
+
+logger = logging.getLogger("rag-system")
+
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+SEGMENTS_DIR = "ingest_segments"
+
+# Markers passed between stages alongside chunk batches
+_FILE_DONE = "file_done"
+_FILE_FAILED = "file_failed"
+_BATCH = "batch"
+_END = "end"
+_ERROR = "error"
+
+def file_signature(path):
+    """Size and modification time of a file, to detect edits made after it was checkpointed"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+class StreamingIngestionPipeline:
+    """Generator-based ingestion from files to FAISS with a bounded buffer between stages.
+
+    Files are loaded page by page, split into chunks, embedded in batches and added to the
+    index with add_embeddings, so only a few batches are in flight at any time. Progress is
+    checkpointed every few files by appending the chunks and vectors added since the previous
+    checkpoint as a new segment, so checkpoint I/O stays proportional to the new data; an
+    interrupted run rebuilds its partial index from the segments and resumes from there.
+    """
+
+    def __init__(self, doc_processor, embedder, store_path="./data/vector_store",
+                 batch_size=64, buffer_size=4, checkpoint_every=20):
+        self.doc_processor = doc_processor
+        self.embedder = embedder
+        self.store_path = store_path
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_path = os.path.join(store_path, CHECKPOINT_FILE)
+        self.segments_dir = os.path.join(store_path, SEGMENTS_DIR)
+        self._segments = 0
+        self._unsaved = []
+
+    def run(self, file_paths, resume=True, progress_callback=None):
+        """Ingest the files and return (vector_store, chunk IDs per file, failed files).
+
+        progress_callback, if given, is called with (files done, total files, chunks added) after each file.
+        """
+        start = time.time()
+        self._segments = 0
+        self._unsaved = []
+        vector_store, completed, signatures = self._restore(file_paths) if resume else (None, {}, {})
+        pending_files = [path for path in file_paths if self._rel_path(path) not in completed]
+        if completed:
+            logger.info(f"Resuming ingestion: {len(completed)} files already done, {len(pending_files)} to go")
+
+        stop_event = threading.Event()
+        chunk_queue = queue.Queue(maxsize=self.buffer_size)
+        embedded_queue = queue.Queue(maxsize=self.buffer_size)
+        stages = [
+            threading.Thread(target=self._produce_chunks, args=(pending_files, chunk_queue, stop_event), daemon=True),
+            threading.Thread(target=self._embed_batches, args=(chunk_queue, embedded_queue, stop_event), daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+
+        failed_files = {}
+        files_since_checkpoint = 0
+        chunk_count = 0
+        try:
+            while True:
+                kind, payload = embedded_queue.get()
+                if kind == _END:
+                    break
+                if kind == _ERROR:
+                    raise payload
+                if kind == _BATCH:
+                    chunks, vectors = payload
+                    vector_store = self._add_batch(vector_store, chunks, vectors)
+                    chunk_count += len(chunks)
+                elif kind == _FILE_FAILED:
+                    path, error, chunk_ids = payload
+                    failed_files[path] = error
+                    logger.error(f"Failed to ingest {path}: {error}")
+                    self._remove_chunks(vector_store, chunk_ids)
+                    if progress_callback:
+                        progress_callback(len(completed) + len(failed_files), len(file_paths), chunk_count)
+                elif kind == _FILE_DONE:
+                    path, chunk_ids, signature = payload
+                    completed[self._rel_path(path)] = chunk_ids
+                    signatures[self._rel_path(path)] = signature
+                    files_since_checkpoint += 1
+                    if progress_callback:
+                        progress_callback(len(completed) + len(failed_files), len(file_paths), chunk_count)
+                    if files_since_checkpoint >= self.checkpoint_every:
+                        self._checkpoint(completed, signatures)
+                        files_since_checkpoint = 0
+        finally:
+            # Unblock the other stages if the writer stops early
+            stop_event.set()
+            for stage in stages:
+                stage.join(timeout=1)
+
+        if vector_store is not None:
+            vector_store = self.embedder.apply_index_type(vector_store)
+            self.embedder.save_vector_store(vector_store, self.store_path)
+            vector_store = self.embedder.reopen_vector_store(vector_store, self.store_path)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        shutil.rmtree(self.segments_dir, ignore_errors=True)
+
+        logger.info(f"Streaming ingestion added {chunk_count} chunks from {len(pending_files)} files "
+                    f"in {time.time() - start:.2f}s ({len(failed_files)} failed)")
+        return vector_store, completed, failed_files
+
+    def _rel_path(self, file_path):
+        return os.path.relpath(file_path, self.doc_processor.data_dir)
+
+    def _put(self, target_queue, item, stop_event):
+        """Put an item on a bounded queue, giving up once the pipeline is stopping"""
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce_chunks(self, file_paths, chunk_queue, stop_event):
+        """Stage 1: stream chunks file by file into full batches.
+
+        File markers are held back until the batch holding the last chunks of the file has
+        been queued, so the writer only sees a file as done once all of its chunks are indexed.
+        """
+        batch = []
+        pending_markers = []
+
+        def flush():
+            nonlocal batch
+            if batch:
+                if not self._put(chunk_queue, (_BATCH, batch), stop_event):
+                    return False
+                batch = []
+            for marker in pending_markers:
+                if not self._put(chunk_queue, marker, stop_event):
+                    return False
+            pending_markers.clear()
+            return True
+
+        try:
+            for path in file_paths:
+                chunk_ids = []
+                # Taken before reading, so an edit made while the file is ingested is caught on resume
+                signature = file_signature(path)
+                try:
+                    for chunk in self.doc_processor.iter_file_chunks(path):
+                        chunk_ids.append(chunk.metadata["chunk_id"])
+                        batch.append(chunk)
+                        if len(batch) >= self.batch_size and not flush():
+                            return
+                    pending_markers.append((_FILE_DONE, (path, chunk_ids, signature)))
+                except Exception as e:
+                    # Drop the unsent chunks of the failed file; the writer removes any already indexed
+                    failed_ids = set(chunk_ids)
+                    batch = [chunk for chunk in batch if chunk.metadata["chunk_id"] not in failed_ids]
+                    pending_markers.append((_FILE_FAILED, (path, str(e), chunk_ids)))
+            if flush():
+                self._put(chunk_queue, (_END, None), stop_event)
+        except Exception as e:
+            self._put(chunk_queue, (_ERROR, e), stop_event)
+
+    def _embed_batches(self, chunk_queue, embedded_queue, stop_event):
+        """Stage 2: embed chunk batches and pass file markers through in order"""
+        try:
+            while not stop_event.is_set():
+                try:
+                    kind, payload = chunk_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if kind == _BATCH:
+                    vectors = self.embedder.embeddings.embed_documents([chunk.page_content for chunk in payload])
+                    payload = (payload, vectors)
+                if not self._put(embedded_queue, (kind, payload), stop_event):
+                    return
+                if kind in (_END, _ERROR):
+                    return
+        except Exception as e:
+            self._put(embedded_queue, (_ERROR, e), stop_event)
+
+    def _add_batch(self, vector_store, chunks, vectors):
+        """Stage 3: add an embedded batch to the index, creating it on the first batch"""
+        text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)]
+        metadatas = [chunk.metadata for chunk in chunks]
+        ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+        self._unsaved.append((chunks, vectors))
+        if vector_store is None:
+            return FAISS.from_embeddings(text_embeddings, self.embedder.embeddings, metadatas=metadatas, ids=ids)
+        vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return vector_store
+
+    def _remove_chunks(self, vector_store, chunk_ids):
+        """Delete the chunks of a failed file that were already added to the index"""
+        if vector_store is None or not chunk_ids:
+            return
+        existing_ids = set(vector_store.index_to_docstore_id.values())
+        stale_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in existing_ids]
+        if stale_ids:
+            vector_store.delete(stale_ids)
+
+    def _checkpoint(self, completed, signatures):
+        """Append the chunks added since the last checkpoint as a segment, then persist the completed files"""
+        if self._unsaved:
+            chunks = [chunk for batch, _ in self._unsaved for chunk in batch]
+            vectors = [vector for _, batch_vectors in self._unsaved for vector in batch_vectors]
+            self._write_segment(self._segments, chunks, vectors)
+            self._segments += 1
+            self._unsaved = []
+        self._write_checkpoint(completed, signatures)
+        logger.info(f"Ingestion checkpoint saved after {len(completed)} files ({self._segments} segments)")
+
+    def _write_checkpoint(self, completed, signatures):
+        # Segments beyond the recorded count are from a checkpoint that did not finish and are ignored
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"completed": completed, "signatures": signatures, "segments": self._segments,
+                       "saved_at": time.time()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _segment_path(self, number):
+        return os.path.join(self.segments_dir, f"segment-{number:05d}")
+
+    def _write_segment(self, number, chunks, vectors):
+        """Write chunks with their vectors as one segment file pair"""
+        os.makedirs(self.segments_dir, exist_ok=True)
+        base = self._segment_path(number)
+        with open(base + ".jsonl.tmp", "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps({"text": chunk.page_content, "metadata": chunk.metadata}, default=str) + "\n")
+        with open(base + ".npy.tmp", "wb") as f:
+            np.save(f, np.asarray(vectors, dtype=np.float32))
+        os.replace(base + ".jsonl.tmp", base + ".jsonl")
+        os.replace(base + ".npy.tmp", base + ".npy")
+
+    def _read_segment(self, number):
+        base = self._segment_path(number)
+        with open(base + ".jsonl", "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        vectors = np.load(base + ".npy")
+        if len(records) != len(vectors):
+            raise ValueError(f"segment {number} is incomplete")
+        return records, vectors
+
+    def _restore(self, file_paths):
+        """Rebuild the partial index of a previous interrupted run from its checkpoint segments.
+
+        Completed files that are no longer requested or were modified since they were checkpointed
+        are dropped (and re-ingested), as are the chunks of the file that was in flight. The kept
+        chunks are compacted into a single segment. Returns (vector_store, completed, signatures).
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None, {}, {}
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            completed = checkpoint["completed"]
+            signatures = checkpoint.get("signatures", {})
+
+            requested = {self._rel_path(path): path for path in file_paths}
+            for rel_path in list(completed):
+                if rel_path not in requested or signatures.get(rel_path) != file_signature(requested[rel_path]):
+                    completed.pop(rel_path)
+                    signatures.pop(rel_path, None)
+
+            # Later segments hold the newer copy of a chunk
+            kept = {}
+            for number in range(checkpoint["segments"]):
+                records, vectors = self._read_segment(number)
+                for record, vector in zip(records, vectors):
+                    chunk_id = record["metadata"]["chunk_id"]
+                    if chunk_id_source(chunk_id) in completed:
+                        kept[chunk_id] = (record, vector)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable ingestion checkpoint: {str(e)}")
+            return None, {}, {}
+
+        vector_store = None
+        if kept:
+            records = [record for record, _ in kept.values()]
+            vectors = np.asarray([vector for _, vector in kept.values()], dtype=np.float32)
+            vector_store = FAISS.from_embeddings(
+                [(record["text"], vector.tolist()) for record, vector in zip(records, vectors)],
+                self.embedder.embeddings,
+                metadatas=[record["metadata"] for record in records],
+                ids=list(kept)
+            )
+            self._write_segment(0, [Document(page_content=record["text"], metadata=record["metadata"])
+                                    for record in records], vectors)
+            self._segments = 1
+        self._write_checkpoint(completed, signatures)
+        if completed:
+            logger.info(f"Restored {len(kept)} chunks of {len(completed)} files from the ingestion checkpoint")
+        return vector_store, completed, signatures
@@ -0,0 +1,148 @@
+import logging
+import os
+
+import faiss
+import numpy as np
+
+from src.embedding.index_factory import read_index_mmap
+
+logger = logging.getLogger("rag-system")
+
+QUANTIZATION_TYPES = ("none", "int8", "binary")
+FLOAT_VECTORS_FILE = "vectors.f32.npy"
+
+def binarize(vectors):
+    """Pack the sign of every dimension into bits (dimensions padded to a multiple of 8)"""
+    return np.packbits(np.asarray(vectors, dtype=np.float32) > 0, axis=1)
+
+def build_quantized_index(vectors, quantization, train_sample_size=50000, seed=0):
+    """Build the compact first-pass index over float vectors: int8 scalar or binary (sign) codes"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    if quantization == "binary":
+        index = faiss.IndexBinaryFlat(8 * ((dim + 7) // 8))
+        index.add(binarize(vectors))
+        return index
+    if quantization != "int8":
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATION_TYPES[1:]}")
+
+    # The scalar quantizer only learns the range of each dimension, so a sample is plenty
+    index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    sample = vectors
+    if num_vectors > train_sample_size:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(num_vectors, train_sample_size, replace=False)]
+    index.train(sample)
+    index.add(vectors)
+    return index
+
+def is_binary_index(index):
+    return isinstance(index, faiss.IndexBinary)
+
+def write_quantized_index(index, path):
+    """Write a first-pass index, replacing the file atomically"""
+    if is_binary_index(index):
+        faiss.write_index_binary(index, path + ".tmp")
+    else:
+        faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def read_quantized_index(path, quantization, mmap=False):
+    """Read a first-pass index written by write_quantized_index"""
+    if quantization == "binary":
+        return faiss.read_index_binary(path)
+    if mmap:
+        index, mode = read_index_mmap(path)
+        logger.info(f"Quantized index {path} {mode}")
+        return index
+    return faiss.read_index(path)
+
+def write_float_vectors(vectors, store_path):
+    """Write the float vectors used for re-scoring as a .npy file that can be memory-mapped"""
+    path = os.path.join(store_path, FLOAT_VECTORS_FILE)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(path + ".tmp", path)
+
+def read_float_vectors(store_path, mmap=True):
+    return np.load(os.path.join(store_path, FLOAT_VECTORS_FILE), mmap_mode="r" if mmap else None)
+
+class RescoringIndex:
+    """Read-only stand-in for a flat FAISS L2 index that searches quantized codes first.
+
+    The first pass fetches rescore_factor * k candidates from the int8 or binary index kept in
+    memory; those candidates are then re-ranked by exact squared L2 distance against the float
+    vectors, which are usually a memory-mapped .npy file so only the candidate rows are read.
+    search() returns the same (distances, positions) as IndexFlatL2.search, so LangChain's FAISS
+    wrapper, search_vector_store and the IDSelector filters work unchanged.
+    """
+
+    def __init__(self, quantized_index, vectors, quantization, rescore_factor=4):
+        self.quantized_index = quantized_index
+        self.vectors = vectors
+        self.quantization = quantization
+        self.rescore_factor = max(1, int(rescore_factor))
+        self.d = int(vectors.shape[1])
+        self.ntotal = int(vectors.shape[0])
+        self.metric_type = faiss.METRIC_L2
+
+    @classmethod
+    def from_vectors(cls, vectors, quantization, rescore_factor=4, **kwargs):
+        """Quantize float vectors held in memory"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        return cls(build_quantized_index(vectors, quantization, **kwargs), vectors, quantization, rescore_factor)
+
+    def memory_bytes(self):
+        """Size of the in-memory first-pass codes"""
+        return int(self.quantized_index.ntotal * self.quantized_index.code_size)
+
+    def reconstruct(self, position):
+        return np.array(self.vectors[position], dtype=np.float32)
+
+    def reconstruct_n(self, start, count):
+        return np.array(self.vectors[start:start + count], dtype=np.float32)
+
+    def _candidates(self, queries, fetch_k, params):
+        """First-pass positions, fetch_k per query (-1 padded)"""
+        if not is_binary_index(self.quantized_index):
+            if params is None:
+                return self.quantized_index.search(queries, fetch_k)[1]
+            return self.quantized_index.search(queries, fetch_k, params=params)[1]
+
+        # Binary indexes take no IDSelector, so an allow list is applied to the candidates,
+        # fetching more of them for the rows where too few are allowed
+        codes = binarize(queries)
+        positions = self.quantized_index.search(codes, fetch_k)[1]
+        selector = getattr(params, "sel", None) if params is not None else None
+        if selector is None:
+            return positions
+        rows = []
+        for code, row in zip(codes, positions):
+            row_fetch_k = fetch_k
+            while True:
+                allowed = [position for position in row if position >= 0 and selector.is_member(int(position))]
+                if len(allowed) >= fetch_k or row_fetch_k >= self.ntotal:
+                    break
+                row_fetch_k = min(row_fetch_k * 4, self.ntotal)
+                row = self.quantized_index.search(code.reshape(1, -1), row_fetch_k)[1][0]
+            rows.append(allowed[:fetch_k] + [-1] * (fetch_k - len(allowed[:fetch_k])))
+        return np.asarray(rows, dtype=np.int64)
+
+    def search(self, queries, k, params=None):
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.d)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        fetch_k = min(k * self.rescore_factor, self.ntotal)
+        if fetch_k <= 0:
+            return distances, labels
+
+        for row, (query, candidates) in enumerate(zip(queries, self._candidates(queries, fetch_k, params))):
+            # Sorted positions read the memory-mapped vectors front to back
+            candidates = np.unique(candidates[candidates >= 0])
+            if not len(candidates):
+                continue
+            exact = ((self.vectors[candidates] - query) ** 2).sum(axis=1)
+            order = np.argsort(exact, kind="stable")[:k]
+            distances[row, :len(order)] = exact[order]
+            labels[row, :len(order)] = candidates[order]
+        return distances, labels
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# Add the project root to sys.path so the src package can be imported
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, project_root)
+
+from src.embedding.generations import GenerationStore
+from src.embedding.index_benchmark import load_vectors, measure, sample_queries
+from src.embedding.index_factory import build_index, read_index_meta, write_index_meta
+from src.embedding.quantization import (FLOAT_VECTORS_FILE, QUANTIZATION_TYPES, RescoringIndex, write_float_vectors,
+                                        write_quantized_index)
+
+RESCORE_FACTOR_SWEEP = (1, 2, 4, 8, 16)
+
+def evaluate(vectors, quantization, k=5, num_queries=200, rescore_factors=RESCORE_FACTOR_SWEEP):
+    """Measure recall@k and latency of the quantized index against exact flat search for each rescore factor"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = sample_queries(vectors, num_queries)
+    _, truth = build_index(vectors, "flat").search(queries, k)
+
+    start = time.time()
+    index = RescoringIndex.from_vectors(vectors, quantization)
+    build_seconds = time.time() - start
+
+    results = []
+    for factor in rescore_factors:
+        index.rescore_factor = factor
+        results.append({"rescore_factor": factor, **measure(index, queries, truth, k)})
+    return index, {
+        "quantization": quantization,
+        "num_vectors": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]),
+        "num_queries": int(len(queries)),
+        "k": k,
+        "build_seconds": round(build_seconds, 3),
+        "float_bytes": int(vectors.nbytes),
+        "quantized_bytes": index.memory_bytes(),
+        "results": results
+    }
+
+def choose_rescore_factor(report, max_recall_loss):
+    """Return the smallest rescore factor whose recall@k is within max_recall_loss of exact search, or None"""
+    for row in report["results"]:
+        if row["recall_at_k"] >= 1.0 - max_recall_loss:
+            return row["rescore_factor"]
+    return None
+
+def convert_in_place(store_path, vectors, index):
+    """Replace index.faiss of a store with quantized codes (or a float index when index is None).
+
+    The docstore files are left untouched; the metadata is written last so a store is only
+    loaded as quantized once its codes and float vectors are complete.
+    """
+    meta = read_index_meta(store_path)
+    index_path = os.path.join(store_path, "index.faiss")
+    if index is None:
+        faiss.write_index(build_index(vectors, "flat"), index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        if os.path.exists(os.path.join(store_path, FLOAT_VECTORS_FILE)):
+            os.remove(os.path.join(store_path, FLOAT_VECTORS_FILE))
+        for key in ("quantization", "rescore_factor", "quantized_bytes"):
+            meta.pop(key, None)
+    else:
+        write_float_vectors(vectors, store_path)
+        write_quantized_index(index.quantized_index, index_path)
+        meta.update(quantization=index.quantization, rescore_factor=index.rescore_factor,
+                    quantized_bytes=index.memory_bytes())
+    meta.update(index_type="flat", dim=int(vectors.shape[1]), ntotal=int(vectors.shape[0]))
+    write_index_meta(store_path, meta)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a flat vector store to int8/binary codes with float re-scoring, "
+                                                 "in place, after measuring its recall@k against exact search")
+    parser.add_argument("--store_path", help="Vector store to convert (default: the published generation)")
+    parser.add_argument("--quantization", choices=QUANTIZATION_TYPES, default="int8",
+                        help="none converts a quantized store back to a float flat index")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--num_queries", type=int, default=200)
+    parser.add_argument("--rescore_factors", type=int, nargs="+", default=list(RESCORE_FACTOR_SWEEP))
+    parser.add_argument("--max_recall_loss", type=float, default=0.01,
+                        help="Largest accepted drop of recall@k below exact search")
+    parser.add_argument("--dry_run", action="store_true", help="Only report the recall, do not convert")
+    parser.add_argument("--force", action="store_true", help="Convert with the largest factor even if recall is too low")
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    store_path = args.store_path or GenerationStore().current_path()
+    meta = read_index_meta(store_path)
+    if meta.get("index_type", "flat") != "flat":
+        print(f"Only flat indexes can be quantized, {store_path} has a {meta['index_type']} index", file=sys.stderr)
+        sys.exit(1)
+    vectors = load_vectors(store_path)
+
+    if args.quantization == "none":
+        convert_in_place(store_path, vectors, None)
+        print(f"Converted {store_path} to a float flat index", file=sys.stderr)
+        return
+
+    index, report = evaluate(vectors, args.quantization, k=args.k, num_queries=args.num_queries,
+                             rescore_factors=sorted(args.rescore_factors))
+    for row in report["results"]:
+        print(f"{args.quantization:>6} rescore x{row['rescore_factor']:<3} recall@{args.k}={row['recall_at_k']:.3f}  "
+              f"p50={row['latency_ms_p50']:.3f}ms  p95={row['latency_ms_p95']:.3f}ms", file=sys.stderr)
+    print(f"In-memory index: {report['float_bytes'] / 1e6:.1f}MB float -> {report['quantized_bytes'] / 1e6:.1f}MB "
+          f"{args.quantization} ({report['float_bytes'] / max(report['quantized_bytes'], 1):.1f}x smaller)",
+          file=sys.stderr)
+
+    factor = choose_rescore_factor(report, args.max_recall_loss)
+    if factor is None and args.force:
+        factor = report["results"][-1]["rescore_factor"]
+    report["rescore_factor"] = factor
+    report["converted"] = factor is not None and not args.dry_run
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if factor is None:
+        print(f"No rescore factor keeps recall@{args.k} within {args.max_recall_loss} of exact search, "
+              f"not converting (use --force to convert anyway)", file=sys.stderr)
+        sys.exit(1)
+    if not args.dry_run:
+        index.rescore_factor = factor
+        convert_in_place(store_path, vectors, index)
+        print(f"Converted {store_path} to {args.quantization} codes re-scored with factor {factor}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+import hashlib
+import itertools
+import threading
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("rag-system")
+
+def get_chunk_ids(documents):
+    """Return the chunk IDs of retrieved documents, hashing the content of documents without one"""
+    chunk_ids = []
+    for doc in documents:
+        chunk_id = doc.metadata.get("chunk_id")
+        if not chunk_id:
+            chunk_id = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+        chunk_ids.append(chunk_id)
+    return chunk_ids
+
+class SemanticAnswerCache:
+    """Cache of generated answers reused for near-duplicate questions over the same retrieved chunks"""
+
+    def __init__(self, similarity_threshold=0.95, max_entries=1000, ttl=3600):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # entry id -> (unit embedding, chunk set, answer, expiry)
+        self._by_chunk_set = {}  # chunk set -> entry ids
+        self._by_chunk = {}  # chunk id -> entry ids
+        self._next_id = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit_vector(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, embedding, chunk_ids):
+        """Return a cached answer for a similar question that retrieved the same chunks, or None"""
+        chunk_set = frozenset(chunk_ids)
+        query_vector = self._unit_vector(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            best_id, best_similarity = None, self.similarity_threshold
+            for entry_id in list(self._by_chunk_set.get(chunk_set, ())):
+                vector, _, _, expires_at = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(np.dot(query_vector, vector))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            logger.info(f"Answer cache hit (cosine similarity {best_similarity:.3f})")
+            return self._entries[best_id][2]
+
+    def store(self, embedding, chunk_ids, answer):
+        """Remember the answer generated for a question and its retrieved chunks"""
+        chunk_set = frozenset(chunk_ids)
+        with self._lock:
+            entry_id = next(self._next_id)
+            self._entries[entry_id] = (self._unit_vector(embedding), chunk_set, answer, time.monotonic() + self.ttl)
+            self._by_chunk_set.setdefault(chunk_set, set()).add(entry_id)
+            for chunk_id in chunk_set:
+                self._by_chunk.setdefault(chunk_id, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_chunks(self, chunk_ids):
+        """Drop every cached answer that was generated from any of the given chunks"""
+        with self._lock:
+            entry_ids = set()
+            for chunk_id in chunk_ids:
+                entry_ids.update(self._by_chunk.get(chunk_id, ()))
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+        if entry_ids:
+            logger.info(f"Invalidated {len(entry_ids)} cached answers")
+        return len(entry_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_chunk_set.clear()
+            self._by_chunk.clear()
+
+    def _remove(self, entry_id):
+        """Remove an entry and its index references; the caller must hold the lock"""
+        _, chunk_set, _, _ = self._entries.pop(entry_id)
+        self._discard(self._by_chunk_set, chunk_set, entry_id)
+        for chunk_id in chunk_set:
+            self._discard(self._by_chunk, chunk_id, entry_id)
+
+    @staticmethod
+    def _discard(index, key, entry_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del index[key]
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
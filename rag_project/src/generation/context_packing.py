@@ -0,0 +1,180 @@
+from langchain_core.documents import Document
+import logging
+
+from src.document_processing.loader import CHUNK_ID_SEPARATOR
+from src.retrieval.bm25 import tokenize
+from src.utils.metrics import metrics
+from src.utils.tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger("rag-system")
+
+# create_stuff_documents_chain joins the documents of the context with this separator
+DOCUMENT_SEPARATOR = "\n\n"
+
+# Shortest text two consecutive chunks must share to be treated as the splitter's overlap
+MIN_OVERLAP_CHARS = 20
+
+def chunk_position(doc):
+    """Return (source, chunk index) parsed from a document's chunk ID, or None without one"""
+    source, _, index = (doc.metadata.get("chunk_id") or "").rpartition(CHUNK_ID_SEPARATOR)
+    return (source, int(index)) if source and index.isdigit() else None
+
+def join_overlapping(first, second, min_overlap=MIN_OVERLAP_CHARS):
+    """Join two consecutive chunks of a file, writing the text the splitter repeated in both only once.
+
+    The splitter repeats whole words, so only a shared suffix/prefix of at least min_overlap
+    characters that starts and ends on a whitespace boundary counts as overlap. Anything else is
+    a chance match at the boundary, and the chunks are joined with a newline instead.
+    """
+    if second in first:
+        return first
+    for size in range(min(len(first), len(second)), max(min_overlap, 1) - 1, -1):
+        if (first.endswith(second[:size])
+                and (size == len(first) or first[-size - 1].isspace())
+                and (size == len(second) or second[size].isspace())):
+            return first + second[size:]
+    return first + "\n" + second
+
+def shingles(text, size=3):
+    """Return the set of word n-grams of a text, used to compare passages"""
+    words = tokenize(text)
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+class ContextPacker:
+    """Assemble retrieved chunks into the context of the prompt.
+
+    Chunks at consecutive positions of the same file are merged into one passage with their
+    overlap removed, passages mostly covered by a better ranked one are dropped, MMR can reorder
+    the rest for diversity (mmr_lambda < 1), and the result is packed in order into max_tokens
+    tokens, counted with the model's tokenizer including the separators between documents. The
+    passage that crosses the budget is truncated if at least min_truncated_tokens of it fit.
+    """
+
+    def __init__(self, max_tokens=0, model_name="gpt-3.5-turbo", merge_adjacent=True,
+                 duplicate_threshold=0.8, mmr_lambda=1.0, min_truncated_tokens=32,
+                 min_overlap=MIN_OVERLAP_CHARS):
+        self.max_tokens = max_tokens
+        self.model_name = model_name
+        self.merge_adjacent = merge_adjacent
+        self.duplicate_threshold = duplicate_threshold
+        self.mmr_lambda = mmr_lambda
+        self.min_truncated_tokens = min_truncated_tokens
+        self.min_overlap = min_overlap
+
+    def merge(self, documents):
+        """Merge chunks at consecutive positions of the same file, keeping the rank of the best one"""
+        runs = {}
+        ranked = []
+        for rank, doc in sorted(((rank, doc) for rank, doc in enumerate(documents)),
+                                key=lambda item: chunk_position(item[1]) or ("", item[0])):
+            position = chunk_position(doc)
+            if position is None:
+                ranked.append((rank, doc))
+                continue
+            source, index = position
+            run = runs.get(source)
+            if run is not None and index == run["last"]:
+                # The same chunk retrieved twice
+                run["rank"] = min(run["rank"], rank)
+                continue
+            if run is not None and index == run["last"] + 1:
+                run["text"] = join_overlapping(run["text"], doc.page_content, self.min_overlap)
+                run["chunk_ids"].append(doc.metadata["chunk_id"])
+                run["rank"] = min(run["rank"], rank)
+                run["last"] = index
+                continue
+            if run is not None:
+                ranked.append(self._run_document(run))
+            runs[source] = {"doc": doc, "text": doc.page_content, "chunk_ids": [doc.metadata["chunk_id"]],
+                            "rank": rank, "last": index}
+        ranked.extend(self._run_document(run) for run in runs.values())
+        return [doc for _, doc in sorted(ranked, key=lambda item: item[0])]
+
+    @staticmethod
+    def _run_document(run):
+        if len(run["chunk_ids"]) == 1:
+            return run["rank"], run["doc"]
+        metadata = {**run["doc"].metadata, "chunk_ids": run["chunk_ids"]}
+        return run["rank"], Document(page_content=run["text"], metadata=metadata)
+
+    def drop_duplicates(self, documents, document_shingles):
+        """Drop passages whose word n-grams are mostly contained in a better ranked passage"""
+        kept = []
+        for i in range(len(documents)):
+            candidate = document_shingles[i]
+            if any(len(candidate & document_shingles[j]) >= self.duplicate_threshold * len(candidate)
+                   for j in kept):
+                continue
+            kept.append(i)
+        return kept
+
+    def diversify(self, indexes, document_shingles):
+        """Reorder passages by maximal marginal relevance, using the retrieval rank as relevance"""
+        relevance = {index: 1.0 - rank / len(indexes) for rank, index in enumerate(indexes)}
+        remaining = list(indexes)
+        selected = []
+        while remaining:
+            def mmr_score(position):
+                index = remaining[position]
+                redundancy = max((_jaccard(document_shingles[index], document_shingles[j]) for j in selected),
+                                 default=0.0)
+                return self.mmr_lambda * relevance[index] - (1.0 - self.mmr_lambda) * redundancy
+            best = max(range(len(remaining)), key=mmr_score)
+            selected.append(remaining.pop(best))
+        return selected
+
+    def fit_budget(self, documents, budget):
+        """Keep passages in order until the budget is spent, truncating the one that crosses it"""
+        separator_tokens = count_tokens(DOCUMENT_SEPARATOR, self.model_name)
+        packed, used = [], 0
+        for doc in documents:
+            separator = separator_tokens if packed else 0
+            tokens = count_tokens(doc.page_content, self.model_name)
+            if used + separator + tokens <= budget:
+                packed.append(doc)
+                used += separator + tokens
+                continue
+            remaining = budget - used - separator
+            if remaining >= self.min_truncated_tokens:
+                packed.append(self._truncate(doc, remaining))
+            break
+
+        # Tokens can merge across the separators, so check the joined context and trim the last passage
+        while packed:
+            overshoot = count_tokens(DOCUMENT_SEPARATOR.join(doc.page_content for doc in packed),
+                                     self.model_name) - budget
+            if overshoot <= 0:
+                break
+            last = packed.pop()
+            tokens = count_tokens(last.page_content, self.model_name) - overshoot
+            if tokens >= self.min_truncated_tokens:
+                packed.append(self._truncate(last, tokens))
+        return packed
+
+    def _truncate(self, doc, max_tokens):
+        text = truncate_to_tokens(doc.page_content, max_tokens, self.model_name)
+        return Document(page_content=text, metadata={**doc.metadata, "truncated": True})
+
+    def pack(self, documents, reserved_tokens=0):
+        """Return the passages to put in the prompt for the retrieved documents, best first.
+
+        reserved_tokens is subtracted from max_tokens for the rest of the prompt (0 = no budget).
+        """
+        passages = self.merge(documents) if self.merge_adjacent else list(documents)
+        document_shingles = [shingles(doc.page_content) for doc in passages]
+        indexes = self.drop_duplicates(passages, document_shingles)
+        if self.mmr_lambda < 1.0:
+            indexes = self.diversify(indexes, document_shingles)
+        passages = [passages[i] for i in indexes]
+
+        if self.max_tokens:
+            passages = self.fit_budget(passages, max(self.max_tokens - reserved_tokens, 0))
+        tokens = count_tokens(DOCUMENT_SEPARATOR.join(doc.page_content for doc in passages), self.model_name)
+        metrics.inc("rag_context_tokens_total", tokens if passages else 0)
+        logger.info(f"  Context packing: {len(documents)} chunks -> {len(passages)} passages, {tokens} tokens")
+        return passages
@@ -7,11 +7,21 @@ import time
 import logging
 import os
 
+from src.generation.answer_cache import get_chunk_ids
+from src.utils.metrics import metrics, span
+from src.utils.tokens import count_tokens
+
 logger = logging.getLogger("rag-system")
 
 class RAGGenerator:
-    def __init__(self, retriever, model_name="mistral-7b", temperature=0.1):
+    def __init__(self, retriever, model_name="mistral-7b", temperature=0.1, answer_cache=None,
+                 context_packer=None, max_tokens=None):
         self.retriever = retriever
+        self.answer_cache = answer_cache
+        self.model_name = model_name
+        
+        # Merges, deduplicates and budgets the retrieved chunks before they go into the prompt
+        self.context_packer = context_packer
         
         # Configure the model - Check if we're using Mistral or OpenAI
         if "mistral" in model_name.lower():
@@ -20,7 +30,8 @@ class RAGGenerator:
             huggingface_api_token = os.environ.get("HUGGINGFACE_API_TOKEN")
             if not huggingface_api_token:
                 logger.warning("HUGGINGFACE_API_TOKEN not found in environment. Using default OpenAI model.")
-                self.llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=temperature)
+                self.model_name = "gpt-3.5-turbo"
+                self.llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=temperature, max_tokens=max_tokens)
             else:
                 logger.info(f"Using Mistral-7B model with temperature {temperature}")
                 # Configure Mistral model through Hugging Face API
@@ -33,7 +44,7 @@ class RAGGenerator:
         else:
             # Default to OpenAI
             logger.info(f"Using OpenAI model {model_name} with temperature {temperature}")
-            self.llm = ChatOpenAI(model_name=model_name, temperature=temperature)
+            self.llm = ChatOpenAI(model_name=model_name, temperature=temperature, max_tokens=max_tokens)
         
         # Create a prompt template
         self.prompt_template = PromptTemplate.from_template(
@@ -54,19 +65,42 @@ class RAGGenerator:
         self.doc_chain = create_stuff_documents_chain(self.llm, self.prompt_template)
     
     def generate_answer(self, query):
-        """Generate an answer for the query using RAG with timing logs"""
+        """Retrieve documents for the query and generate an answer from them"""
         logger.info(f"Starting answer generation for query: '{query}'")
         
-        # Time the document retrieval (if not already done)
+        # Time the document retrieval
         docs_start = time.time()
         retrieved_docs = self.retriever.retrieve(query)
-        docs_end = time.time()
-        docs_time = docs_end - docs_start
+        docs_time = time.time() - docs_start
+        logger.info(f"  Document retrieval: {docs_time:.2f}s")
         
+        return self.generate_answer_from_docs(query, retrieved_docs)
+    
+    def pack_context(self, query, retrieved_docs):
+        """Return the documents to stuff into the prompt, packed to what the rest of the prompt leaves"""
+        if self.context_packer is None:
+            return retrieved_docs
+        with span("context_pack"):
+            prompt = self.prompt_template.format(context="", question=query)
+            return self.context_packer.pack(retrieved_docs, reserved_tokens=count_tokens(prompt, self.model_name))
+    
+    def get_cached_answer(self, query, retrieved_docs):
+        """Return a cached answer for a near-duplicate question over the same chunks, or None"""
+        if self.answer_cache is None or not retrieved_docs:
+            return None
+        return self.answer_cache.lookup(self.retriever.embed_query(query), get_chunk_ids(retrieved_docs))
+    
+    def generate_answer_from_docs(self, query, retrieved_docs, check_cache=True):
+        """Generate an answer from documents that were already retrieved for the query"""
         if not retrieved_docs:
             logger.warning("No relevant documents found for the query")
             return "No relevant information found to answer your question."
         
+        if check_cache:
+            cached_answer = self.get_cached_answer(query, retrieved_docs)
+            if cached_answer is not None:
+                return cached_answer
+        
         # Log document metadata if available
         try:
             logger.info(f"Retrieved {len(retrieved_docs)} documents:")
@@ -76,30 +110,102 @@ class RAGGenerator:
         except Exception as e:
             logger.info(f"Could not log document details: {str(e)}")
         
+        context = self.pack_context(query, retrieved_docs)
+        
         # Time the LLM generation
         llm_start = time.time()
         try:
             # Generate an answer using the documents
-            answer = self.doc_chain.invoke({
-                "context": retrieved_docs,
-                "question": query
-            })
+            with span("llm"):
+                answer = self.doc_chain.invoke({
+                    "context": context,
+                    "question": query
+                })
             
             llm_end = time.time()
             llm_time = llm_end - llm_start
             
             # Log timing information
-            total_time = llm_end - docs_start
             logger.info(f"Answer generation timing details:")
-            if docs_time > 0.01:  # Only log if significant time was spent on retrieval
-                logger.info(f"  Document retrieval: {docs_time:.2f}s ({(docs_time/total_time)*100:.1f}% of total)")
-            logger.info(f"  LLM generation: {llm_time:.2f}s ({(llm_time/total_time)*100:.1f}% of total)")
-            logger.info(f"  Total generation time: {total_time:.2f}s")
+            logger.info(f"  LLM generation: {llm_time:.2f}s")
             logger.info(f"  Answer length: {len(str(answer))} characters")
             
+            if self.answer_cache is not None:
+                self.answer_cache.store(self.retriever.embed_query(query), get_chunk_ids(retrieved_docs), answer)
+            
             return answer
         except Exception as e:
             llm_end = time.time()
+            metrics.inc("rag_llm_errors_total")
             logger.error(f"Error in LLM generation: {str(e)}")
             logger.error(f"LLM generation took {llm_end - llm_start:.2f}s before failing")
-            raise e
\ No newline at end of file
+            raise e
+    
+    async def aget_cached_answer(self, query, retrieved_docs):
+        """Async variant of get_cached_answer"""
+        if self.answer_cache is None or not retrieved_docs:
+            return None
+        embedding = await self.retriever.aembed_query(query)
+        return self.answer_cache.lookup(embedding, get_chunk_ids(retrieved_docs))
+    
+    async def agenerate_answer_from_docs(self, query, retrieved_docs, check_cache=True):
+        """Async variant of generate_answer_from_docs that awaits the document chain"""
+        if not retrieved_docs:
+            logger.warning("No relevant documents found for the query")
+            return "No relevant information found to answer your question."
+        
+        if check_cache:
+            cached_answer = await self.aget_cached_answer(query, retrieved_docs)
+            if cached_answer is not None:
+                return cached_answer
+        
+        context = self.pack_context(query, retrieved_docs)
+        llm_start = time.time()
+        try:
+            with span("llm"):
+                answer = await self.doc_chain.ainvoke({
+                    "context": context,
+                    "question": query
+                })
+        except Exception as e:
+            metrics.inc("rag_llm_errors_total")
+            logger.error(f"Error in LLM generation: {str(e)}")
+            logger.error(f"LLM generation took {time.time() - llm_start:.2f}s before failing")
+            raise e
+        
+        logger.info(f"  LLM generation: {time.time() - llm_start:.2f}s")
+        logger.info(f"  Answer length: {len(str(answer))} characters")
+        
+        if self.answer_cache is not None:
+            embedding = await self.retriever.aembed_query(query)
+            self.answer_cache.store(embedding, get_chunk_ids(retrieved_docs), answer)
+        
+        return answer
+    
+    async def astream_answer(self, query, retrieved_docs):
+        """Stream the answer for already retrieved documents token by token from the document chain"""
+        if not retrieved_docs:
+            logger.warning("No relevant documents found for the query")
+            yield "No relevant information found to answer your question."
+            return
+        
+        context = self.pack_context(query, retrieved_docs)
+        llm_start = time.time()
+        answer_parts = []
+        async for token in self.doc_chain.astream({
+            "context": context,
+            "question": query
+        }):
+            if not answer_parts:
+                metrics.observe("llm_first_token", time.time() - llm_start)
+            answer_parts.append(token)
+            yield token
+        
+        metrics.observe("llm", time.time() - llm_start)
+        answer = "".join(answer_parts)
+        logger.info(f"  LLM streaming generation: {time.time() - llm_start:.2f}s")
+        logger.info(f"  Answer length: {len(answer)} characters")
+        
+        if self.answer_cache is not None:
+            embedding = await self.retriever.aembed_query(query)
+            self.answer_cache.store(embedding, get_chunk_ids(retrieved_docs), answer)
\ No newline at end of file
@@ -1,39 +1,153 @@
-from document_processing.loader import DocumentProcessor
-from embedding.embedder import EmbeddingProcessor
-from retrieval.retriever import EnhancedRetriever
-from generation.rag_generator import RAGGenerator
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import sys
+
+# Add the project root to sys.path so the src package can be imported
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, project_root)
+
+from src.document_processing.loader import DocumentProcessor
+from src.embedding.embedder import EmbeddingProcessor
+from src.embedding.pipeline import StreamingIngestionPipeline
+from src.embedding.generations import GenerationStore
+from src.retrieval.retriever import EnhancedRetriever, distinct_queries, normalize_query
+from src.generation.context_packing import ContextPacker
+from src.generation.rag_generator import RAGGenerator
+
+def read_queries(path):
+    """Read one query per line; lines may also be JSON objects with a "query" field"""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if line.startswith("{") else line)
+    return queries
+
+def answer_query_file(generator, queries, output, concurrency=8, top_k=5):
+    """Answer a file of queries with batched retrieval and concurrent generation, writing JSON Lines.
+    
+    Repeated questions are answered once; lines are written as answers complete, each with the
+    index of its query in the file.
+    """
+    unique = distinct_queries(queries)
+    indexes = {normalize_query(query): [] for query in unique}
+    for index, query in enumerate(queries):
+        indexes[normalize_query(query)].append(index)
+    
+    docs_per_query = generator.retriever.retrieve_batch(unique, top_k=top_k)
+    
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(generator.generate_answer_from_docs, query, docs): (query, docs)
+            for query, docs in zip(unique, docs_per_query)
+        }
+        for future in as_completed(futures):
+            query, docs = futures[future]
+            try:
+                result = {"answer": future.result()}
+            except Exception as e:
+                result = {"error": str(e)}
+            result["sources"] = [doc.metadata.get("source") for doc in docs]
+            for index in indexes[normalize_query(query)]:
+                output.write(json.dumps({"index": index, "query": queries[index], **result}) + "\n")
+            output.flush()
 
 def main():
     parser = argparse.ArgumentParser(description="RAG Pipeline")
     parser.add_argument("--process_docs", action="store_true", help="Process documents and create vector store")
     parser.add_argument("--query", type=str, help="Query to answer")
+    parser.add_argument("--streaming", action="store_true", help="Ingest with the bounded-memory streaming pipeline (resumes interrupted runs)")
+    parser.add_argument("--storage_format", choices=["langchain", "sqlite"], default="langchain",
+                        help="On-disk format of the vector store (sqlite = memory-mapped index + SQLite docstore)")
+    parser.add_argument("--convert_store", action="store_true", help="Rewrite the existing vector store in --storage_format and --quantization")
+    parser.add_argument("--index_type", choices=["flat", "ivf_flat", "ivf_pq", "hnsw"], default="flat",
+                        help="FAISS index built over the embeddings (approximate types trade recall for speed)")
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"], default="none",
+                        help="Store flat indexes as int8/binary codes re-scored against memory-mapped float vectors")
+    parser.add_argument("--hybrid", action="store_true", help="Build and query a BM25 index alongside the vectors (reciprocal rank fusion)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to load and split documents (0 = one per CPU core)")
+    parser.add_argument("--query_file", type=str, help="Answer every query in this file (one per line) and write JSON Lines")
+    parser.add_argument("--output", type=str, help="File the --query_file answers are written to (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Answers generated concurrently for --query_file")
     args = parser.parse_args()
     
-    if args.process_docs:
-        print("Processing documents...")
+    # New stores are built as a new generation and published once complete, so a running API keeps serving
+    generations = GenerationStore()
+    
+    if args.process_docs and args.streaming:
+        print("Streaming documents into the vector store...")
         processor = DocumentProcessor()
+        embedder = EmbeddingProcessor(storage_format=args.storage_format, index_type=args.index_type,
+                                      build_sparse_index=args.hybrid, quantization=args.quantization)
+        store_path = generations.new_generation_path(resume=True)
+        pipeline = StreamingIngestionPipeline(processor, embedder, store_path=store_path)
+        vector_store, completed, failed = pipeline.run(processor.list_files())
+        if vector_store is None:
+            # Keep a checkpointed generation for the next --streaming run, never publish it
+            if not generations.is_resumable(store_path):
+                generations.remove(store_path)
+            print(f"Error: No documents could be ingested ({len(failed)} failed)")
+            return
+        generations.publish(store_path)
+        print(f"Vector store created from {len(completed)} files ({len(failed)} failed)")
+    elif args.process_docs:
+        print("Processing documents...")
+        processor = DocumentProcessor(max_workers=args.workers)
         chunks = processor.process()
+        if not chunks:
+            print("Error: No documents found to process")
+            return
         
         print("Creating vector store...")
-        embedder = EmbeddingProcessor()
-        vector_store = embedder.create_vector_store(chunks)
+        embedder = EmbeddingProcessor(storage_format=args.storage_format, index_type=args.index_type,
+                                      build_sparse_index=args.hybrid, quantization=args.quantization)
+        store_path = generations.new_generation_path(resume=False)
+        vector_store = embedder.create_vector_store(chunks, store_path)
+        generations.publish(store_path)
         print("Vector store created successfully!")
     
-    if args.query:
-        embedder = EmbeddingProcessor()
-        vector_store = embedder.load_vector_store(allow_dangerous_deserialization=True)
+    if args.convert_store:
+        embedder = EmbeddingProcessor(storage_format=args.storage_format, build_sparse_index=args.hybrid,
+                                      quantization=args.quantization)
+        vector_store = embedder.load_vector_store(generations.current_path(), writable=True)
+        if not vector_store:
+            print("Error: Vector store not found. Please run with --process_docs first.")
+            return
+        store_path = generations.new_generation_path(resume=False)
+        embedder.save_vector_store(vector_store, store_path)
+        generations.publish(store_path)
+        print(f"Vector store converted to the {args.storage_format} format ({args.quantization} quantization)")
+    
+    if args.query or args.query_file:
+        embedder = EmbeddingProcessor(storage_format=args.storage_format)
+        store_path = generations.current_path()
+        vector_store = embedder.load_vector_store(store_path, allow_dangerous_deserialization=True)
         
         if not vector_store:
             print("Error: Vector store not found. Please run with --process_docs first.")
             return
         
-        retriever = EnhancedRetriever(vector_store)
-        generator = RAGGenerator(retriever)
+        sparse_index = embedder.load_sparse_index(vector_store, store_path) if args.hybrid else None
+        retriever = EnhancedRetriever(vector_store, sparse_index=sparse_index)
+        generator = RAGGenerator(retriever, context_packer=ContextPacker())
+        
+        if args.query_file:
+            queries = read_queries(args.query_file)
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as output:
+                    answer_query_file(generator, queries, output, concurrency=args.concurrency)
+                print(f"Answered {len(queries)} queries into {args.output}")
+            else:
+                answer_query_file(generator, queries, sys.stdout, concurrency=args.concurrency)
         
-        print(f"\nQuestion: {args.query}")
-        answer = generator.generate_answer(args.query)
-        print(f"Answer: {answer}")
+        if args.query:
+            print(f"\nQuestion: {args.query}")
+            answer = generator.generate_answer(args.query)
+            print(f"Answer: {answer}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,161 @@
+from langchain_core.documents import Document
+import json
+import logging
+import os
+import re
+
+import numpy as np
+
+logger = logging.getLogger("rag-system")
+
+BM25_FILE = "bm25_index.npz"
+
+# Keep identifiers such as error codes, part numbers and versions (E-1042, AB_12.3) as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+
+def tokenize(text):
+    """Lowercase a text and split it into word and identifier tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """Inverted BM25 index over the chunks of a vector store.
+
+    Postings are stored in CSR form (one slice of chunk positions per term) together with
+    their precomputed BM25 term weights, so a query only gathers the postings of its terms,
+    multiplies them by the term IDF and sums them with numpy.
+    """
+
+    def __init__(self, vocabulary, indptr, postings, weights, idf, doc_ids):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.postings = postings
+        self.weights = weights
+        self.idf = idf
+        self.doc_ids = doc_ids
+
+    @classmethod
+    def build(cls, doc_ids, texts, k1=1.5, b=0.75):
+        """Build the index from parallel lists of docstore IDs and chunk texts"""
+        vocabulary = {}
+        term_ids, doc_positions, term_counts = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[position] = len(tokens)
+            counts = {}
+            for token in tokens:
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            term_ids.extend(counts.keys())
+            doc_positions.extend([position] * len(counts))
+            term_counts.extend(counts.values())
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_positions = np.asarray(doc_positions, dtype=np.int32)
+        tf = np.asarray(term_counts, dtype=np.float32)
+
+        # Sort postings by term to get one contiguous slice per term
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_positions, tf = term_ids[order], doc_positions[order], tf[order]
+        doc_freq = np.bincount(term_ids, minlength=len(vocabulary))
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=indptr[1:])
+
+        num_docs = max(len(texts), 1)
+        avg_length = max(float(doc_lengths.mean()) if len(texts) else 0.0, 1e-9)
+        norm = k1 * (1 - b + b * doc_lengths[doc_positions] / avg_length)
+        weights = (tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+        idf = np.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+        return cls(vocabulary, indptr, doc_positions, weights, idf, list(doc_ids))
+
+    @classmethod
+    def from_vector_store(cls, vector_store):
+        """Build the index over every chunk of a LangChain FAISS vector store, in FAISS position order"""
+        doc_ids, texts = [], []
+        for _, doc_id in sorted(vector_store.index_to_docstore_id.items()):
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                doc_ids.append(doc_id)
+                texts.append(doc.page_content)
+        return cls.build(doc_ids, texts)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query, k=5, mask=None):
+        """Return the top-k (docstore ID, BM25 score) pairs for a query.
+
+        mask is an optional boolean allow mask aligned with doc_ids; disallowed chunks score zero.
+        """
+        term_ids = [self.vocabulary[token] for token in set(tokenize(query)) if token in self.vocabulary]
+        if not term_ids or not self.doc_ids:
+            return []
+
+        slices = [slice(self.indptr[term_id], self.indptr[term_id + 1]) for term_id in term_ids]
+        positions = np.concatenate([self.postings[s] for s in slices])
+        contributions = np.concatenate([self.weights[s] * self.idf[term_id] for s, term_id in zip(slices, term_ids)])
+        scores = np.bincount(positions, weights=contributions, minlength=len(self.doc_ids))
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[position], float(scores[position])) for position in top]
+
+    def save(self, store_path):
+        """Write the index next to the FAISS index, replacing the previous one atomically"""
+        os.makedirs(store_path, exist_ok=True)
+        path = os.path.join(store_path, BM25_FILE)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                indptr=self.indptr,
+                postings=self.postings,
+                weights=self.weights,
+                idf=self.idf,
+                terms=np.frombuffer(json.dumps(terms).encode("utf-8"), dtype=np.uint8),
+                doc_ids=np.frombuffer(json.dumps(self.doc_ids).encode("utf-8"), dtype=np.uint8)
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, store_path):
+        """Load a saved index, or return None if the store has none"""
+        path = os.path.join(store_path, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                terms = json.loads(data["terms"].tobytes().decode("utf-8"))
+                doc_ids = json.loads(data["doc_ids"].tobytes().decode("utf-8"))
+                return cls(
+                    {term: term_id for term_id, term in enumerate(terms)},
+                    data["indptr"],
+                    data["postings"],
+                    data["weights"],
+                    data["idf"],
+                    doc_ids
+                )
+        except Exception as e:
+            logger.error(f"Error loading BM25 index: {str(e)}")
+            return None
+
+def reciprocal_rank_fusion(ranked_lists, weights, rrf_k=60):
+    """Fuse ranked lists of keys with weighted reciprocal rank fusion.
+
+    Each key scores sum(weight / (rrf_k + rank)) over the lists it appears in.
+    Returns (key, fused score) pairs, best first.
+    """
+    scores = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        if not weight:
+            continue
+        for rank, key in enumerate(ranked, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,106 @@
+import threading
+
+import faiss
+import numpy as np
+
+from src.document_processing.loader import chunk_id_source
+from src.retrieval.index_search import source_positions
+
+class SourceBitmap:
+    """Allow bitmaps over FAISS positions or BM25 documents that select chunks by source file.
+
+    The same chunk order is used for FAISS positions (so a bitmap can be handed to FAISS as an
+    IDSelector) and for the BM25 index. The positions of a source are looked up on demand with
+    lookup(sources) -> {source: positions}, so opening a generation does not walk its whole
+    position mapping. Denied sources, such as files marked deleted in the registry, are folded
+    into one cached base mask, so honouring them costs nothing per query.
+    """
+
+    def __init__(self, size, lookup):
+        self.size = size
+        self.lookup = lookup
+        self._lock = threading.Lock()
+        self._denied = frozenset()
+        self._base_mask = None
+        self._base_selector = (None, None)
+
+    @classmethod
+    def from_doc_ids(cls, doc_ids):
+        """Build the bitmap index over an ordered list of chunk IDs held in memory, e.g. the BM25 documents"""
+        groups = {}
+        for position, doc_id in enumerate(doc_ids):
+            if doc_id is not None:
+                groups.setdefault(chunk_id_source(doc_id), []).append(position)
+        positions = {source: np.asarray(group, dtype=np.int64) for source, group in groups.items()}
+        return cls(len(doc_ids), lambda sources: {source: positions[source] for source in sources if source in positions})
+
+    @classmethod
+    def from_vector_store(cls, vector_store):
+        """Build the bitmap index over the FAISS positions of a vector store"""
+        return cls(vector_store.index.ntotal, lambda sources: source_positions(vector_store, sources))
+
+    def set_denied(self, sources):
+        """Exclude every chunk of the given sources from all searches"""
+        positions = self.lookup(set(sources))
+        denied = frozenset(positions)
+        base_mask = None
+        if denied:
+            base_mask = np.ones(self.size, dtype=bool)
+            for source_positions in positions.values():
+                base_mask[source_positions] = False
+        base_selector = make_id_selector(base_mask)
+        with self._lock:
+            self._denied = denied
+            self._base_mask = base_mask
+            self._base_selector = base_selector
+
+    def mask(self, sources=None):
+        """Return the boolean allow mask for a search, or None when every chunk is allowed.
+
+        sources restricts the search to the chunks of those files; denied sources stay excluded.
+        """
+        with self._lock:
+            base_mask = self._base_mask
+        if sources is None:
+            return base_mask
+
+        mask = np.zeros(self.size, dtype=bool)
+        for positions in self.lookup(set(sources)).values():
+            mask[positions] = True
+        if base_mask is not None:
+            mask &= base_mask
+        return mask
+
+    def scaled_k(self, k, sources=None):
+        """Scale a result count by the filtered fraction of the index, for searches that filter after the fact.
+
+        Returns k / (allowed fraction of chunks), capped at the index size, or 0 when nothing is allowed.
+        """
+        mask = self.mask(sources)
+        if mask is None:
+            return k
+        allowed = int(np.count_nonzero(mask))
+        if not allowed:
+            return 0
+        return min(self.size, -(-k * self.size // allowed))
+
+    def selector(self, sources=None):
+        """Return (selector, bits) for mask(sources), see make_id_selector.
+
+        The selector of the base mask is built once per set_denied, so only searches
+        restricted to sources pay for packing a mask.
+        """
+        if sources is None:
+            with self._lock:
+                return self._base_selector
+        return make_id_selector(self.mask(sources))
+
+def make_id_selector(mask):
+    """Wrap an allow mask in a FAISS IDSelectorBitmap, so filtering happens inside the index scan.
+
+    Returns (selector, bits); the packed bits must stay referenced for as long as the selector is used.
+    """
+    if mask is None:
+        return None, None
+    bits = np.packbits(mask, bitorder="little")
+    return faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits)), bits
@@ -0,0 +1,78 @@
+from langchain_core.documents import Document
+import faiss
+import numpy as np
+
+from src.document_processing.loader import CHUNK_ID_SEPARATOR, chunk_id_source
+
+def search_vector_store(vector_store, query_vectors, k, search_parameters=None):
+    """Search the FAISS index of a LangChain vector store directly for one or more query vectors.
+
+    Unlike FAISS.similarity_search_with_score_by_vector this accepts per-call FAISS search
+    parameters (nprobe, efSearch, ID selectors) and a whole matrix of queries at once.
+    Returns one list of (Document, distance) pairs per query.
+    """
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    if queries.ndim == 1:
+        queries = queries.reshape(1, -1)
+    if getattr(vector_store, "_normalize_L2", False):
+        queries = queries.copy()
+        faiss.normalize_L2(queries)
+
+    if search_parameters is None:
+        distances, positions = vector_store.index.search(queries, k)
+    else:
+        distances, positions = vector_store.index.search(queries, k, params=search_parameters)
+
+    results = []
+    for row_distances, row_positions in zip(distances, positions):
+        hits = []
+        for distance, position in zip(row_distances, row_positions):
+            # FAISS pads with -1 when fewer than k vectors are reachable
+            if position == -1:
+                continue
+            doc_id = vector_store.index_to_docstore_id[int(position)]
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                hits.append((doc, float(distance)))
+        results.append(hits)
+    return results
+
+def positions_of(vector_store, doc_ids):
+    """Return {docstore ID: FAISS position} for the given docstore IDs of a vector store.
+
+    SQLite mappings look the IDs up in the database; in-memory mappings get a reverse dict that
+    is built once per vector store, which is in proportion to the mapping it already holds.
+    """
+    mapping = vector_store.index_to_docstore_id
+    if hasattr(mapping, "positions_of"):
+        return mapping.positions_of(doc_ids)
+    reverse = getattr(vector_store, "_docstore_id_to_position", None)
+    if reverse is None or len(reverse) != len(mapping):
+        reverse = {doc_id: int(position) for position, doc_id in mapping.items()}
+        vector_store._docstore_id_to_position = reverse
+    return {doc_id: reverse[doc_id] for doc_id in doc_ids if doc_id in reverse}
+
+def source_positions(vector_store, sources):
+    """Return {source file: FAISS positions array} for those of the given sources the vector store has.
+
+    SQLite mappings are queried per source through their doc_id index; in-memory mappings are
+    grouped by source once per vector store.
+    """
+    mapping = vector_store.index_to_docstore_id
+    if hasattr(mapping, "positions_with_prefix"):
+        positions = {}
+        for source in sources:
+            rows = [position for doc_id, position in mapping.positions_with_prefix(source + CHUNK_ID_SEPARATOR)
+                    if chunk_id_source(doc_id) == source]
+            if rows:
+                positions[source] = np.asarray(rows, dtype=np.int64)
+        return positions
+
+    groups = getattr(vector_store, "_source_positions", None)
+    if groups is None or groups[0] != len(mapping):
+        grouped = {}
+        for position, doc_id in mapping.items():
+            grouped.setdefault(chunk_id_source(doc_id), []).append(int(position))
+        groups = (len(mapping), {source: np.asarray(rows, dtype=np.int64) for source, rows in grouped.items()})
+        vector_store._source_positions = groups
+    return {source: groups[1][source] for source in sources if source in groups[1]}
@@ -0,0 +1,196 @@
+from langchain_core.documents import Document
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+
+import numpy as np
+
+from src.retrieval.bm25 import tokenize
+from src.retrieval.index_search import positions_of
+from src.utils.tokens import count_tokens
+
+logger = logging.getLogger("rag-system")
+
+RERANKER_TYPES = ("none", "lexical", "embedding", "cross_encoder", "llm")
+
+def _with_score(doc, score):
+    """Copy a candidate with its rerank score in the metadata"""
+    return Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": float(score)})
+
+def _rank_prior(num_candidates):
+    """Score in [0, 1] that decays with the first-stage rank, used to break ties in favour of retrieval order"""
+    return 1.0 - np.arange(num_candidates, dtype=np.float32) / max(num_candidates, 1)
+
+def _top_k(documents, scores, top_k, min_score=None):
+    """Return the top_k documents by score, best first, dropping those below min_score"""
+    order = np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")
+    ranked = [_with_score(documents[i], scores[i]) for i in order if min_score is None or scores[i] >= min_score]
+    return ranked[:top_k]
+
+def trim_to_token_budget(documents, max_tokens, model_name="gpt-3.5-turbo"):
+    """Keep documents in order until the next one would exceed the token budget (0 = no budget)"""
+    if not max_tokens:
+        return documents
+    kept, used = [], 0
+    for doc in documents:
+        tokens = count_tokens(doc.page_content, model_name)
+        if kept and used + tokens > max_tokens:
+            break
+        kept.append(doc)
+        used += tokens
+    return kept
+
+class LexicalReranker:
+    """Rerank candidates by IDF-weighted coverage of the query terms, computed over the candidate set.
+
+    A term-document matrix of the candidates is scored in one matrix product, so a few dozen
+    candidates rerank in well under a millisecond. The first-stage rank is blended in with
+    retrieval_weight so that candidates without any query term keep their dense order.
+    """
+
+    def __init__(self, retrieval_weight=0.3):
+        self.retrieval_weight = retrieval_weight
+
+    def score(self, query, documents):
+        query_terms = sorted(set(tokenize(query)))
+        if not query_terms or not documents:
+            return np.zeros(len(documents), dtype=np.float32)
+
+        term_index = {term: i for i, term in enumerate(query_terms)}
+        matrix = np.zeros((len(documents), len(query_terms)), dtype=np.float32)
+        for row, doc in enumerate(documents):
+            for token in tokenize(doc.page_content):
+                column = term_index.get(token)
+                if column is not None:
+                    matrix[row, column] += 1
+
+        doc_freq = np.count_nonzero(matrix, axis=0)
+        idf = np.log(1 + (len(documents) + 1) / (doc_freq + 1))
+        # Saturate term frequency so one repeated term cannot dominate
+        coverage = (matrix / (matrix + 1.0)) @ idf / max(float(idf.sum()), 1e-9)
+        return (1 - self.retrieval_weight) * coverage + self.retrieval_weight * _rank_prior(len(documents))
+
+    def rerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        return _top_k(documents, self.score(query, documents), top_k)
+
+    async def arerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        return self.rerank(query, documents, top_k, query_embedding, vector_store)
+
+class EmbeddingSimilarityReranker:
+    """Rerank and filter candidates by cosine similarity between the query and chunk embeddings.
+
+    Chunk embeddings are reconstructed by position from the FAISS index of the vector store the
+    candidates were retrieved from, which is passed with every call so that a reranker shared by
+    two generations never reads one's vectors for the other's results. Chunks the index cannot
+    give back, e.g. IVF indexes without a direct map, are embedded through the embedding model,
+    which normally answers from the on-disk embedding cache because every chunk was embedded at
+    ingestion time.
+    """
+
+    def __init__(self, embeddings, min_similarity=0.0):
+        self.embeddings = embeddings
+        self.min_similarity = min_similarity
+
+    def chunk_vectors(self, documents, vector_store=None):
+        """Return the embeddings of the candidates, reconstructed from the index where possible"""
+        vectors = [None] * len(documents)
+        if vector_store is not None:
+            chunk_ids = [doc.metadata.get("chunk_id") for doc in documents]
+            positions = positions_of(vector_store, [chunk_id for chunk_id in chunk_ids if chunk_id])
+            for i, chunk_id in enumerate(chunk_ids):
+                position = positions.get(chunk_id)
+                if position is not None:
+                    try:
+                        vectors[i] = vector_store.index.reconstruct(position)
+                    except RuntimeError:
+                        pass
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([documents[i].page_content for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        return np.asarray(vectors, dtype=np.float32)
+
+    def score(self, query, documents, query_embedding=None, vector_store=None):
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(query)
+        vectors = self.chunk_vectors(documents, vector_store)
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * max(float(np.linalg.norm(query_vector)), 1e-9)
+        return vectors @ query_vector / np.maximum(norms, 1e-9)
+
+    def rerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        if not documents:
+            return []
+        return _top_k(documents, self.score(query, documents, query_embedding, vector_store), top_k,
+                      self.min_similarity)
+
+    async def arerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        return await asyncio.to_thread(self.rerank, query, documents, top_k, query_embedding, vector_store)
+
+class CrossEncoderReranker:
+    """Rerank candidates with a small CPU cross-encoder (requires sentence-transformers)"""
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=32):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("The cross_encoder reranker requires the sentence-transformers package") from e
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def rerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        if not documents:
+            return []
+        scores = self.model.predict([(query, doc.page_content) for doc in documents], batch_size=self.batch_size)
+        return _top_k(documents, scores, top_k)
+
+    async def arerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        return await asyncio.to_thread(self.rerank, query, documents, top_k, query_embedding, vector_store)
+
+class LLMExtractionReranker:
+    """Extract the relevant part of every candidate with an LLM, calling it for all candidates concurrently.
+
+    Candidates the LLM finds irrelevant are dropped; the rest keep their first-stage order.
+    """
+
+    def __init__(self, llm=None, max_concurrency=8):
+        from langchain.retrievers.document_compressors import LLMChainExtractor
+        from langchain_openai import ChatOpenAI
+
+        self.compressor = LLMChainExtractor.from_llm(llm or ChatOpenAI(temperature=0))
+        self.max_concurrency = max_concurrency
+
+    def rerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        if not documents:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(documents))) as executor:
+            extracted = executor.map(lambda doc: self.compressor.compress_documents([doc], query), documents)
+            return [doc for docs in extracted for doc in docs][:top_k]
+
+    async def arerank(self, query, documents, top_k=5, query_embedding=None, vector_store=None):
+        if not documents:
+            return []
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def extract(doc):
+            async with semaphore:
+                return await self.compressor.acompress_documents([doc], query)
+
+        extracted = await asyncio.gather(*(extract(doc) for doc in documents))
+        return [doc for docs in extracted for doc in docs][:top_k]
+
+def create_reranker(name, embeddings=None, **options):
+    """Create a post-retrieval reranker by name, or return None for "none" """
+    if name not in RERANKER_TYPES:
+        raise ValueError(f"Unknown reranker '{name}', expected one of {RERANKER_TYPES}")
+    if name == "lexical":
+        return LexicalReranker(**options)
+    if name == "embedding":
+        return EmbeddingSimilarityReranker(embeddings, **options)
+    if name == "cross_encoder":
+        return CrossEncoderReranker(**options)
+    if name == "llm":
+        return LLMExtractionReranker(**options)
+    return None
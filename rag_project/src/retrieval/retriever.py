@@ -1,66 +1,539 @@
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import LLMChainExtractor
-from langchain_openai import ChatOpenAI
+from langchain_core.documents import Document
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import hashlib
+import threading
 import time
 import logging
 
+from src.retrieval.bm25 import reciprocal_rank_fusion
+from src.retrieval.cache import TTLCache
+from src.retrieval.filters import SourceBitmap
+from src.retrieval.reranker import LLMExtractionReranker, trim_to_token_budget
+from src.retrieval.index_search import search_vector_store
+from src.embedding.index_factory import make_search_parameters
+from src.document_processing.loader import chunk_id_source
+from src.utils.metrics import span
+
 logger = logging.getLogger("rag-system")
 
+def normalize_query(query):
+    """Normalize query text so trivially different spellings share cache entries"""
+    return " ".join(query.lower().split())
+
+def distinct_queries(queries):
+    """Drop repeated questions (after normalization), keeping the first spelling of each in order"""
+    unique = {}
+    for query in queries:
+        unique.setdefault(normalize_query(query), query)
+    return list(unique.values())
+
+def _scored_copies(docs_and_scores):
+    """Copy search hits with their score in the metadata, leaving the shared docstore documents untouched"""
+    return [
+        Document(page_content=doc.page_content, metadata={**doc.metadata, "score": float(score)})
+        for doc, score in docs_and_scores
+    ]
+
+def _fusion_key(doc):
+    """Identify the same chunk across dense and sparse results"""
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+def _matches_filter(doc, metadata_filter):
+    """Apply a LangChain-style metadata filter (dict of values or lists of values, or a callable) to a hit"""
+    if callable(metadata_filter):
+        return metadata_filter(doc.metadata)
+    if not isinstance(metadata_filter, dict):
+        return True
+    return all(doc.metadata.get(key) in value if isinstance(value, list) else doc.metadata.get(key) == value
+               for key, value in metadata_filter.items())
+
+def _copy_documents(documents):
+    """Give each caller its own Document objects so cached results cannot be mutated across requests"""
+    return [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in documents]
+
 class EnhancedRetriever:
-    def __init__(self, vector_store, use_compression=False):
+    """Retriever that is safe to share across threads and async tasks.
+
+    Search parameters such as top_k are passed per call to the vector store instead of
+    being stored on a shared LangChain retriever, and every call returns its own Document copies.
+    """
+
+    def __init__(self, vector_store, use_compression=False, cache_size=1024, cache_ttl=300,
+                 nprobe=None, ef_search=None, sparse_index=None, dense_weight=1.0, sparse_weight=1.0,
+                 rrf_k=60, hybrid_fetch_k=20, reranker=None, rerank_fetch_k=20, context_token_budget=0):
         self.vector_store = vector_store
-        self.base_retriever = vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
-        )
-        
-        self.use_compression = use_compression
-        if use_compression:
-            # Initialize compression for more relevant results
-            llm = ChatOpenAI(temperature=0)
-            compressor = LLMChainExtractor.from_llm(llm)
-            self.retriever = ContextualCompressionRetriever(
-                base_compressor=compressor,
-                base_retriever=self.base_retriever
+
+        # Optional BM25 index for hybrid retrieval; its results are fused with the dense ones by
+        # weighted reciprocal rank fusion. Weights can be overridden per call via search_kwargs.
+        self.sparse_index = sparse_index
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.rrf_k = rrf_k
+        self.hybrid_fetch_k = hybrid_fetch_k
+        self._sparse_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+        # Allow bitmaps over FAISS positions and BM25 documents. Denied sources (files deleted in the
+        # registry) are excluded inside the index scan; sources/tags in search_kwargs narrow one search.
+        self.denied_sources = set()
+        self.source_tags = {}
+        self._build_bitmaps()
+
+        # Default ANN search effort; individual calls can override it via search_kwargs
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+
+        # Post-retrieval stage: over-fetch rerank_fetch_k candidates, rerank them down to top_k and
+        # trim the result to the context token budget. use_compression keeps the old LLM extraction.
+        if reranker is None and use_compression:
+            reranker = LLMExtractionReranker()
+        self.reranker = reranker
+        self.rerank_fetch_k = rerank_fetch_k
+        self.context_token_budget = context_token_budget
+
+        # Two cache layers: query text -> embedding, (embedding, top_k, index version) -> documents
+        self.index_version = 0
+        self._version_lock = threading.Lock()
+        self.embedding_cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        self.result_cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+
+    def embed_query(self, query):
+        """Return the embedding of a query, reusing the cached one for repeated questions"""
+        key = normalize_query(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding_function = self.vector_store.embedding_function
+            with span("query_embed"):
+                if hasattr(embedding_function, "embed_query"):
+                    embedding = embedding_function.embed_query(query.strip())
+                else:
+                    embedding = embedding_function(query.strip())
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    async def aembed_query(self, query):
+        """Async variant of embed_query that does not block the event loop"""
+        key = normalize_query(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding_function = self.vector_store.embedding_function
+            with span("query_embed"):
+                if hasattr(embedding_function, "aembed_query"):
+                    embedding = await embedding_function.aembed_query(query.strip())
+                else:
+                    embedding = await asyncio.to_thread(embedding_function, query.strip())
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    def embed_queries(self, queries):
+        """Return the embeddings of several queries, embedding all cache misses in one batched call"""
+        keys = [normalize_query(query) for query in queries]
+        embeddings = {key: self.embedding_cache.get(key) for key in keys}
+        missing = {key: query.strip() for key, query in zip(keys, queries) if embeddings[key] is None}
+        if missing:
+            embedding_function = self.vector_store.embedding_function
+            with span("query_embed"):
+                # CachedEmbeddings.embed_queries skips the persistent cache, which is meant for chunks
+                if hasattr(embedding_function, "embed_queries"):
+                    vectors = embedding_function.embed_queries(list(missing.values()))
+                elif hasattr(embedding_function, "embed_documents"):
+                    vectors = embedding_function.embed_documents(list(missing.values()))
+                else:
+                    vectors = [embedding_function(text) for text in missing.values()]
+            for key, vector in zip(missing, vectors):
+                self.embedding_cache.set(key, vector)
+                embeddings[key] = vector
+        return [embeddings[key] for key in keys]
+
+    async def aembed_queries(self, queries):
+        """Async variant of embed_queries"""
+        embedding_function = self.vector_store.embedding_function
+        embed = getattr(embedding_function, "aembed_queries", None) or getattr(embedding_function, "aembed_documents", None)
+        if embed is None:
+            return await asyncio.to_thread(self.embed_queries, queries)
+
+        keys = [normalize_query(query) for query in queries]
+        embeddings = {key: self.embedding_cache.get(key) for key in keys}
+        missing = {key: query.strip() for key, query in zip(keys, queries) if embeddings[key] is None}
+        if missing:
+            with span("query_embed"):
+                vectors = await embed(list(missing.values()))
+            for key, vector in zip(missing, vectors):
+                self.embedding_cache.set(key, vector)
+                embeddings[key] = vector
+        return [embeddings[key] for key in keys]
+
+    def set_vector_store(self, vector_store, sparse_index=None):
+        """Serve searches from an updated vector store (and its BM25 index) and forget results cached for the old one"""
+        self.vector_store = vector_store
+        self.sparse_index = sparse_index
+        self._build_bitmaps()
+        self.invalidate_cache()
+
+    def _build_bitmaps(self):
+        """Index the chunks of the current stores by source and re-apply the denied sources"""
+        self.dense_bitmap = SourceBitmap.from_vector_store(self.vector_store)
+        self.sparse_bitmap = SourceBitmap.from_doc_ids(self.sparse_index.doc_ids) if self.sparse_index is not None else None
+        for bitmap in (self.dense_bitmap, self.sparse_bitmap):
+            if bitmap is not None:
+                bitmap.set_denied(self.denied_sources)
+
+    def set_source_filters(self, denied_sources, source_tags=None):
+        """Exclude the chunks of denied sources from every search and set the tags used for per-query filters.
+
+        Takes effect immediately, without touching the index.
+        """
+        self.denied_sources = set(denied_sources)
+        self.source_tags = {source: set(tags) for source, tags in (source_tags or {}).items()}
+        for bitmap in (self.dense_bitmap, self.sparse_bitmap):
+            if bitmap is not None:
+                bitmap.set_denied(self.denied_sources)
+        self.invalidate_cache()
+
+    def _resolve_sources(self, search_kwargs):
+        """Pop the sources/tags filters off the search kwargs and return the allowed sources (None = all)"""
+        sources = search_kwargs.pop("sources", None)
+        tags = search_kwargs.pop("tags", None)
+        if sources is not None:
+            sources = set(sources)
+        if tags:
+            tagged = {source for source, source_tags in self.source_tags.items() if source_tags & set(tags)}
+            sources = tagged if sources is None else sources & tagged
+        return sources
+
+    def _is_allowed(self, doc, sources):
+        """Check a hit that did not go through a bitmap against the denied and allowed sources"""
+        chunk_id = doc.metadata.get("chunk_id")
+        if not chunk_id:
+            return sources is None
+        source = chunk_id_source(chunk_id)
+        return source not in self.denied_sources and (sources is None or source in sources)
+
+    def close(self):
+        """Stop the BM25 worker threads once the retriever is no longer serving"""
+        self._sparse_executor.shutdown(wait=False)
+
+    def invalidate_cache(self):
+        """Forget cached retrieval results after the underlying index has changed"""
+        with self._version_lock:
+            self.index_version += 1
+            self.result_cache.clear()
+        logger.info(f"Retrieval cache invalidated (index version {self.index_version})")
+
+    def get_cache_stats(self):
+        """Return hit ratios of both cache layers"""
+        return {
+            "index_version": self.index_version,
+            "query_embedding": self.embedding_cache.get_stats(),
+            "retrieval_results": self.result_cache.get_stats()
+        }
+
+    def _result_key(self, embedding, top_k, search_kwargs):
+        """Build the result cache key from the query embedding, search parameters and index version"""
+        digest = hashlib.sha1(array("f", embedding).tobytes()).hexdigest()
+        params = repr(sorted(search_kwargs.items())) if search_kwargs else ""
+        return (digest, top_k, params, self.index_version)
+
+    def search(self, embedding, top_k=5, search_kwargs=None):
+        """Search the vector store with per-call parameters and return scored document copies.
+
+        nprobe (IVF) and ef_search (HNSW) are applied as FAISS search parameters of this call only,
+        together with an IDSelector for denied sources and the sources/tags filters. A metadata filter
+        is applied to the fetch_k (default 20) nearest allowed chunks, like LangChain does. Any other
+        keyword goes through LangChain's similarity search, with k (and fetch_k) scaled up by the
+        fraction of chunks the source filters exclude afterwards.
+        """
+        search_kwargs = dict(search_kwargs or {})
+        nprobe = search_kwargs.pop("nprobe", self.nprobe)
+        ef_search = search_kwargs.pop("ef_search", self.ef_search)
+        sources = self._resolve_sources(search_kwargs)
+
+        with span("vector_search"):
+            if any(key not in ("filter", "fetch_k") for key in search_kwargs):
+                # Denied and unselected chunks are dropped after this search, so fetch more to still fill top_k
+                k = self.dense_bitmap.scaled_k(top_k, sources)
+                if not k:
+                    return []
+                if "fetch_k" in search_kwargs:
+                    search_kwargs["fetch_k"] = max(k, self.dense_bitmap.scaled_k(search_kwargs["fetch_k"], sources))
+                docs_and_scores = self.vector_store.similarity_search_with_score_by_vector(
+                    embedding, k=k, **search_kwargs
+                )
+                docs_and_scores = [(doc, score) for doc, score in docs_and_scores
+                                   if self._is_allowed(doc, sources)][:top_k]
+            else:
+                metadata_filter = search_kwargs.get("filter")
+                fetch_k = max(top_k, search_kwargs.get("fetch_k", 20)) if metadata_filter is not None else top_k
+                # bits backs the selector and stays referenced until the search has finished
+                selector, bits = self.dense_bitmap.selector(sources)
+                search_parameters = make_search_parameters(
+                    self.vector_store.index, nprobe=nprobe, ef_search=ef_search, selector=selector
+                )
+                docs_and_scores = search_vector_store(self.vector_store, embedding, fetch_k, search_parameters)[0]
+                # Deleted and unselected chunks never take up the fetch_k candidates the filter sees
+                docs_and_scores = [(doc, score) for doc, score in docs_and_scores
+                                   if _matches_filter(doc, metadata_filter)][:top_k]
+        return _scored_copies(docs_and_scores)
+
+    def search_batch(self, embeddings, top_k=5, search_kwargs=None):
+        """Search the vector store for several query embeddings with one multi-query FAISS search.
+
+        All queries share the search parameters and source filters. Keywords that need LangChain's
+        similarity search (e.g. a metadata filter) fall back to one search per query.
+        """
+        search_kwargs = dict(search_kwargs or {})
+        if any(key not in ("nprobe", "ef_search", "sources", "tags") for key in search_kwargs):
+            return [self.search(embedding, top_k, search_kwargs) for embedding in embeddings]
+
+        nprobe = search_kwargs.pop("nprobe", self.nprobe)
+        ef_search = search_kwargs.pop("ef_search", self.ef_search)
+        sources = self._resolve_sources(search_kwargs)
+        with span("vector_search"):
+            selector, bits = self.dense_bitmap.selector(sources)
+            search_parameters = make_search_parameters(
+                self.vector_store.index, nprobe=nprobe, ef_search=ef_search, selector=selector
             )
-        else:
-            self.retriever = self.base_retriever
-    
-    def retrieve(self, query, top_k=5):
-        """Retrieve relevant documents for a query with detailed timing"""
+            results = search_vector_store(self.vector_store, embeddings, top_k, search_parameters)
+        return [_scored_copies(hits) for hits in results]
+
+    async def asearch(self, embedding, top_k=5, search_kwargs=None):
+        """Async variant of search; FAISS releases the GIL, so the search runs in a worker thread"""
+        return await asyncio.to_thread(self.search, embedding, top_k, search_kwargs)
+
+    def _hybrid_weights(self, search_kwargs):
+        """Split the fusion weights off the search kwargs; a zero sparse weight means dense-only search"""
+        search_kwargs = dict(search_kwargs or {})
+        dense_weight = search_kwargs.pop("dense_weight", self.dense_weight)
+        sparse_weight = search_kwargs.pop("sparse_weight", self.sparse_weight)
+        if self.sparse_index is None:
+            sparse_weight = 0.0
+        return dense_weight, sparse_weight, search_kwargs
+
+    def sparse_search(self, query, top_k=5, search_kwargs=None):
+        """Return the BM25 hits of a query as Documents from the vector store's docstore"""
+        search_kwargs = dict(search_kwargs or {})
+        sources = self._resolve_sources(search_kwargs)
+        metadata_filter = search_kwargs.get("filter")
+        with span("sparse_search"):
+            hits = self.sparse_index.search(query, top_k, mask=self.sparse_bitmap.mask(sources))
+        documents = []
+        for doc_id, score in hits:
+            doc = self.vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document) and _matches_filter(doc, metadata_filter):
+                documents.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "score": score}))
+        return documents
+
+    def _submit_sparse_search(self, query, top_k, search_kwargs):
+        """Run sparse_search on a BM25 worker thread in a copy of the caller's context, so its span reaches the request timings"""
+        return self._sparse_executor.submit(contextvars.copy_context().run, self.sparse_search, query, top_k,
+                                            search_kwargs)
+
+    def _fuse(self, dense_documents, sparse_documents, dense_weight, sparse_weight, top_k):
+        """Merge dense and sparse hits with weighted reciprocal rank fusion"""
+        by_key = {}
+        for doc in sparse_documents + dense_documents:
+            by_key[_fusion_key(doc)] = doc
+        fused = reciprocal_rank_fusion(
+            [[_fusion_key(doc) for doc in dense_documents], [_fusion_key(doc) for doc in sparse_documents]],
+            [dense_weight, sparse_weight],
+            rrf_k=self.rrf_k
+        )
+        return [
+            Document(page_content=by_key[key].page_content, metadata={**by_key[key].metadata, "score": score})
+            for key, score in fused[:top_k]
+        ]
+
+    def hybrid_search(self, query, embedding, top_k=5, search_kwargs=None):
+        """Run the dense and BM25 searches in parallel and fuse them, or only the dense one without a BM25 index"""
+        dense_weight, sparse_weight, search_kwargs = self._hybrid_weights(search_kwargs)
+        if not sparse_weight:
+            return self.search(embedding, top_k=top_k, search_kwargs=search_kwargs)
+        if not dense_weight:
+            return self.sparse_search(query, top_k, search_kwargs)
+
+        fetch_k = max(top_k, self.hybrid_fetch_k)
+        sparse_future = self._submit_sparse_search(query, fetch_k, search_kwargs)
+        dense_documents = self.search(embedding, top_k=fetch_k, search_kwargs=search_kwargs)
+        return self._fuse(dense_documents, sparse_future.result(), dense_weight, sparse_weight, top_k)
+
+    async def ahybrid_search(self, query, embedding, top_k=5, search_kwargs=None):
+        """Async variant of hybrid_search"""
+        dense_weight, sparse_weight, search_kwargs = self._hybrid_weights(search_kwargs)
+        if not sparse_weight:
+            return await self.asearch(embedding, top_k=top_k, search_kwargs=search_kwargs)
+        if not dense_weight:
+            return await asyncio.to_thread(self.sparse_search, query, top_k, search_kwargs)
+
+        fetch_k = max(top_k, self.hybrid_fetch_k)
+        dense_documents, sparse_documents = await asyncio.gather(
+            self.asearch(embedding, top_k=fetch_k, search_kwargs=search_kwargs),
+            asyncio.to_thread(self.sparse_search, query, fetch_k, search_kwargs)
+        )
+        return self._fuse(dense_documents, sparse_documents, dense_weight, sparse_weight, top_k)
+
+    def hybrid_search_batch(self, queries, embeddings, top_k=5, search_kwargs=None):
+        """Batch variant of hybrid_search: one dense search over all embeddings, BM25 searches in parallel"""
+        dense_weight, sparse_weight, search_kwargs = self._hybrid_weights(search_kwargs)
+        if not sparse_weight:
+            return self.search_batch(embeddings, top_k=top_k, search_kwargs=search_kwargs)
+        if not dense_weight:
+            sparse_futures = [self._submit_sparse_search(query, top_k, search_kwargs) for query in queries]
+            return [future.result() for future in sparse_futures]
+
+        fetch_k = max(top_k, self.hybrid_fetch_k)
+        sparse_futures = [self._submit_sparse_search(query, fetch_k, search_kwargs) for query in queries]
+        dense_results = self.search_batch(embeddings, top_k=fetch_k, search_kwargs=search_kwargs)
+        return [
+            self._fuse(dense_documents, sparse_future.result(), dense_weight, sparse_weight, top_k)
+            for dense_documents, sparse_future in zip(dense_results, sparse_futures)
+        ]
+
+    def _fetch_k(self, top_k):
+        """Number of first-stage candidates to fetch for the reranker.
+
+        The LLM extractor keeps the first-stage order and makes one LLM call per candidate, so
+        over-fetching for it would only multiply the calls; it gets top_k candidates.
+        """
+        if self.reranker is None or isinstance(self.reranker, LLMExtractionReranker):
+            return top_k
+        return max(top_k, self.rerank_fetch_k)
+
+    def rerank(self, query, candidates, top_k=5, query_embedding=None):
+        """Rerank first-stage candidates down to top_k and apply the context token budget"""
+        with span("rerank"):
+            if self.reranker is not None:
+                candidates = self.reranker.rerank(query, candidates, top_k, query_embedding, self.vector_store)
+            return trim_to_token_budget(candidates[:top_k], self.context_token_budget)
+
+    async def arerank(self, query, candidates, top_k=5, query_embedding=None):
+        """Async variant of rerank"""
+        with span("rerank"):
+            if self.reranker is not None:
+                candidates = await self.reranker.arerank(query, candidates, top_k, query_embedding,
+                                                         self.vector_store)
+            return trim_to_token_budget(candidates[:top_k], self.context_token_budget)
+
+    def retrieve(self, query, top_k=5, search_kwargs=None):
+        """Retrieve relevant documents for a query with detailed timing.
+
+        search_kwargs tune this call only: nprobe/ef_search for ANN indexes, dense_weight/sparse_weight
+        for hybrid fusion, or vector store arguments such as filter and fetch_k.
+        """
         logger.info(f"Starting retrieval for query: '{query}' with top_k={top_k}")
-        
-        # Modify search kwargs for this specific call
-        if hasattr(self.base_retriever, "search_kwargs"):
-            original_k = self.base_retriever.search_kwargs.get("k", 5)
-            self.base_retriever.search_kwargs["k"] = top_k
-        
+
         # Time the embedding of the query
         embedding_start = time.time()
-        # We don't have direct access to the embedding step, so this is an approximation
-        
+        embedding = self.embed_query(query)
+        result_key = self._result_key(embedding, top_k, search_kwargs)
+
+        cached_documents = self.result_cache.get(result_key)
+        if cached_documents is not None:
+            logger.info(f"Retrieval cache hit, returning {len(cached_documents)} documents")
+            return _copy_documents(cached_documents)
+
         # Time the actual retrieval
         retrieval_start = time.time()
-        if self.use_compression:
-            # Using enhanced retrieval with compression
-            documents = self.retriever.invoke(query)
-        else:
-            # Using basic vector similarity
-            documents = self.base_retriever.invoke(query)
+        candidates = self.hybrid_search(query, embedding, top_k=self._fetch_k(top_k), search_kwargs=search_kwargs)
+        rerank_start = time.time()
+        documents = self.rerank(query, candidates, top_k, embedding)
         retrieval_end = time.time()
-        
-        # Reset search_kwargs if we modified it
-        if hasattr(self.base_retriever, "search_kwargs"):
-            self.base_retriever.search_kwargs["k"] = original_k
-        
+
+        self.result_cache.set(result_key, documents)
+
         # Log timing information
         embedding_time = retrieval_start - embedding_start
-        retrieval_time = retrieval_end - retrieval_start
-        total_time = retrieval_end - embedding_start
-        
+        search_time = rerank_start - retrieval_start
+        rerank_time = retrieval_end - rerank_start
+        total_time = max(retrieval_end - embedding_start, 1e-9)
+
         logger.info(f"Retrieval timing details:")
-        logger.info(f"  Preparation: {embedding_time:.2f}s ({(embedding_time/total_time)*100:.1f}% of retrieval)")
-        logger.info(f"  Vector search: {retrieval_time:.2f}s ({(retrieval_time/total_time)*100:.1f}% of retrieval)")
+        logger.info(f"  Query embedding: {embedding_time:.2f}s ({(embedding_time/total_time)*100:.1f}% of retrieval)")
+        logger.info(f"  Vector search: {search_time:.2f}s ({(search_time/total_time)*100:.1f}% of retrieval)")
+        logger.info(f"  Reranking {len(candidates)} candidates: {rerank_time:.2f}s ({(rerank_time/total_time)*100:.1f}% of retrieval)")
         logger.info(f"  Retrieved {len(documents)} documents in {total_time:.2f}s total")
-        
-        return documents
\ No newline at end of file
+
+        return _copy_documents(documents)
+
+    async def aretrieve(self, query, top_k=5, search_kwargs=None):
+        """Async variant of retrieve that awaits the embedding, search and reranking calls"""
+        logger.info(f"Starting async retrieval for query: '{query}' with top_k={top_k}")
+
+        start = time.time()
+        embedding = await self.aembed_query(query)
+        result_key = self._result_key(embedding, top_k, search_kwargs)
+
+        cached_documents = self.result_cache.get(result_key)
+        if cached_documents is not None:
+            logger.info(f"Retrieval cache hit, returning {len(cached_documents)} documents")
+            return _copy_documents(cached_documents)
+
+        candidates = await self.ahybrid_search(query, embedding, top_k=self._fetch_k(top_k), search_kwargs=search_kwargs)
+        documents = await self.arerank(query, candidates, top_k, embedding)
+
+        self.result_cache.set(result_key, documents)
+        logger.info(f"Retrieved {len(documents)} documents in {time.time() - start:.2f}s total")
+
+        return _copy_documents(documents)
+
+    def _pending_batch(self, queries, embeddings, top_k, search_kwargs):
+        """Split deduplicated queries into cached results and (query, embedding, cache key) still to search"""
+        results, pending = {}, []
+        for query, embedding in zip(queries, embeddings):
+            result_key = self._result_key(embedding, top_k, search_kwargs)
+            cached_documents = self.result_cache.get(result_key)
+            if cached_documents is not None:
+                results[normalize_query(query)] = cached_documents
+            else:
+                pending.append((query, embedding, result_key))
+        return results, pending
+
+    def retrieve_batch(self, queries, top_k=5, search_kwargs=None):
+        """Retrieve documents for several queries with one embedding call and one multi-query index search.
+
+        Repeated queries are retrieved once. Returns one document list per query, in query order.
+        """
+        unique = distinct_queries(queries)
+        start = time.time()
+        embeddings = self.embed_queries(unique)
+        results, pending = self._pending_batch(unique, embeddings, top_k, search_kwargs)
+
+        if pending:
+            candidates = self.hybrid_search_batch(
+                [query for query, _, _ in pending], [embedding for _, embedding, _ in pending],
+                top_k=self._fetch_k(top_k), search_kwargs=search_kwargs
+            )
+            for (query, embedding, result_key), docs in zip(pending, candidates):
+                documents = self.rerank(query, docs, top_k, embedding)
+                self.result_cache.set(result_key, documents)
+                results[normalize_query(query)] = documents
+
+        logger.info(f"Retrieved documents for {len(queries)} queries ({len(unique)} distinct, "
+                    f"{len(unique) - len(pending)} cached) in {time.time() - start:.2f}s")
+        return [_copy_documents(results[normalize_query(query)]) for query in queries]
+
+    async def aretrieve_batch(self, queries, top_k=5, search_kwargs=None):
+        """Async variant of retrieve_batch"""
+        unique = distinct_queries(queries)
+        start = time.time()
+        embeddings = await self.aembed_queries(unique)
+        results, pending = self._pending_batch(unique, embeddings, top_k, search_kwargs)
+
+        if pending:
+            candidates = await asyncio.to_thread(
+                self.hybrid_search_batch,
+                [query for query, _, _ in pending], [embedding for _, embedding, _ in pending],
+                self._fetch_k(top_k), search_kwargs
+            )
+            reranked = await asyncio.gather(*[
+                self.arerank(query, docs, top_k, embedding)
+                for (query, embedding, _), docs in zip(pending, candidates)
+            ])
+            for (query, _, result_key), documents in zip(pending, reranked):
+                self.result_cache.set(result_key, documents)
+                results[normalize_query(query)] = documents
+
+        logger.info(f"Retrieved documents for {len(queries)} queries ({len(unique)} distinct, "
+                    f"{len(unique) - len(pending)} cached) in {time.time() - start:.2f}s")
+        return [_copy_documents(results[normalize_query(query)]) for query in queries]
@@ -18,12 +18,84 @@ class Settings(BaseSettings):
     TEMPERATURE: float = 0.1
     MAX_TOKENS: int = 1000
     
+    # Ingestion settings
+    INGEST_WORKERS: int = 1
+    STREAMING_INGEST: bool = False
+    INGEST_BATCH_SIZE: int = 64
+    REBUILD_IN_SUBPROCESS: bool = False
+    
+    # Embedding settings
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./data/embedding_cache.sqlite"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 500000
+    EMBEDDING_BATCH_MAX_TOKENS: int = 50000
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_MAX_RETRIES: int = 6
+    
+    # Vector store settings
+    VECTOR_STORE_FORMAT: str = "langchain"
+    VECTOR_STORE_MMAP: bool = True
+    VECTOR_INDEX_TYPE: str = "flat"
+    IVF_NLIST: int = 0
+    PQ_M: int = 16
+    HNSW_M: int = 32
+    SEARCH_NPROBE: int = 16
+    SEARCH_EF: int = 64
+    # VECTOR_QUANTIZATION: none, int8 or binary codes for the first-pass search of flat indexes, re-scored
+    # against memory-mapped float vectors. QUANTIZATION_RESCORE_FACTOR=0 uses the factor recorded in the store.
+    VECTOR_QUANTIZATION: str = "none"
+    QUANTIZATION_RESCORE_FACTOR: int = 0
+    
     # Retrieval settings
-    USE_COMPRESSION: bool = True
+    # RERANKER: none, lexical, embedding, cross_encoder or llm (per-chunk LLM extraction).
+    # USE_COMPRESSION=True is the legacy switch for the llm reranker.
+    USE_COMPRESSION: bool = False
+    RERANKER: str = "lexical"
+    RERANK_FETCH_K: int = 20
+    CONTEXT_TOKEN_BUDGET: int = 0
     RETRIEVAL_TOP_K: int = 5
+    QUERY_CACHE_SIZE: int = 1024
+    QUERY_CACHE_TTL_SECONDS: int = 300
+    HYBRID_SEARCH: bool = False
+    HYBRID_DENSE_WEIGHT: float = 1.0
+    HYBRID_SPARSE_WEIGHT: float = 1.0
+    HYBRID_RRF_K: int = 60
+    HYBRID_FETCH_K: int = 20
+    
+    # Context packing settings
+    # The prompt must fit in CONTEXT_WINDOW_TOKENS with MAX_TOKENS left for the answer. Retrieved chunks
+    # are merged with their neighbours, deduplicated and packed into the rest (CONTEXT_PACKING=False
+    # passes them verbatim); CONTEXT_MMR_LAMBDA < 1 reorders the passages for diversity.
+    CONTEXT_PACKING: bool = True
+    CONTEXT_WINDOW_TOKENS: int = 4096
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.8
+    CONTEXT_MMR_LAMBDA: float = 1.0
+    
+    # Document watcher settings
+    # WATCH_DOCUMENTS ingests changes in the data directory automatically (inotify, or polling without inotify_simple)
+    # With IVF/HNSW indexes every ingested batch is a full rebuild, so raise WATCH_MAX_DELAY_SECONDS for those
+    WATCH_DOCUMENTS: bool = False
+    WATCH_DEBOUNCE_SECONDS: float = 2.0
+    WATCH_MAX_DELAY_SECONDS: float = 30.0
+    WATCH_POLL_INTERVAL_SECONDS: float = 5.0
+    WATCH_QUEUE_SIZE: int = 2
+    
+    # Answer cache settings
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    
+    # Concurrency settings
+    MAX_CONCURRENT_UPSTREAM_CALLS: int = 16
+    QUERY_TIMEOUT_SECONDS: float = 60.0
+    BATCH_MAX_QUERIES: int = 256
+    BATCH_GENERATION_CONCURRENCY: int = 8
     
     # Application settings
     LOG_LEVEL: str = "INFO"
+    # Export stage spans through OpenTelemetry (needs opentelemetry-api and a configured SDK)
+    OTEL_TRACING: bool = False
     
     class Config:
         env_file = "config/production.env"
@@ -0,0 +1,236 @@
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import threading
+import time
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# Fine log-spaced buckets (4 per doubling) from 50us to ~200s; every 4th bound is exported to Prometheus
+BUCKET_BASE = 50e-6
+BUCKETS_PER_DOUBLING = 4
+BUCKET_BOUNDS = tuple(BUCKET_BASE * 2 ** (i / BUCKETS_PER_DOUBLING) for i in range(22 * BUCKETS_PER_DOUBLING + 1))
+EXPORTED_BOUNDS = BUCKET_BOUNDS[::BUCKETS_PER_DOUBLING]
+
+# Stage durations of the request being handled, for the Server-Timing header
+_request_stages = ContextVar("request_stages", default=None)
+
+class LatencyHistogram:
+    """Fixed-memory latency histogram with log-spaced buckets.
+
+    Percentiles are interpolated inside the bucket they fall into, which bounds their relative
+    error by the bucket width (about 19%) no matter how many values were recorded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = bisect_left(BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.count, self.sum, self.max
+
+    @staticmethod
+    def _percentile(counts, count, maximum, q):
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = BUCKET_BOUNDS[index - 1] if index > 0 else 0.0
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else maximum
+                value = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(value, maximum)
+            cumulative += bucket_count
+        return maximum
+
+    def summary(self):
+        """Return count, mean, max and p50/p95/p99 in seconds"""
+        counts, count, total, maximum = self.snapshot()
+        if not count:
+            return {"count": 0}
+        return {
+            "count": count,
+            "mean": total / count,
+            "p50": self._percentile(counts, count, maximum, 0.50),
+            "p95": self._percentile(counts, count, maximum, 0.95),
+            "p99": self._percentile(counts, count, maximum, 0.99),
+            "max": maximum
+        }
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in labels) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Process-wide stage latencies, counters and a bounded log of recent queries.
+
+    span(stage) times a block of the hot path into that stage's histogram (and an OpenTelemetry
+    span when tracing is enabled); recording costs a couple of microseconds and memory never grows
+    with the number of requests.
+    """
+
+    def __init__(self, recent_queries=10):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.recent_queries = deque(maxlen=recent_queries)
+        self.started_at = time.time()
+        self._otel_tracer = None
+
+    def enable_tracing(self):
+        """Also emit every stage as an OpenTelemetry span; returns False if opentelemetry is not installed.
+
+        Spans go to whichever tracer provider and exporter the OpenTelemetry SDK was configured with.
+        """
+        if otel_trace is None:
+            return False
+        self._otel_tracer = otel_trace.get_tracer("rag-system")
+        return True
+
+    def histogram(self, stage):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        """Record the duration of one stage"""
+        self.histogram(stage).observe(seconds)
+        request_stages = _request_stages.get()
+        if request_stages is not None:
+            request_stages[stage] = request_stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage):
+        """Time a block as one execution of a stage"""
+        if self._otel_tracer is not None:
+            with self._otel_tracer.start_as_current_span(stage):
+                start = time.perf_counter()
+                try:
+                    yield
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, amount=1, **labels):
+        """Increment a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def track_query(self, query, latency, num_chunks_retrieved, cached=False):
+        """Record one answered query: its end-to-end latency, counters and the recent-queries log"""
+        self.observe("query", latency)
+        self.inc("rag_queries_total", cached=str(bool(cached)).lower())
+        self.inc("rag_chunks_retrieved_total", num_chunks_retrieved)
+        with self._lock:
+            self.recent_queries.append({
+                "query": query[:200],
+                "latency": latency,
+                "chunks_retrieved": num_chunks_retrieved,
+                "timestamp": datetime.now().isoformat()
+            })
+
+    def get_metrics(self):
+        """Return a JSON summary: query totals, recent queries, stage percentiles and counters"""
+        query_summary = self.histogram("query").summary()
+        with self._lock:
+            recent = list(self.recent_queries)
+            counters = {name + _format_labels(labels): value for (name, labels), value in self.counters.items()}
+        return {
+            "total_queries": query_summary["count"],
+            "avg_latency_seconds": query_summary.get("mean", 0),
+            "recent_queries": recent,
+            "stages": {stage: histogram.summary() for stage, histogram in sorted(self.stages.items())},
+            "counters": counters,
+            "uptime_seconds": time.time() - self.started_at
+        }
+
+    def render_prometheus(self, gauges=None):
+        """Render histograms, counters and the given gauges in the Prometheus text format.
+
+        gauges maps a metric name to a list of (labels dict, value) pairs.
+        """
+        lines = [
+            "# HELP rag_stage_duration_seconds Duration of request stages",
+            "# TYPE rag_stage_duration_seconds histogram"
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            counts, count, total, _ = histogram.snapshot()
+            cumulative, index = 0, 0
+            for bound in EXPORTED_BOUNDS:
+                # Exported bounds are a subset of the internal ones, so cumulative counts stay exact
+                while index < len(BUCKET_BOUNDS) and BUCKET_BOUNDS[index] <= bound:
+                    cumulative += counts[index]
+                    index += 1
+                lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {total!r}')
+            lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, samples in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+
+        lines.append("# TYPE rag_uptime_seconds gauge")
+        lines.append(f"rag_uptime_seconds {time.time() - self.started_at!r}")
+        return "\n".join(lines) + "\n"
+
+@contextmanager
+def request_timings():
+    """Collect the stage durations recorded while handling one request"""
+    stages = {}
+    token = _request_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _request_stages.reset(token)
+
+def current_request_timings():
+    """Return the stage durations of the request being handled, or None outside of one"""
+    return _request_stages.get()
+
+def format_server_timing(stages):
+    """Format stage durations as a Server-Timing header value (milliseconds)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages.items())
+
+# Shared by the retriever, generator and API
+metrics = MetricsRegistry()
+span = metrics.span
@@ -0,0 +1,35 @@
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+@lru_cache(maxsize=16)
+def get_encoding(model_name="text-embedding-ada-002"):
+    """Return the (cached) tiktoken encoding for a model, or None if tiktoken is unavailable"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text, model_name="text-embedding-ada-002"):
+    """Count the tokens of a text, estimating 4 characters per token without tiktoken"""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text, max_tokens, model_name="text-embedding-ada-002"):
+    """Cut a text to its first max_tokens tokens, estimating 4 characters per token without tiktoken"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,21 @@
+from src.generation.context_packing import join_overlapping
+
+def test_join_overlapping_removes_the_splitter_overlap():
+    first = "The quarterly budget was approved by the finance committee"
+    second = "approved by the finance committee after a long review."
+    assert join_overlapping(first, second) == ("The quarterly budget was approved by the finance committee "
+                                               "after a long review.")
+
+def test_join_overlapping_keeps_non_overlapping_neighbours_intact():
+    assert join_overlapping("The results are shown in the", "end of the report.") == \
+        "The results are shown in the\nend of the report."
+    assert join_overlapping("Error code E-1042 means", "shutdown is required.") == \
+        "Error code E-1042 means\nshutdown is required."
+
+def test_join_overlapping_ignores_matches_inside_words():
+    first = "the component restarts after a configuration reload"
+    second = "nfiguration reload completes and the service resumes"
+    assert join_overlapping(first, second) == first + "\n" + second
+
+def test_join_overlapping_drops_a_contained_chunk():
+    assert join_overlapping("alpha beta gamma delta", "beta gamma") == "alpha beta gamma delta"